@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+原子写文件：先写入同目录下的临时文件，校验通过后再重命名到目标路径
+"""
+
+import os
+import tempfile
+
+
+CHUNK_SIZE = 64 * 1024
+
+# mkstemp 创建的文件权限为 0600，重命名前恢复为按 umask 创建普通文件时的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+# 常见图片格式的文件头
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+class IntegrityError(Exception):
+    """写入的数据不完整或不是有效的图片"""
+
+
+def detect_image_type(header):
+    """
+    根据文件头判断图片类型
+
+    Args:
+        header: 文件开头的若干字节（至少12字节）
+
+    Returns:
+        MIME类型字符串，无法识别返回None
+    """
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return None
+
+
+def atomic_write_chunks(chunks, dest_path, expected_size=None, verify_image=True):
+    """
+    流式写入数据块并原子地重命名到目标路径
+
+    任一环节失败时临时文件会被删除，目标路径上不会留下不完整的文件。
+
+    Args:
+        chunks: 可迭代的 bytes 数据块
+        dest_path: 目标文件路径
+        expected_size: 期望的总字节数（如 Content-Length），None 表示不校验
+        verify_image: 是否校验图片文件头
+
+    Returns:
+        写入的字节数
+
+    Raises:
+        IntegrityError: 字节数不符或文件头无法识别
+    """
+    dest_dir = os.path.dirname(dest_path) or "."
+    fd, tmp_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(dest_path) + ".", suffix=".part", dir=dest_dir
+    )
+    written = 0
+    header = b""
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if len(header) < 16:
+                    header += chunk[:16 - len(header)]
+                f.write(chunk)
+                written += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, FILE_MODE)
+
+        if expected_size is not None and written != expected_size:
+            raise IntegrityError(f"字节数不符: 期望 {expected_size}，实际 {written}")
+        if verify_image and detect_image_type(header) is None:
+            raise IntegrityError("无法识别的图片文件头")
+
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """按块读取文件"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def atomic_copy(src_path, dest_path, verify_image=False):
+    """
+    原子地复制文件
+
+    Args:
+        src_path: 源文件路径
+        dest_path: 目标文件路径
+        verify_image: 是否校验图片文件头
+
+    Returns:
+        复制的字节数
+    """
+    return atomic_write_chunks(
+        iter_file_chunks(src_path), dest_path,
+        expected_size=os.path.getsize(src_path), verify_image=verify_image
+    )
+
+
+def atomic_write_text(path, text, encoding="utf-8"):
+    """原子地写入文本文件"""
+    return atomic_write_chunks([text.encode(encoding)], path, verify_image=False)
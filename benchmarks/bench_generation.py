@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+生成流程基准测试：对本地模拟API跑一批卡片，统计吞吐量和单卡延迟分位数
+
+示例:
+    python3 benchmarks/bench_generation.py --cards 50 --workers 8 --rps 10 --latency-mean 1.5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_images import ImageGenerator
+from mock_api_server import MockAPIServer, add_settings_arguments, settings_from_args
+
+
+def percentile(values, p):
+    """最近秩法计算分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class TimedGenerator(ImageGenerator):
+    """记录每张卡片 generate_image 耗时的生成器"""
+
+    def __init__(self, config_file):
+        super().__init__(config_file)
+        self.latencies = []
+        self.latencies_lock = threading.Lock()
+
+    def generate_image(self, prompt, filename_prefix="card", index=0, card_metrics=None):
+        started = time.perf_counter()
+        result = super().generate_image(prompt, filename_prefix, index, card_metrics)
+        with self.latencies_lock:
+            self.latencies.append(time.perf_counter() - started)
+        return result
+
+
+def run_benchmark(cards, settings, workers, rps, config_overrides=None, verbose=False):
+    """
+    启动模拟API并生成一批卡片
+
+    Args:
+        cards: 卡片数量
+        settings: MockSettings
+        workers: 初始并发请求数（关闭自适应时即固定并发数）
+        rps: 每秒最多发起的请求数
+        config_overrides: 额外覆盖的配置项
+        verbose: 是否显示生成器的输出
+
+    Returns:
+        结果字典
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir, MockAPIServer(settings, seed=0) as server:
+        config = {
+            "api_key": "bench",
+            "api_url": server.url,
+            "output_dir": os.path.join(tmp_dir, "images"),
+            "manifest_file": os.path.join(tmp_dir, "manifest.sqlite3"),
+            "metrics": {"file": os.path.join(tmp_dir, "metrics.jsonl")},
+            "max_workers": workers,
+            "requests_per_second": rps,
+            "cache": {"enabled": False},
+            "http": {"backoff_factor": 0.1}
+        }
+        config.update(config_overrides or {})
+        config_file = os.path.join(tmp_dir, "config.json")
+        with open(config_file, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+
+        prompts = [f"benchmark card {i}" for i in range(cards)]
+        generator = TimedGenerator(config_file)
+        output = None if verbose else io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            results = generator.generate_batch(prompts, filename_prefix="bench")
+        elapsed = time.perf_counter() - started
+        generator.close()
+
+        return {
+            "cards": cards,
+            "succeeded": len(results),
+            "elapsed": elapsed,
+            "throughput": len(results) / elapsed if elapsed else 0.0,
+            "p50": percentile(generator.latencies, 50),
+            "p95": percentile(generator.latencies, 95),
+            "p99": percentile(generator.latencies, 99),
+            "server": dict(server.stats)
+        }
+
+
+def print_result(result):
+    """输出一次基准测试的结果"""
+    print(f"卡片: {result['succeeded']}/{result['cards']} 成功，总耗时 {result['elapsed']:.2f} 秒")
+    print(f"吞吐量: {result['throughput']:.2f} 张/秒")
+    print(f"单卡延迟: p50 {result['p50']:.3f}s  p95 {result['p95']:.3f}s  p99 {result['p99']:.3f}s")
+    print(f"模拟API: {result['server']}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="ImageGenerator 批量生成基准测试")
+    parser.add_argument("--cards", type=int, default=50, help="卡片数量")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="要测试的并发数")
+    parser.add_argument("--rps", type=float, default=0, help="每秒最多发起的请求数，0 表示不限速")
+    parser.add_argument("--fixed", action="store_true", help="关闭自适应并发，固定使用 --workers 个并发")
+    parser.add_argument("--hedge", type=float, metavar="PERCENTILE",
+                        help="启用对冲请求，超过该延迟分位数时再发一个请求（如 90）")
+    parser.add_argument("--hedge-budget", type=float, default=0.1, help="对冲请求占普通请求的比例上限")
+    parser.add_argument("--verbose", action="store_true", help="显示生成器输出")
+    add_settings_arguments(parser)
+    parser.set_defaults(latency_mean=0.5)
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    for workers in args.workers:
+        print("=" * 60)
+        print(f"并发数 {workers}")
+        print("=" * 60)
+        overrides = {"rate_control": {"adaptive": not args.fixed}}
+        if args.hedge:
+            overrides["hedging"] = {"enabled": True, "percentile": args.hedge, "min_delay": 0.0,
+                                    "budget": args.hedge_budget}
+        print_result(run_benchmark(args.cards, settings, workers, args.rps,
+                                   config_overrides=overrides, verbose=args.verbose))
+        print()
+
+
+if __name__ == "__main__":
+    main()
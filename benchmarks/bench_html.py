@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+HTML生成基准测试：在合成的 10/100/1000 张卡片的卡组上测量
+update_html 和 update_html_with_base64 的耗时
+
+示例:
+    python3 benchmarks/bench_html.py --sizes 10 100 1000 --image-kb 100
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from convert_to_base64 import update_html_with_base64
+from mock_api_server import make_png
+from update_html import update_html
+
+
+def make_deck(directory, cards, image_bytes):
+    """
+    在目录中生成合成卡组：deck.json、image_list.json 和对应的图片
+
+    不同卡片共用同一份图片内容，但各自是独立的文件。
+    """
+    images_dir = os.path.join(directory, "images")
+    os.makedirs(images_dir)
+    image = make_png(image_bytes)
+    image_paths = []
+    deck_cards = []
+    for i in range(cards):
+        path = os.path.join(images_dir, f"card_{i:04d}.png")
+        with open(path, "wb") as f:
+            f.write(image)
+        image_paths.append(path)
+        deck_cards.append({
+            "title": f"第 {i + 1} 张卡片",
+            "caption": "用于基准测试的合成说明文字。" * 3,
+            "layout": "c" if i == 0 else "ab"[(i - 1) % 2],
+            "prompt": f"benchmark card {i}"
+        })
+
+    deck_file = os.path.join(directory, "deck.json")
+    with open(deck_file, "w", encoding="utf-8") as f:
+        json.dump({"title": "基准测试", "cards": deck_cards}, f, ensure_ascii=False)
+    image_list_file = os.path.join(directory, "image_list.json")
+    with open(image_list_file, "w", encoding="utf-8") as f:
+        json.dump(image_paths, f)
+    return deck_file, image_list_file
+
+
+def measure(func, repeat):
+    """多次运行并返回每次的耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="update_html / update_html_with_base64 基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="卡组大小")
+    parser.add_argument("--image-kb", type=int, default=100, help="每张合成图片的大小（KB）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--workers", type=int, default=0, help="base64 并行编码的进程数")
+    args = parser.parse_args()
+
+    template_file = os.path.join(ROOT, "templates", "visual-story.html")
+
+    print(f"{'卡片数':>8} {'update_html':>16} {'base64':>16} {'base64大小':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck_file, image_list_file = make_deck(tmp_dir, size, args.image_kb * 1024)
+            html_file = os.path.join(tmp_dir, "visual-story.html")
+            derivatives_file = os.path.join(tmp_dir, "derivatives.json")
+
+            render_timings = measure(lambda: update_html(
+                html_file, image_list_file, derivatives_file=derivatives_file,
+                deck_file=deck_file, template_file=template_file
+            ), args.repeat)
+            base64_timings = measure(lambda: update_html_with_base64(
+                html_file, image_list_file, workers=args.workers, derivatives_file=derivatives_file
+            ), args.repeat)
+            output_size = os.path.getsize(html_file.replace(".html", "_base64.html"))
+
+            print(f"{size:>8} {statistics.median(render_timings) * 1000:>13.1f} ms "
+                  f"{statistics.median(base64_timings) * 1000:>13.1f} ms "
+                  f"{output_size / 1024 / 1024:>9.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
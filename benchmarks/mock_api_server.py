@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+本地模拟的图片生成API，用于压测和基准测试
+
+POST /            返回 {"data": [{"url": "http://host:port/images/<id>.png"}]}
+                  请求带 "response_format": "b64_json" 时返回 {"data": [{"b64_json": ...}]}
+                  请求体为 Gemini 格式（含 "contents"）时返回 inlineData 图片
+GET  /images/<id> 返回指定大小的PNG图片
+
+可配置延迟分布、错误率、429限流比例和图片大小。
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import math
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def png_chunk(chunk_type, data):
+    """构造一个PNG数据块"""
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+
+def make_png(size_bytes, width=64, height=64):
+    """
+    生成一张合法的PNG，并用私有辅助数据块填充到指定大小
+
+    Args:
+        size_bytes: 目标文件大小（字节）
+        width: 图片宽度
+        height: 图片高度
+
+    Returns:
+        PNG 字节
+    """
+    header = b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    row = b"\x00" + bytes((x * 4) % 256 for x in range(width * 3))
+    raw = row * height
+    body = png_chunk(b"IDAT", zlib.compress(raw))
+    end = png_chunk(b"IEND", b"")
+    padding = size_bytes - len(header) - len(body) - len(end) - 12
+    if padding > 0:
+        body += png_chunk(b"mkPd", b"\x00" * padding)
+    return header + body + end
+
+
+class MockSettings:
+    """模拟API的行为参数"""
+
+    def __init__(self, latency="lognormal", latency_mean=2.0, latency_sigma=0.5,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1, image_bytes=800 * 1024,
+                 download_latency=0.05):
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.image_bytes = image_bytes
+        self.download_latency = download_latency
+
+    def sample_latency(self, rng):
+        """按配置的分布采样一次生成延迟（秒）"""
+        if self.latency == "fixed":
+            return self.latency_mean
+        if self.latency == "uniform":
+            return rng.uniform(0, 2 * self.latency_mean)
+        # 对数正态分布，均值为 latency_mean，长尾由 sigma 控制
+        mu = math.log(self.latency_mean) - self.latency_sigma ** 2 / 2
+        return rng.lognormvariate(mu, self.latency_sigma)
+
+
+class MockAPIServer:
+    """
+    在后台线程中运行的模拟API服务器
+
+    用法:
+        with MockAPIServer(MockSettings(latency_mean=0.5)) as server:
+            config["api_url"] = server.url
+    """
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0, seed=None):
+        self.settings = settings or MockSettings()
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.image = make_png(self.settings.image_bytes)
+        self.image_b64 = base64.b64encode(self.image).decode("ascii")
+        self.counter = itertools.count()
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "downloads": 0}
+        self.stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server.count("requests")
+                with server.rng_lock:
+                    roll = server.rng.random()
+                    latency = server.settings.sample_latency(server.rng)
+                settings = server.settings
+
+                if roll < settings.throttle_rate:
+                    server.count("throttled")
+                    self.send_body(429, b'{"error": "rate limited"}',
+                                   headers={"Retry-After": str(settings.retry_after)})
+                    return
+
+                time.sleep(latency)
+                if roll < settings.throttle_rate + settings.error_rate:
+                    server.count("errors")
+                    self.send_body(500, b'{"error": "internal error"}')
+                    return
+
+                image_id = next(server.counter)
+                if "contents" in request:
+                    count = int(request.get("generationConfig", {}).get("candidateCount", 1))
+                    part = {"inlineData": {"mimeType": "image/png", "data": server.image_b64}}
+                    result = {"candidates": [{"content": {"parts": [part]}} for _ in range(count)]}
+                elif request.get("response_format") == "b64_json":
+                    count = int(request.get("n", 1))
+                    result = {"data": [{"b64_json": server.image_b64} for _ in range(count)]}
+                else:
+                    count = int(request.get("n", 1))
+                    host, port = server.httpd.server_address[:2]
+                    result = {"data": [{"url": f"http://{host}:{port}/images/{image_id}_{k}.png"}
+                                       for k in range(count)]}
+                self.send_body(200, json.dumps(result).encode("utf-8"))
+
+            def do_GET(self):
+                if not self.path.startswith("/images/"):
+                    self.send_body(404, b'{"error": "not found"}')
+                    return
+                server.count("downloads")
+                time.sleep(server.settings.download_latency)
+                self.send_body(200, server.image, content_type="image/png")
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def add_settings_arguments(parser):
+    """向命令行解析器添加模拟API的参数"""
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="生成延迟分布")
+    parser.add_argument("--latency-mean", type=float, default=2.0, help="平均生成延迟（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布的 sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="429响应的 Retry-After（秒）")
+    parser.add_argument("--image-kb", type=int, default=800, help="返回图片的大小（KB）")
+
+
+def settings_from_args(args):
+    """根据命令行参数构造 MockSettings"""
+    return MockSettings(args.latency, args.latency_mean, args.latency_sigma, args.error_rate,
+                        args.throttle_rate, args.retry_after, args.image_kb * 1024)
+
+
+def main():
+    """主函数：单独运行模拟API"""
+    parser = argparse.ArgumentParser(description="本地模拟图片生成API")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockAPIServer(settings_from_args(args), port=args.port)
+    print(f"模拟API已启动: {server.url}（Ctrl+C 退出）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+增量构建：只重新生成、编码或渲染输入发生变化的卡片
+
+记录每张卡片的提示词、图片、派生图片和渲染片段的内容哈希，
+未变化的卡片直接复用上一次的结果。修改一条说明文字不会调用API，
+也不会重新编码任何图片。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from atomic_io import atomic_write_text, iter_file_chunks
+from convert_to_base64 import encoded_cache_path, update_html_with_base64
+from job_manifest import JobManifest
+from page_shell import get_shell_config
+from optimize_images import Image, get_optimize_config, load_derivatives, optimize_images, pick_derivative
+from prompt_cache import make_cache_key
+from render_deck import load_deck, render_card, render_html
+
+
+BUILD_DIR = ".build"
+
+
+def hash_file(path):
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    for chunk in iter_file_chunks(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_json(value):
+    """计算可JSON序列化对象的 sha256"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_config(config_file):
+    """读取配置文件，不存在时返回空字典"""
+    if not os.path.exists(config_file):
+        return {}
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class BuildState:
+    """
+    构建状态（.build/state.json）
+
+    images:    {图片路径: {"signature": [大小, 修改时间], "hash": 内容哈希}}
+    cards:     [{"prompt_hash", "image_path", "image_hash", "derivatives_hash", "fragment_hash"}]
+    fragments: {片段哈希: 渲染好的卡片HTML}
+    """
+
+    def __init__(self, build_dir=BUILD_DIR):
+        self.build_dir = build_dir
+        self.path = os.path.join(build_dir, "state.json")
+        self.data = {"images": {}, "cards": [], "fragments": {}}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data.update(json.load(f))
+
+    def image_hash(self, path):
+        """
+        返回图片内容哈希，文件大小和修改时间都未变化时直接使用记录的值
+
+        Returns:
+            (哈希, 是否重新计算)
+        """
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = self.data["images"].get(path)
+        if entry and entry["signature"] == signature:
+            return entry["hash"], False
+        digest = hash_file(path)
+        self.data["images"][path] = {"signature": signature, "hash": digest}
+        return digest, True
+
+    def save(self, cards, used_images, used_fragments):
+        """保存本次构建结果，并清理不再使用的记录"""
+        self.data["cards"] = cards
+        self.data["images"] = {path: self.data["images"][path] for path in used_images
+                               if path in self.data["images"]}
+        self.data["fragments"] = {key: self.data["fragments"][key] for key in used_fragments}
+        os.makedirs(self.build_dir, exist_ok=True)
+        atomic_write_text(self.path, json.dumps(self.data, indent=2, ensure_ascii=False))
+
+
+def deck_prompt_hashes(config, deck):
+    """按配置中的生成参数计算每张卡片的提示词哈希（与 ImageGenerator.prompt_hash 一致）"""
+    model = config.get("model", "gemini-2.5-flash-image-preview")
+    size = config.get("size", "1024x1024")
+    quality = config.get("quality", "standard")
+    return [make_cache_key(card["prompt"], model, size, quality) for card in deck["cards"]]
+
+
+def stale_jobs(deck, prompt_hashes, manifest):
+    """
+    找出提示词变化或尚未生成的卡片
+
+    Returns:
+        (卡片序号, 提示词) 列表
+    """
+    cards = {card["idx"]: card for card in manifest.list_cards(deck["filename_prefix"])}
+    return [
+        (i, card["prompt"]) for i, card in enumerate(deck["cards"])
+        if not manifest.is_complete(cards.get(i), prompt_hashes[i])
+    ]
+
+
+def generate_stale_cards(config_file, deck, prompt_hashes, manifest, generator=None):
+    """
+    只为提示词变化或尚未生成的卡片调用API
+
+    Args:
+        generator: 已经创建好的 ImageGenerator（worker.py 跨任务复用），None 表示临时创建
+
+    Returns:
+        {卡片序号: 图片路径或None} 字典（run_jobs 的结果），没有需要生成的卡片时为空字典
+    """
+    deck_name = deck["filename_prefix"]
+    jobs = stale_jobs(deck, prompt_hashes, manifest)
+    if not jobs:
+        return {}
+
+    print(f"需要生成 {len(jobs)} 张卡片: {[i + 1 for i, _ in jobs]}")
+    if generator is not None:
+        return generator.run_jobs(jobs, deck_name)
+
+    # 只有确实需要生成时才加载生成器（及其HTTP依赖）
+    from generate_images import ImageGenerator
+
+    with ImageGenerator(config_file) as generator:
+        return generator.run_jobs(jobs, deck_name)
+
+
+def build(deck_file="deck.json", config_file="config.json", html_file="visual-story.html",
+          image_list_file="image_list.json", template_file="templates/visual-story.html",
+          generate=True, single_file=True, build_dir=BUILD_DIR):
+    """
+    增量构建整个卡组
+
+    Args:
+        deck_file: 卡组描述文件
+        config_file: 配置文件
+        html_file: 输出的HTML文件
+        image_list_file: 图片列表文件
+        template_file: 页面模板
+        generate: 是否为缺失或提示词变化的卡片调用API
+        single_file: 是否同时生成内嵌图片的单文件版本
+        build_dir: 构建状态目录
+
+    Returns:
+        是否成功
+    """
+    started = time.perf_counter()
+    config = load_config(config_file)
+    deck = load_deck(deck_file)
+    deck_name = deck["filename_prefix"]
+    state = BuildState(build_dir)
+    previous_cards = state.data["cards"]
+
+    # 1. 提示词哈希与图片生成
+    prompt_hashes = deck_prompt_hashes(config, deck)
+
+    manifest = JobManifest(config.get("manifest_file", "manifest.sqlite3"))
+    manifest.bootstrap(deck_name, config.get("output_dir", "images"), deck_name, image_list_file, prompt_hashes)
+    outcome = generate_stale_cards(config_file, deck, prompt_hashes, manifest) if generate else {}
+    generated = sum(1 for path in outcome.values() if path)
+    image_paths = manifest.export_image_list(deck_name, image_list_file, len(deck["cards"]))
+    cards_by_idx = {card["idx"]: card for card in manifest.list_cards(deck_name)}
+    manifest.close()
+
+    # 2. 图片内容哈希；派生图片对所有现有图片检查（optimize_images 跳过已是最新的），
+    #    derivatives.json 或派生文件被删除、优化配置修改后也会补齐
+    card_images = []
+    changed_images = []
+    for i in range(len(deck["cards"])):
+        card = cards_by_idx.get(i)
+        path = card["output_path"] if card and card["output_path"] and os.path.exists(card["output_path"]) else None
+        image_hash = None
+        if path:
+            image_hash, rehashed = state.image_hash(path)
+            previous = previous_cards[i] if i < len(previous_cards) else {}
+            if rehashed or previous.get("image_hash") != image_hash:
+                changed_images.append(path)
+        card_images.append((path, image_hash))
+
+    optimize_config = get_optimize_config(config)
+    image_format = None
+    if optimize_config["enabled"]:
+        image_format = optimize_config["html_format"]
+        present = [path for path, _ in card_images if path]
+        if present and Image is not None:
+            optimize_images(present, optimize_config)
+    derivatives = load_derivatives(optimize_config["derivatives_file"])
+
+    # 3. 渲染片段：输入未变化的卡片直接复用
+    fragments = []
+    card_states = []
+    rendered = 0
+    for i, card in enumerate(deck["cards"]):
+        path, image_hash = card_images[i]
+        derivatives_hash = hash_json([image_hash, derivatives.get(path)]) if path else None
+        fragment_hash = hash_json([
+            card.get("title"), card.get("caption"), card["layout"],
+            path, image_hash, derivatives_hash, image_format, i == 0
+        ])
+        fragment = state.data["fragments"].get(fragment_hash)
+        if fragment is None:
+            fragment = render_card(card, path, derivatives, image_format, is_cover=(i == 0))
+            state.data["fragments"][fragment_hash] = fragment
+            rendered += 1
+        fragments.append(fragment)
+        card_states.append({
+            "prompt_hash": prompt_hashes[i],
+            "image_path": path,
+            "image_hash": image_hash,
+            "derivatives_hash": derivatives_hash,
+            "fragment_hash": fragment_hash
+        })
+
+    shell_config = get_shell_config(config)
+    content = render_html(deck, image_paths, derivatives, image_format, template_file,
+                          card_fragments=fragments, shell_config=shell_config)
+    old_content = None
+    if os.path.exists(html_file):
+        with open(html_file, 'r', encoding='utf-8') as f:
+            old_content = f.read()
+    if content != old_content:
+        atomic_write_text(html_file, content)
+        print(f"✓ HTML文件已更新: {html_file}（重新渲染 {rendered} 张卡片）")
+    else:
+        print(f"✓ HTML文件无变化: {html_file}")
+
+    # 4. 单文件版本：编码结果缓存在构建目录中，只编码变化的图片
+    if single_file:
+        encoded_dir = os.path.join(build_dir, "base64")
+        update_html_with_base64(html_file, image_list_file, workers=os.cpu_count() or 1,
+                                image_format=image_format,
+                                derivatives_file=optimize_config["derivatives_file"],
+                                encoded_cache_dir=encoded_dir,
+                                vendor_dir=shell_config["vendor_dir"] if shell_config["enabled"] else None)
+        keep = set(
+            os.path.basename(encoded_cache_path(encoded_dir, embedded))
+            for embedded in (pick_derivative(derivatives, path, image_format) for path in image_paths if path)
+            if os.path.exists(embedded)
+        )
+        for filename in os.listdir(encoded_dir):
+            if filename not in keep:
+                os.remove(os.path.join(encoded_dir, filename))
+
+    state.save(card_states,
+               [path for path, _ in card_images if path],
+               [card_state["fragment_hash"] for card_state in card_states])
+
+    elapsed = time.perf_counter() - started
+    failed = len(outcome) - generated
+    print(f"\n✓ 构建完成: 生成图片 {generated} 张{f'（失败 {failed} 张）' if failed else ''}，"
+          f"变化图片 {len(changed_images)} 张，重新渲染 {rendered} 张卡片，耗时 {elapsed:.2f} 秒")
+    return True
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="增量构建视觉故事卡片")
+    parser.add_argument("--deck", default="deck.json", help="卡组描述文件")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    parser.add_argument("--html", default="visual-story.html", help="输出的HTML文件")
+    parser.add_argument("--no-generate", action="store_true", help="不调用API，只使用已有图片")
+    parser.add_argument("--no-base64", action="store_true", help="不生成内嵌图片的单文件版本")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("增量构建")
+    print("=" * 60)
+
+    build(args.deck, args.config, args.html,
+          generate=not args.no_generate, single_file=not args.no_base64)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,37 @@
 """
 
 import base64
+import hashlib
 import json
 import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_io import atomic_copy, atomic_write_chunks, detect_image_type, iter_file_chunks
+from optimize_images import load_derivatives, load_optimize_config, pick_derivative
+from page_shell import load_shell_config, vendor_bundle
+
+# 3的倍数，保证分块编码结果可以直接拼接
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+# 图片引用：CSS 的 url('...') 与 <img> 的 src="..."；
+# 单文件版本只内嵌一份图片，<source> 与 srcset/sizes 会被去掉
+REFERENCE_PATTERN = re.compile(
+    r"url\('(?P<url>[^']*)'\)"
+    r'|src="(?P<src>[^"]*)"'
+    r'|(?P<drop>\s*<source [^>]*>| srcset="[^"]*"| sizes="[^"]*")'
+)
+
+MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif'
+}
+
 
 def image_to_base64(image_path):
     """
@@ -21,13 +50,62 @@ def image_to_base64(image_path):
         encoded_string = base64.b64encode(image_file.read())
         return encoded_string.decode('utf-8')
 
-def update_html_with_base64(html_file="visual-story.html", image_list_file="image_list.json"):
+
+def iter_base64_chunks(image_path, chunk_size=ENCODE_CHUNK_SIZE):
+    """
+    分块读取图片并逐块进行base64编码
+    
+    Args:
+        image_path: 图片文件路径
+        chunk_size: 每次读取的字节数，必须是3的倍数
+    
+    Returns:
+        base64编码后的 bytes 数据块迭代器
+    """
+    for chunk in iter_file_chunks(image_path, chunk_size):
+        yield base64.b64encode(chunk)
+
+
+def encode_to_file(image_path, output_path):
+    """将图片base64编码后写入文件（供进程池调用）"""
+    atomic_write_chunks(iter_base64_chunks(image_path), output_path, verify_image=False)
+    return output_path
+
+
+def encoded_cache_path(cache_dir, image_path):
+    """按图片路径、大小和修改时间确定编码结果的缓存文件路径"""
+    stat = os.stat(image_path)
+    key = f"{os.path.abspath(image_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".b64")
+
+
+def get_mime_type(image_path):
+    """根据文件头确定MIME类型，无法识别时按扩展名判断"""
+    with open(image_path, 'rb') as f:
+        mime_type = detect_image_type(f.read(16))
+    if mime_type:
+        return mime_type
+    ext = os.path.splitext(image_path)[1].lower()
+    return MIME_TYPES.get(ext, 'image/png')
+
+
+def update_html_with_base64(html_file="visual-story.html", image_list_file="image_list.json", workers=0,
+                            image_format=None, derivatives_file="derivatives.json", encoded_cache_dir=None,
+                            vendor_dir=None):
     """
     更新HTML文件，将图片URL替换为base64编码
     
+    只扫描一遍HTML，边扫描边把结果流式写入输出文件，
+    图片按块编码后直接写出，不会在内存中拼出整个data URI。
+    
     Args:
         html_file: HTML文件路径
         image_list_file: 图片列表文件路径
+        workers: 并行编码图片的进程数，<= 1 表示在当前进程中边读边写
+        image_format: 内嵌的派生图片格式（如 "webp"），需与 update_html 使用的格式一致
+        derivatives_file: 派生图片记录文件路径
+        encoded_cache_dir: 保存编码结果的目录，提供时未变化的图片不会重新编码
+        vendor_dir: 已下载的第三方脚本目录，提供时把脚本内嵌到单文件中，离线也能下载卡片
     """
     # 读取图片列表
     if not os.path.exists(image_list_file):
@@ -37,59 +115,97 @@ def update_html_with_base64(html_file="visual-story.html", image_list_file="imag
     with open(image_list_file, 'r', encoding='utf-8') as f:
         image_paths = json.load(f)
     
+    derivatives = load_derivatives(derivatives_file)
+    # 列表中的 null 是没有图片的卡片
+    image_paths = [pick_derivative(derivatives, path, image_format) for path in image_paths if path]
+    
     # 读取HTML文件
     with open(html_file, 'r', encoding='utf-8') as f:
         html_content = f.read()
     
     # 备份原文件
     backup_file = html_file + ".backup"
-    with open(backup_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    atomic_copy(html_file, backup_file)
     print(f"✓ 原文件已备份到: {backup_file}")
     
-    # 将每个图片转换为base64并替换
+    available = []
     for i, image_path in enumerate(image_paths):
         print(f"\n正在处理图片 {i + 1}/{len(image_paths)}: {image_path}")
-        
         if not os.path.exists(image_path):
             print(f"  警告: 图片文件不存在，跳过")
             continue
+        available.append(image_path)
+    
+    referenced = set(
+        match.group("url") or match.group("src")
+        for match in REFERENCE_PATTERN.finditer(html_content)
+        if not match.group("drop")
+    )
+    for image_path in available:
+        if image_path not in referenced:
+            print(f"  警告: 在HTML中未找到该图片的引用: {image_path}")
+    
+    output_file = html_file.replace('.html', '_base64.html')
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 可选：先把图片编码到缓存目录（可复用）或临时文件（可用多个进程并行）
+        encoded_files = {}
+        if encoded_cache_dir:
+            os.makedirs(encoded_cache_dir, exist_ok=True)
+            encoded_files = {path: encoded_cache_path(encoded_cache_dir, path) for path in available}
+        elif workers and workers > 1 and len(available) > 1:
+            encoded_files = {path: os.path.join(tmp_dir, f"{i}.b64") for i, path in enumerate(available)}
         
-        # 转换为base64
-        base64_data = image_to_base64(image_path)
-        
-        # 根据文件扩展名确定MIME类型
-        ext = os.path.splitext(image_path)[1].lower()
-        if ext == '.png':
-            mime_type = 'image/png'
-        elif ext in ['.jpg', '.jpeg']:
-            mime_type = 'image/jpeg'
-        elif ext == '.gif':
-            mime_type = 'image/gif'
-        elif ext == '.webp':
-            mime_type = 'image/webp'
+        todo = [path for path in encoded_files if not os.path.exists(encoded_files[path])]
+        if encoded_cache_dir:
+            print(f"\n需要编码 {len(todo)} 张图片，{len(encoded_files) - len(todo)} 张使用缓存")
+        if workers and workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(encode_to_file, path, encoded_files[path]) for path in todo]:
+                    future.result()
         else:
-            mime_type = 'image/png'
+            for path in todo:
+                encode_to_file(path, encoded_files[path])
         
-        # 构建data URI
-        data_uri = f"data:{mime_type};base64,{base64_data}"
+        def iter_encoded(image_path):
+            if image_path in encoded_files:
+                return iter_file_chunks(encoded_files[image_path])
+            return iter_base64_chunks(image_path)
         
-        # 在HTML中查找并替换
-        old_pattern = f"url('{image_path}')"
-        new_pattern = f"url('{data_uri}')"
+        def iter_output():
+            # 单遍扫描：原样输出引用之间的文本，遇到图片引用时流式写入data URI
+            position = 0
+            targets = set(available)
+            for match in REFERENCE_PATTERN.finditer(html_content):
+                if match.group("drop"):
+                    yield html_content[position:match.start()].encode('utf-8')
+                    position = match.end()
+                    continue
+                image_path = match.group("url") or match.group("src")
+                if image_path not in targets:
+                    continue
+                if match.group("url") is not None:
+                    prefix, suffix = "url('", "')"
+                else:
+                    prefix, suffix = 'src="', '"'
+                yield html_content[position:match.start()].encode('utf-8')
+                yield f"{prefix}data:{get_mime_type(image_path)};base64,".encode('utf-8')
+                for chunk in iter_encoded(image_path):
+                    yield chunk
+                yield suffix.encode('utf-8')
+                position = match.end()
+            tail = html_content[position:]
+            # 第三方脚本放在 </body> 之前，不参与图片引用的扫描
+            bundle = vendor_bundle(vendor_dir) if vendor_dir else ""
+            end = tail.rfind("</body>")
+            if bundle and end >= 0:
+                tail = tail[:end] + bundle + tail[end:]
+            yield tail.encode('utf-8')
         
-        if old_pattern in html_content:
-            html_content = html_content.replace(old_pattern, new_pattern)
-            print(f"  ✓ 已替换为base64编码")
-        else:
-            print(f"  警告: 在HTML中未找到该图片的引用")
-    
-    # 保存更新后的HTML
-    output_file = html_file.replace('.html', '_base64.html')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+        atomic_write_chunks(iter_output(), output_file, verify_image=False)
     
     print(f"\n✓ 更新完成！")
+    print(f"✓ 已内嵌 {len([p for p in available if p in referenced])} 张图片")
     print(f"✓ 新文件已保存: {output_file}")
     print(f"\n请在浏览器中打开 {output_file} 查看效果")
     
@@ -102,7 +218,12 @@ def main():
     print("将图片转换为base64编码并内嵌到HTML中")
     print("=" * 60)
     
-    success = update_html_with_base64()
+    optimize_config = load_optimize_config()
+    image_format = optimize_config["html_format"] if optimize_config["enabled"] else None
+    shell_config = load_shell_config()
+    success = update_html_with_base64(workers=os.cpu_count() or 1, image_format=image_format,
+                                      derivatives_file=optimize_config["derivatives_file"],
+                                      vendor_dir=shell_config["vendor_dir"] if shell_config["enabled"] else None)
     
     if success:
         print("\n✓ 转换完成！")
@@ -113,4 +234,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+多接口/多密钥负载均衡：按权重和并发上限把请求分配给最空闲的健康接口
+
+config.json 中配置 endpoints 列表即可同时使用多个配额；
+未配置时使用顶层的 api_url / api_key 作为唯一的接口。
+
+健康检查采用熔断的方式：
+- 连续失败 eject_after_failures 次，或延迟的滑动平均超过 slow_latency，暂时摘除
+- 被限流（429/503）时按 Retry-After 摘除
+- 摘除时间到后放行一个探测请求，成功则恢复，失败则摘除时间加倍（不超过 max_eject_seconds）
+只有一个接口时只按 Retry-After 暂停，不因失败或变慢摘除。
+"""
+
+import threading
+import time
+
+
+DEFAULT_POOL_CONFIG = {
+    "eject_after_failures": 3,
+    "slow_latency": 90.0,
+    "eject_seconds": 30.0,
+    "max_eject_seconds": 600.0
+}
+
+LATENCY_SMOOTHING = 0.3
+
+
+class Endpoint:
+    """单个接口的配置与运行状态"""
+
+    def __init__(self, name, api_url, api_key, weight=1.0, max_concurrency=4,
+                 model=None, response_format=None):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.weight = max(float(weight), 0.01)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.model = model
+        self.response_format = response_format
+        self.in_flight = 0
+        self.failures = 0
+        self.latency = None
+        self.ejected_until = 0.0
+        self.eject_seconds = 0.0
+        self.probing = False
+        self.stats = {"served": 0, "failed": 0, "throttled": 0, "ejected": 0}
+
+    def load(self):
+        """按权重折算的负载，越小越空闲"""
+        return self.in_flight / self.weight
+
+
+class EndpointPool:
+    """线程安全的接口池"""
+
+    def __init__(self, endpoints, eject_after_failures=3, slow_latency=90.0,
+                 eject_seconds=30.0, max_eject_seconds=600.0):
+        """
+        Args:
+            endpoints: Endpoint 列表
+            eject_after_failures: 连续失败多少次后摘除
+            slow_latency: 延迟滑动平均超过该值（秒）时摘除，None 表示不看延迟
+            eject_seconds: 首次摘除的时长（秒）
+            max_eject_seconds: 摘除时长上限（秒）
+        """
+        self.endpoints = endpoints
+        self.eject_after_failures = eject_after_failures
+        self.slow_latency = slow_latency
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从 config.json 创建接口池
+
+        endpoints 中每一项可包含 name、api_url、api_key、weight、max_concurrency，
+        以及覆盖全局配置的 model 和 response_format。
+        """
+        pool_config = dict(DEFAULT_POOL_CONFIG)
+        pool_config.update(config.get("endpoint_pool", {}))
+
+        entries = config.get("endpoints") or [{
+            "name": "default",
+            "api_url": config.get("api_url", ""),
+            "api_key": config.get("api_key", ""),
+            "max_concurrency": config.get("rate_control", {}).get("max_concurrency", 16)
+        }]
+        endpoints = []
+        for number, entry in enumerate(entries, 1):
+            if not entry.get("api_url") or not entry.get("api_key"):
+                continue
+            endpoints.append(Endpoint(
+                entry.get("name", f"endpoint-{number}"),
+                entry["api_url"],
+                entry["api_key"],
+                weight=entry.get("weight", 1.0),
+                max_concurrency=entry.get("max_concurrency", 4),
+                model=entry.get("model"),
+                response_format=entry.get("response_format")
+            ))
+        return cls(endpoints, **pool_config)
+
+    def __bool__(self):
+        return bool(self.endpoints)
+
+    @property
+    def capacity(self):
+        """所有接口的并发上限之和"""
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints)
+
+    def has_healthy(self):
+        """是否还有未被摘除的接口"""
+        now = time.monotonic()
+        with self._condition:
+            return any(endpoint.ejected_until <= now for endpoint in self.endpoints)
+
+    def _pick(self, now, avoid=None):
+        best = None
+        for endpoint in self.endpoints:
+            if endpoint.in_flight >= endpoint.max_concurrency:
+                continue
+            if endpoint.ejected_until > now:
+                continue
+            # 摘除到期的接口先只放行一个探测请求
+            if endpoint.probing and endpoint.in_flight:
+                continue
+            if best is None or (endpoint.name != avoid, -endpoint.load()) > (best.name != avoid, -best.load()):
+                best = endpoint
+        return best
+
+    def acquire(self, avoid=None):
+        """
+        取得一个可用接口，全部满载或被摘除时阻塞等待
+
+        Args:
+            avoid: 尽量避开的接口名（如上次失败的接口），没有其他可用接口时仍会使用
+
+        Returns:
+            Endpoint
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                endpoint = self._pick(now, avoid)
+                if endpoint:
+                    endpoint.in_flight += 1
+                    return endpoint
+                waiting = [e.ejected_until - now for e in self.endpoints if e.ejected_until > now]
+                self._condition.wait(timeout=min(waiting) if waiting else None)
+
+    def try_acquire(self, avoid=None):
+        """
+        不阻塞地取得一个可用接口
+
+        Returns:
+            Endpoint，没有空闲的健康接口时返回None
+        """
+        with self._condition:
+            endpoint = self._pick(time.monotonic(), avoid)
+            if endpoint:
+                endpoint.in_flight += 1
+            return endpoint
+
+    def _eject(self, endpoint, seconds=None):
+        single = len(self.endpoints) < 2
+        # 只有一个接口时因失败或变慢摘除只会让整批任务停下，这种退避交给自适应并发控制器
+        if seconds is None and single:
+            return
+        if seconds is None:
+            endpoint.eject_seconds = min(self.max_eject_seconds,
+                                         max(self.eject_seconds, endpoint.eject_seconds * 2))
+            seconds = endpoint.eject_seconds
+        endpoint.ejected_until = time.monotonic() + seconds
+        endpoint.probing = True
+        endpoint.stats["ejected"] += 1
+        if not single:
+            print(f"警告: 接口 {endpoint.name} 暂时摘除 {seconds:.0f} 秒")
+
+    def release(self, endpoint, outcome, latency=None, retry_after=None):
+        """
+        归还接口并更新健康状态
+
+        Args:
+            endpoint: acquire 返回的接口
+            outcome: "ok"、"failed"、"throttled" 或 "cancelled"（对冲请求被取消，不影响健康状态）
+            latency: 接口调用耗时（秒）
+            retry_after: 被限流时的 Retry-After 秒数
+        """
+        with self._condition:
+            endpoint.in_flight -= 1
+            if outcome == "ok":
+                endpoint.stats["served"] += 1
+                endpoint.failures = 0
+                if latency is not None:
+                    if endpoint.latency is None or endpoint.probing:
+                        endpoint.latency = latency
+                    else:
+                        endpoint.latency += LATENCY_SMOOTHING * (latency - endpoint.latency)
+                if self.slow_latency and endpoint.latency and endpoint.latency > self.slow_latency:
+                    endpoint.latency = None
+                    self._eject(endpoint)
+                else:
+                    endpoint.probing = False
+                    endpoint.eject_seconds = 0.0
+            elif outcome == "cancelled":
+                pass
+            elif outcome == "throttled":
+                endpoint.stats["throttled"] += 1
+                self._eject(endpoint, retry_after)
+            else:
+                endpoint.stats["failed"] += 1
+                endpoint.failures += 1
+                # 摘除前已经发出的请求陆续失败时不再重复摘除
+                already_ejected = endpoint.ejected_until > time.monotonic()
+                if not already_ejected and (endpoint.probing
+                                            or endpoint.failures >= self.eject_after_failures):
+                    endpoint.failures = 0
+                    self._eject(endpoint)
+            self._condition.notify_all()
+
+    def print_summary(self):
+        """输出每个接口的处理情况（只有一个接口时不输出）"""
+        if len(self.endpoints) < 2:
+            return
+        print("\n接口使用情况:")
+        for endpoint in self.endpoints:
+            stats = endpoint.stats
+            print(f"  {endpoint.name}: 成功 {stats['served']}，失败 {stats['failed']}，"
+                  f"限流 {stats['throttled']}，摘除 {stats['ejected']} 次")
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+在服务端直接把卡片合成为PNG并打包成ZIP，不需要浏览器
+
+布局与 visual-story.html 中的样式保持一致（卡片宽600px、宽高比3:4）：
+    a: 上图下文    b: 上文下图    c: 全幅图片，文字叠加在底部渐变上
+"""
+
+import argparse
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from render_deck import load_deck
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+    ImageDraw = None
+    ImageFont = None
+
+
+# 与页面CSS一致的尺寸（CSS像素）
+CARD_WIDTH = 600
+CARD_HEIGHT = 800
+PADDING = 40
+TITLE_SIZE = 34
+TITLE_LINE_HEIGHT = 1.3
+TITLE_MARGIN = 15
+CAPTION_SIZE = 21
+CAPTION_LINE_HEIGHT = 1.6
+
+# 常见系统中的中文字体，可在 config.json 的 export.font / export.bold_font 中指定
+FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+]
+BOLD_FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Bold.ttc",
+    "C:/Windows/Fonts/msyhbd.ttc",
+]
+
+_font_cache = {}
+
+
+def find_font(candidates):
+    """返回第一个存在的字体文件路径，找不到返回None"""
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def load_font(path, size):
+    """按路径和字号加载字体（每个进程内缓存）"""
+    key = (path, size)
+    if key not in _font_cache:
+        if path:
+            _font_cache[key] = ImageFont.truetype(path, size)
+        else:
+            try:
+                _font_cache[key] = ImageFont.load_default(size)
+            except TypeError:
+                # Pillow < 10.1 的默认字体不支持指定字号
+                _font_cache[key] = ImageFont.load_default()
+    return _font_cache[key]
+
+
+def glyph_bitmap(font, char):
+    """把单个字符渲染为灰度位图，用于和缺字时的替代字形（.notdef）比较"""
+    left, top, right, bottom = font.getbbox(char)
+    image = Image.new("L", (max(1, right - left), max(1, bottom - top)))
+    ImageDraw.Draw(image).text((-left, -top), char, font=font, fill=255)
+    return image.size, image.tobytes()
+
+
+def missing_glyphs(font_path, text):
+    """
+    找出字体中没有字形的字符
+
+    字体缺字时 Pillow 会画出 .notdef 字形（通常是空心方框），
+    这里与私有区最后一个码位（任何字体都不会收录）的渲染结果比较来判断。
+
+    Returns:
+        缺少字形的字符（按码位排序的字符串）
+    """
+    font = load_font(font_path, CAPTION_SIZE)
+    notdef = glyph_bitmap(font, "\U0010FFFF")
+    chars = sorted({char for char in text if not char.isspace()})
+    return "".join(char for char in chars if glyph_bitmap(font, char) == notdef)
+
+
+def wrap_text(text, font, max_width):
+    """
+    按像素宽度折行，中文逐字折行，英文单词尽量不拆开
+
+    Returns:
+        行列表
+    """
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for token in split_tokens(paragraph):
+            candidate = line + token
+            if line and font.getlength(candidate) > max_width:
+                lines.append(line.rstrip())
+                line = token.lstrip()
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def split_tokens(text):
+    """把文本切成可折行的单元：连续的ASCII单词为一个单元，其余每个字符一个单元"""
+    tokens = []
+    word = ""
+    for char in text:
+        if char.isascii() and not char.isspace():
+            word += char
+            continue
+        if word:
+            tokens.append(word)
+            word = ""
+        tokens.append(char)
+    if word:
+        tokens.append(word)
+    return tokens
+
+
+def cover_image(image, width, height):
+    """等比缩放并居中裁剪，效果同 CSS background-size: cover"""
+    scale = max(width / image.width, height / image.height)
+    resized = image.resize((max(width, round(image.width * scale)), max(height, round(image.height * scale))),
+                           Image.LANCZOS)
+    left = (resized.width - width) // 2
+    top = (resized.height - height) // 2
+    return resized.crop((left, top, left + width, top + height))
+
+
+def layout_text(card, scale, font_path, bold_font_path):
+    """
+    计算文字区域的排版
+
+    Returns:
+        (行列表[(文本, 字体, y偏移, 是否标题)], 文字区域高度)
+    """
+    title_font = load_font(bold_font_path or font_path, round(TITLE_SIZE * scale))
+    caption_font = load_font(font_path, round(CAPTION_SIZE * scale))
+    max_width = (CARD_WIDTH - 2 * PADDING) * scale
+
+    lines = []
+    y = PADDING * scale
+    title_step = TITLE_SIZE * TITLE_LINE_HEIGHT * scale
+    for text in wrap_text(card.get("title", ""), title_font, max_width):
+        lines.append((text, title_font, y + (title_step - TITLE_SIZE * scale) / 2, True))
+        y += title_step
+    y += TITLE_MARGIN * scale
+    caption_step = CAPTION_SIZE * CAPTION_LINE_HEIGHT * scale
+    for text in wrap_text(card.get("caption", ""), caption_font, max_width):
+        lines.append((text, caption_font, y + (caption_step - CAPTION_SIZE * scale) / 2, False))
+        y += caption_step
+    y += PADDING * scale
+    return lines, round(y)
+
+
+def draw_text(draw, lines, top, width, scale, centered, title_color, caption_color, fake_bold):
+    """绘制排好版的文字"""
+    left = PADDING * scale
+    for text, font, y, is_title in lines:
+        x = left
+        if centered:
+            x = (width - font.getlength(text)) / 2
+        color = title_color if is_title else caption_color
+        stroke = max(1, round(scale * 0.6)) if is_title and fake_bold else 0
+        draw.text((x, top + y), text, font=font, fill=color, stroke_width=stroke, stroke_fill=color)
+
+
+def render_card_png(card, image_path, scale=2, font_path=None, bold_font_path=None):
+    """
+    合成一张卡片并编码为PNG（在进程池中执行）
+
+    Args:
+        card: deck.json 中的卡片字典
+        image_path: 插图路径，None 表示没有图片
+        scale: 缩放倍数，2 对应页面上的2x截图
+        font_path: 正文字体路径
+        bold_font_path: 标题粗体字体路径，None 时用正文字体描边模拟粗体
+
+    Returns:
+        PNG 字节
+    """
+    width, height = round(CARD_WIDTH * scale), round(CARD_HEIGHT * scale)
+    canvas = Image.new("RGB", (width, height), "#FFFFFF")
+    lines, text_height = layout_text(card, scale, font_path, bold_font_path)
+    layout = card.get("layout", "a")
+    fake_bold = bold_font_path is None
+
+    illustration = None
+    if image_path and os.path.exists(image_path):
+        with Image.open(image_path) as source:
+            illustration = source.convert("RGB")
+
+    if layout == "c":
+        if illustration:
+            canvas.paste(cover_image(illustration, width, height), (0, 0))
+        # 底部从 rgba(0,0,0,0.7) 到透明的渐变
+        top = height - text_height
+        gradient = Image.new("L", (1, text_height))
+        for y in range(text_height):
+            gradient.putpixel((0, y), round(255 * 0.7 * y / max(1, text_height - 1)))
+        mask = gradient.resize((width, text_height))
+        canvas.paste(Image.new("RGB", (width, text_height), "#000000"), (0, top), mask)
+        draw = ImageDraw.Draw(canvas)
+        draw_text(draw, lines, top, width, scale, True, "#FFFFFF", "#f0f0f0", fake_bold)
+    else:
+        image_height = max(0, height - text_height)
+        image_top, text_top = (0, image_height) if layout == "a" else (text_height, 0)
+        if illustration and image_height > 0:
+            canvas.paste(cover_image(illustration, width, image_height), (0, image_top))
+        draw = ImageDraw.Draw(canvas)
+        draw_text(draw, lines, text_top, width, scale, False, "#111111", "#555555", fake_bold)
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def export_cards(output_file="visual-story-cards.zip", deck_file="deck.json",
+                 image_list_file="image_list.json", scale=2, workers=0, config_file="config.json",
+                 allow_missing_font=False):
+    """
+    用进程池渲染所有卡片，并按顺序以不压缩（stored）的方式流式写入ZIP
+
+    PNG本身已经压缩过，再用 deflate 压缩几乎不会变小，只会浪费CPU。
+    同时在途的渲染任务数量有限，内存中最多只保存少量卡片。
+
+    Args:
+        output_file: 输出的ZIP文件路径
+        deck_file: 卡组描述文件
+        image_list_file: 图片列表文件
+        scale: 缩放倍数
+        workers: 进程数，0 表示使用CPU核数
+        config_file: 配置文件（读取 export.font / export.bold_font）
+        allow_missing_font: 字体缺少卡组用到的字形时仍然导出（缺字显示为方框）
+
+    Returns:
+        是否成功
+    """
+    if Image is None:
+        print("错误: 导出卡片需要安装 Pillow（pip install Pillow）")
+        return False
+
+    deck = load_deck(deck_file)
+    image_paths = []
+    if os.path.exists(image_list_file):
+        with open(image_list_file, 'r', encoding='utf-8') as f:
+            image_paths = json.load(f)
+
+    export_config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            export_config = json.load(f).get("export", {})
+    font_path = export_config.get("font") or find_font(FONT_CANDIDATES)
+    bold_font_path = export_config.get("bold_font") or find_font(BOLD_FONT_CANDIDATES)
+
+    cards = deck["cards"]
+    missing = missing_glyphs(font_path, "".join(card.get("title", "") + card.get("caption", "") for card in cards))
+    if bold_font_path and not missing:
+        missing = missing_glyphs(bold_font_path, "".join(card.get("title", "") for card in cards))
+    if missing:
+        print(f"{'警告' if allow_missing_font else '错误'}: 字体 {font_path or '（Pillow 默认字体）'} "
+              f"缺少 {len(missing)} 个字符的字形: {missing[:20]}{'…' if len(missing) > 20 else ''}")
+        if not allow_missing_font:
+            print("请在 config.json 的 export.font / export.bold_font 中指定包含这些字符的字体文件，"
+                  "或使用 --allow-missing-font 继续导出")
+            return False
+
+    workers = workers or os.cpu_count() or 1
+    window = workers * 2
+    tmp_file = output_file + ".part"
+
+    print(f"正在导出 {len(cards)} 张卡片（{scale}x，{workers} 个进程）...")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor, \
+                zipfile.ZipFile(tmp_file, "w", compression=zipfile.ZIP_STORED) as archive:
+            futures = {}
+            next_submit = 0
+            for i in range(len(cards)):
+                while next_submit < len(cards) and next_submit < i + window:
+                    image_path = image_paths[next_submit] if next_submit < len(image_paths) else None
+                    futures[next_submit] = executor.submit(
+                        render_card_png, cards[next_submit], image_path, scale, font_path, bold_font_path
+                    )
+                    next_submit += 1
+                archive.writestr(f"card-{i + 1}.png", futures.pop(i).result())
+                print(f"✓ 卡片 {i + 1}/{len(cards)}")
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        # 渲染失败或被中断时不留下不完整的 .part 文件
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+    print(f"\n✓ 已导出: {output_file}")
+    return True
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="将卡片渲染为PNG并打包为ZIP")
+    parser.add_argument("--output", default="visual-story-cards.zip", help="输出的ZIP文件")
+    parser.add_argument("--deck", default="deck.json", help="卡组描述文件")
+    parser.add_argument("--images", default="image_list.json", help="图片列表文件")
+    parser.add_argument("--scale", type=float, default=2, help="缩放倍数")
+    parser.add_argument("--workers", type=int, default=0, help="进程数，默认使用CPU核数")
+    parser.add_argument("--allow-missing-font", action="store_true",
+                        help="字体缺少卡组用到的字形时仍然导出（缺字显示为方框）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("导出卡片")
+    print("=" * 60)
+
+    success = export_cards(args.output, args.deck, args.images, args.scale, args.workers,
+                           allow_missing_font=args.allow_missing_font)
+    if not success:
+        print("\n✗ 导出失败，请检查错误信息")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,66 @@
 """
 
 import requests
+import filecmp
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+import threading
 import time
 
+from atomic_io import IntegrityError, atomic_copy, atomic_write_chunks
+from endpoint_pool import EndpointPool
+from hedging import HedgePolicy, get_hedging_config
+from http_client import create_session, get_http_config
+from image_store import ImageStore
+from inline_image import InlineImageError, InlineImageScanner, decode_base64_stream
+from job_manifest import JobManifest
+from metrics import CardMetrics, MetricsRecorder
+from optimize_images import get_optimize_config, optimize_images
+from render_deck import load_deck
+from prompt_cache import PromptCache, make_cache_key
+from rate_control import (THROTTLE_STATUS_CODES, AdaptiveController, ThrottledError,
+                          get_rate_control_config, parse_retry_after)
+from select_variant import get_variant_config, pick_best, score_variants
+
+
+# run_one 的返回值：卡片被限流，需要重新排队
+REQUEUE = object()
+
+
+class RateLimiter:
+    """
+    线程安全的请求速率限制器
+
+    保证相邻两次请求的发起时间间隔不小于 1 / requests_per_second 秒，
+    用来替代固定的 time.sleep(1)。
+    """
+
+    def __init__(self, requests_per_second):
+        """
+        Args:
+            requests_per_second: 每秒最多发起的请求数，<= 0 或 None 表示不限速
+        """
+        if requests_per_second and requests_per_second > 0:
+            self.interval = 1.0 / requests_per_second
+        else:
+            self.interval = 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        """阻塞直到允许发起下一次请求"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class ImageGenerator:
     def __init__(self, config_file="config.json"):
         """
@@ -19,7 +74,65 @@ class ImageGenerator:
         """
         self.config = self.load_config(config_file)
         self.output_dir = self.config.get("output_dir", "images")
+        self.debug = self.config.get("debug", False)
+        self.http_config = get_http_config(self.config)
+        self.variant_config = get_variant_config(self.config)
+        self.rate_config = get_rate_control_config(self.config)
+        self.endpoints = EndpointPool.from_config(self.config)
+        # 限速器和并发控制器由所有批次共用，同时运行多个批次（worker.py）也不会超过配置的速率和并发
+        self.limiter = RateLimiter(self.config.get("requests_per_second", 1.0))
+        self.controller = AdaptiveController(
+            max(1, int(self.config.get("max_workers", 4))),
+            min_concurrency=self.rate_config["min_concurrency"],
+            max_concurrency=min(self.rate_config["max_concurrency"], max(1, self.endpoints.capacity)),
+            latency_target=self.rate_config["latency_target"],
+            backoff=self.rate_config["backoff"],
+            adaptive=self.rate_config["adaptive"]
+        )
+        self.hedging = HedgePolicy(**get_hedging_config(self.config))
+        self.hedge_executor = None
+        if self.hedging.enabled:
+            # 每张卡片最多同时有原请求和对冲请求两个线程
+            self.hedge_executor = ThreadPoolExecutor(max_workers=2 * max(1, self.endpoints.capacity))
+        self.session = create_session(self.config)
+        self.cache = self.create_cache()
+        self.manifest = JobManifest(self.config.get("manifest_file", "manifest.sqlite3"))
+        self.store = ImageStore.from_config(self.config)
         os.makedirs(self.output_dir, exist_ok=True)
+
+    def create_cache(self):
+        """根据配置创建提示词缓存，未启用返回None"""
+        cache_config = self.config.get("cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return PromptCache(
+            cache_config.get("dir", ".cache/prompts"),
+            int(cache_config.get("max_size_mb", 500) * 1024 * 1024)
+        )
+
+    def prompt_hash(self, prompt):
+        """计算提示词及生成参数的哈希，用作缓存键和清单中的 prompt_hash"""
+        return make_cache_key(
+            prompt,
+            self.config.get("model", "gemini-2.5-flash-image-preview"),
+            self.config.get("size", "1024x1024"),
+            self.config.get("quality", "standard")
+        )
+
+    def close(self):
+        """关闭HTTP会话和任务清单（先等落后的对冲请求结束）"""
+        if self.hedge_executor:
+            self.hedge_executor.shutdown(wait=True)
+        self.session.close()
+        self.manifest.close()
+        if self.store:
+            self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
     
     def load_config(self, config_file):
         """加载配置文件"""
@@ -35,7 +148,7 @@ class ImageGenerator:
                 "output_dir": "images"
             }
     
-    def generate_image(self, prompt, filename_prefix="card", index=0):
+    def generate_image(self, prompt, filename_prefix="card", index=0, card_metrics=None):
         """
         生成图片
         
@@ -43,93 +156,578 @@ class ImageGenerator:
             prompt: 图片生成提示词
             filename_prefix: 文件名前缀
             index: 卡片序号
+            card_metrics: 记录本张卡片各阶段耗时的 CardMetrics，None 表示不汇总
         
         Returns:
             生成的图片文件路径，失败返回None
         """
-        api_key = self.config.get("api_key", "")
-        api_url = self.config.get("api_url", "")
         model = self.config.get("model", "gemini-2.5-flash-image-preview")
+        size = self.config.get("size", "1024x1024")
+        quality = self.config.get("quality", "standard")
+        metrics = card_metrics or CardMetrics(filename_prefix, index)
         
-        if not api_key or not api_url:
-            print("错误: API key或API URL未配置，请在config.json中配置")
-            print(f"当前配置: {self.config}")
-            return None
-        
-        # 生成文件名
+        # 生成文件名；一次请求多张候选时加 _v<k> 后缀
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{filename_prefix}_{index:02d}_{timestamp}.png"
         output_path = os.path.join(self.output_dir, filename)
+        variant_count = self.variant_config["count"]
+        if variant_count == 1:
+            output_paths = [output_path]
+        else:
+            output_paths = [
+                os.path.join(self.output_dir, f"{filename_prefix}_{index:02d}_{timestamp}_v{k + 1}.png")
+                for k in range(variant_count)
+            ]
+        
+        # 先查缓存，相同的提示词和参数不再调用API
+        cache_key = self.prompt_hash(prompt)
+        if self.cache:
+            cached_path = self.cache.get(cache_key)
+            if cached_path:
+                # 清单中的图片就是缓存的这张时直接复用，不再复制出新的带时间戳的文件
+                # （清单中的 prompt_hash 在开始生成时已更新，所以按内容比对）
+                # 缓存文件可能正被其他线程按 LRU 淘汰，读取失败时当作未命中
+                card = self.manifest.get(filename_prefix, index)
+                previous = card["output_path"] if card else None
+                try:
+                    if previous and os.path.exists(previous) and filecmp.cmp(cached_path, previous, shallow=False):
+                        metrics.cache_hit = True
+                        print(f"\n✓ 图片 {index + 1} 命中缓存，沿用: {previous}")
+                        return previous
+                    with metrics.span("disk_write"):
+                        atomic_copy(cached_path, output_path)
+                        if self.store:
+                            output_path = self.store.put(output_path, filename_prefix, index)
+                except Exception as e:
+                    print(f"警告: 读取缓存图片失败（{e}），重新生成")
+                else:
+                    metrics.cache_hit = True
+                    print(f"\n✓ 图片 {index + 1} 命中缓存: {output_path}")
+                    return output_path
+        
+        if not self.endpoints:
+            print("错误: API key或API URL未配置，请在config.json中配置")
+            print(f"当前配置: {self.config}")
+            return None
         
         print(f"\n正在生成图片 {index + 1}...")
         print(f"提示词: {prompt[:100]}...")
         
-        # 构建请求
+        saved = self.hedged_request(prompt, model, size, quality, output_paths, metrics)
+        
+        if not saved:
+            return None
+        if self.store:
+            # 移入按内容寻址的图片仓库，内容相同的图片只保存一份
+            with metrics.span("disk_write"):
+                saved = [self.store.put(path, filename_prefix, index) for path in saved]
+        output_path = self.select_variant(saved, filename_prefix, index, metrics)
+        if not output_path:
+            return None
+        
+        if self.cache:
+            self.cache.put(cache_key, output_path, {
+                "prompt": prompt,
+                "model": model,
+                "size": size,
+                "quality": quality
+            })
+        
+        print(f"✓ 图片已保存: {output_path}")
+        return output_path
+    
+    def hedged_request(self, prompt, model, size, quality, output_paths, metrics):
+        """
+        发出请求；启用对冲且超过等待时间仍未完成时，再向（另一个）接口发一个相同的请求
+        
+        先成功的请求胜出，另一个请求收到响应后不再下载图片，已写入的文件会被删除。
+        
+        Returns:
+            成功保存的路径列表，失败返回空列表
+        
+        Raises:
+            ThrottledError: 所有请求都被限流
+        """
+        delay = self.hedging.start()
+        primary = self.endpoints.acquire(avoid=metrics.extra.get("endpoint"))
+        if delay is None:
+            metrics.extra["endpoint"] = primary.name
+            return self.attempt_request(primary, prompt, model, size, quality, output_paths, metrics)
+        
+        cancel = threading.Event()
+        attempts = {}
+        
+        def launch(endpoint, paths, hedge):
+            attempt_metrics = CardMetrics(metrics.deck, metrics.index)
+            attempt_metrics.extra["endpoint"] = endpoint.name
+            future = self.hedge_executor.submit(self.attempt_request, endpoint, prompt, model, size,
+                                                quality, paths, attempt_metrics, cancel)
+            attempts[future] = (attempt_metrics, hedge)
+        
+        launch(primary, output_paths, False)
+        done, _ = wait(attempts, timeout=delay)
+        if not done and self.hedging.try_spend():
+            avoid = primary.name if self.hedging.other_endpoint else None
+            endpoint = self.endpoints.try_acquire(avoid=avoid)
+            if endpoint:
+                print(f"  图片 {metrics.index + 1} 超过 {delay:.1f} 秒未完成，向接口 {endpoint.name} 发出对冲请求")
+                hedge_paths = [f"{root}_hedge{ext}" for root, ext in map(os.path.splitext, output_paths)]
+                launch(endpoint, hedge_paths, True)
+                metrics.extra["hedged"] = True
+            else:
+                self.hedging.refund()
+        
+        pending = set(attempts)
+        saved = []
+        winner = None
+        throttled = None
+        while pending and not saved:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except ThrottledError as e:
+                    throttled = e
+                    continue
+                if result and not saved:
+                    saved = result
+                    winner = future
+                    cancel.set()
+                elif result:
+                    self.discard_files(result)
+        
+        # 落后的请求结束后删除它写入的文件
+        for future in pending:
+            future.add_done_callback(self.discard_attempt)
+        
+        attempt_metrics, hedge = attempts[winner] if winner else next(iter(attempts.values()))
+        metrics.merge(attempt_metrics)
+        if winner and hedge:
+            self.hedging.record_win()
+            metrics.extra["hedge_won"] = True
+        if not saved and throttled:
+            raise throttled
+        return saved
+    
+    def attempt_request(self, endpoint, prompt, model, size, quality, output_paths, metrics, cancel=None):
+        """
+        在指定接口上发起一次请求，结束后归还接口并按结果更新它的健康状态
+        
+        Args:
+            cancel: 对冲请求的取消标志，已设置时收到响应后不再下载图片
+        
+        Returns:
+            成功保存的路径列表，失败返回空列表
+        
+        Raises:
+            ThrottledError: 接口返回 429/503
+        """
+        started = time.perf_counter()
+        api_time = metrics.spans.get("api_call", 0.0)
+        outcome = "failed"
+        retry_after = None
+        saved = []
+        try:
+            saved = self.request_image(endpoint, prompt, model, size, quality, output_paths,
+                                       metrics, cancel)
+            if saved:
+                outcome = "ok"
+                self.hedging.observe(time.perf_counter() - started)
+            elif cancel is not None and cancel.is_set():
+                outcome = "cancelled"
+        except ThrottledError as e:
+            outcome = "throttled"
+            retry_after = e.retry_after
+            raise
+        except requests.exceptions.RequestException as e:
+            print(f"错误: 请求异常: {e}")
+        except (IntegrityError, InlineImageError) as e:
+            print(f"错误: 图片下载不完整: {e}")
+        except Exception as e:
+            print(f"错误: 未知异常: {e}")
+        finally:
+            self.endpoints.release(endpoint, outcome, metrics.spans.get("api_call", 0.0) - api_time,
+                                   retry_after)
+        return saved
+    
+    @staticmethod
+    def discard_files(paths):
+        """删除被对冲请求淘汰的图片"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    @classmethod
+    def discard_attempt(cls, future):
+        """落后的对冲请求结束时的回调"""
+        if future.exception() is None:
+            cls.discard_files(future.result())
+    
+    def request_image(self, endpoint, prompt, model, size, quality, output_paths, metrics, cancel=None):
+        """
+        向指定接口发起一次生成请求并保存返回的图片
+        
+        Args:
+            cancel: 对冲请求的取消标志，已设置时不再下载图片
+        
+        Returns:
+            成功保存的路径列表，失败返回空列表
+        
+        Raises:
+            ThrottledError: 接口返回 429/503
+        """
+        model = endpoint.model or model
+        response_format = endpoint.response_format or self.config.get("response_format", "url")
+        headers, data = self.build_request(endpoint.api_key, response_format, prompt, model,
+                                           size, quality, len(output_paths))
+        
+        # 发送请求；内联图片格式下响应体就是图片，需要流式读取
+        with metrics.span("api_call"):
+            response = self.session.post(endpoint.api_url, headers=headers, json=data,
+                                         stream=(response_format != "url"),
+                                         timeout=self.http_config["timeout"])
+        metrics.retries += self.retry_count(response)
+        
+        with response:
+            print(f"状态码: {response.status_code}")
+            if self.debug:
+                print(f"响应头: {dict(response.headers)}")
+                print(f"响应内容类型: {response.headers.get('Content-Type', 'unknown')}")
+                if response_format == "url":
+                    print(f"响应内容（前500字符）: {response.text[:500]}")
+            
+            if response.status_code in THROTTLE_STATUS_CODES:
+                raise ThrottledError(response.status_code, parse_retry_after(
+                    response.headers.get("Retry-After"), self.rate_config["default_retry_after"]
+                ))
+            
+            if response.status_code != 200:
+                print(f"错误: API调用失败，状态码: {response.status_code}")
+                print(f"响应内容: {response.text}")
+                return []
+            
+            if cancel is not None and cancel.is_set():
+                return []
+            
+            if response_format == "url":
+                return self.save_from_url(response, output_paths, metrics)
+            return self.save_inline(response, output_paths, metrics, response_format)
+    
+    def build_request(self, api_key, response_format, prompt, model, size, quality, n=1):
+        """
+        按 response_format 构造请求头和请求体
+        
+        Args:
+            api_key: 接口密钥
+            response_format: "url"、"b64_json" 或 "gemini"
+            n: 一次请求生成的候选图片数量
+        
+        Returns:
+            (headers, data)
+        """
+        if response_format == "gemini":
+            headers = {
+                "x-goog-api-key": api_key,
+                "Content-Type": "application/json"
+            }
+            data = {
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {"responseModalities": ["IMAGE"]}
+            }
+            if n > 1:
+                data["generationConfig"]["candidateCount"] = n
+            return headers, data
+        
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        
         data = {
             "prompt": prompt,
             "model": model,
-            "size": "1024x1024",
-            "quality": "standard"
+            "size": size,
+            "quality": quality
         }
+        if n > 1:
+            data["n"] = n
+        if response_format == "b64_json":
+            data["response_format"] = "b64_json"
+        return headers, data
+    
+    def save_from_url(self, response, output_paths, metrics):
+        """
+        解析响应中的图片URL并逐张流式下载
         
+        Args:
+            output_paths: 候选图片的保存路径，响应中的第 k 张图片写入第 k 个路径
+        
+        Returns:
+            成功保存的路径列表
+        """
         try:
-            # 发送请求
-            response = requests.post(api_url, headers=headers, json=data, timeout=60)
-            
-            print(f"状态码: {response.status_code}")
-            print(f"响应头: {dict(response.headers)}")
-            print(f"响应内容类型: {response.headers.get('Content-Type', 'unknown')}")
-            print(f"响应内容（前500字符）: {response.text[:500]}")
+            with metrics.span("encode"):
+                result = response.json()
+        except json.JSONDecodeError as e:
+            print(f"错误: 无法解析JSON响应: {e}")
+            print(f"完整响应内容: {response.text}")
+            return []
+        
+        # 根据API响应格式提取图片URL
+        # 这里需要根据实际API文档调整
+        if "data" not in result or len(result["data"]) == 0:
+            print("错误: 响应格式不正确")
+            print(f"响应内容: {result}")
+            return []
+        
+        saved = []
+        error = None
+        for k, (item, output_path) in enumerate(zip(result["data"], output_paths)):
+            image_url = item.get("url")
+            if not image_url:
+                print("错误: 响应中没有图片URL")
+                print(f"响应内容: {result}")
+                continue
             
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                except json.JSONDecodeError as e:
-                    print(f"错误: 无法解析JSON响应: {e}")
-                    print(f"完整响应内容: {response.text}")
-                    return None
-                
-                # 根据API响应格式提取图片URL
-                # 这里需要根据实际API文档调整
-                if "data" in result and len(result["data"]) > 0:
-                    image_url = result["data"][0].get("url")
-                    
-                    if image_url:
-                        # 下载图片
-                        img_response = requests.get(image_url, timeout=30)
-                        img_response.raise_for_status()
-                        
-                        # 保存图片
-                        with open(output_path, 'wb') as f:
-                            f.write(img_response.content)
-                        
-                        print(f"✓ 图片已保存: {output_path}")
-                        return output_path
-                    else:
-                        print("错误: 响应中没有图片URL")
-                        print(f"响应内容: {result}")
-                        return None
-                else:
-                    print("错误: 响应格式不正确")
-                    print(f"响应内容: {result}")
-                    return None
-            else:
-                print(f"错误: API调用失败，状态码: {response.status_code}")
-                print(f"响应内容: {response.text}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            print(f"错误: 请求异常: {e}")
+            # 流式下载图片，写入临时文件并校验后再原子重命名
+            # 一张候选下载失败时继续下载其余候选，只要有一张成功这次请求就算成功
+            try:
+                download_started = time.perf_counter()
+                with self.session.get(image_url, stream=True,
+                                      timeout=self.http_config["download_timeout"]) as img_response:
+                    metrics.add("download", time.perf_counter() - download_started)
+                    metrics.retries += self.retry_count(img_response)
+                    img_response.raise_for_status()
+                    self.write_stream(
+                        img_response.iter_content(self.http_config["chunk_size"]),
+                        output_path, metrics,
+                        expected_size=self.expected_content_length(img_response)
+                    )
+            except (requests.exceptions.RequestException, IntegrityError) as e:
+                error = e
+                if len(output_paths) > 1:
+                    print(f"警告: 候选图片 {k + 1} 下载失败: {e}")
+                continue
+            saved.append(output_path)
+        if not saved and error is not None:
+            raise error
+        return saved
+    
+    def save_inline(self, response, output_paths, metrics, response_format):
+        """
+        内联base64图片：边读响应边解码写盘，省去第二次下载
+        
+        Returns:
+            成功保存的路径列表
+        """
+        values = InlineImageScanner(
+            response.iter_content(self.http_config["chunk_size"]), response_format
+        ).values()
+        saved = []
+        try:
+            for encoded, output_path in zip(values, output_paths):
+                self.write_stream(decode_base64_stream(encoded), output_path, metrics)
+                saved.append(output_path)
+        except (requests.exceptions.RequestException, IntegrityError, InlineImageError) as e:
+            # 响应流在这里中断，后面的候选无法再读取；已保存的候选仍然可用
+            if not saved:
+                raise
+            print(f"警告: 候选图片 {len(saved) + 1} 解码失败，只使用前 {len(saved)} 张: {e}")
+        if not saved:
+            print("错误: 响应中没有内联图片数据")
+        return saved
+    
+    def select_variant(self, saved, filename_prefix, index, metrics):
+        """
+        只有一张图片时直接使用；多张候选时本地打分选出默认图片，并把全部候选记入任务清单
+        
+        Returns:
+            选中的图片路径
+        """
+        if len(saved) == 1:
+            return saved[0]
+        
+        with metrics.span("score"):
+            scored = score_variants(saved, self.variant_config["blank_threshold"],
+                                    self.variant_config["duplicate_distance"])
+            best = pick_best(scored)
+        if best is None:
             return None
-        except Exception as e:
-            print(f"错误: 未知异常: {e}")
+        
+        self.manifest.record_variants(filename_prefix, index, scored)
+        rejected = sum(1 for variant in scored if variant["rejected"])
+        print(f"  共 {len(saved)} 张候选，选用第 {best + 1} 张（淘汰 {rejected} 张）")
+        return saved[best]
+    
+    @staticmethod
+    def write_stream(chunks, output_path, metrics, expected_size=None, verify_image=True):
+        """
+        原子写入数据流，等待数据的时间记为 download，其余时间记为 disk_write
+        
+        Returns:
+            写入的字节数
+        """
+        download_before = metrics.spans.get("download", 0.0)
+        started = time.perf_counter()
+        written = atomic_write_chunks(metrics.timed_chunks(chunks), output_path,
+                                      expected_size=expected_size, verify_image=verify_image)
+        download_time = metrics.spans.get("download", 0.0) - download_before
+        metrics.add("disk_write", time.perf_counter() - started - download_time)
+        return written
+    
+    @staticmethod
+    def retry_count(response):
+        """返回 urllib3 为这次请求自动重试的次数"""
+        retries = getattr(response.raw, "retries", None)
+        return len(retries.history) if retries is not None else 0
+    
+    @staticmethod
+    def expected_content_length(response):
+        """
+        读取响应的 Content-Length，用于校验下载是否完整
+
+        启用了 Content-Encoding 压缩时，解压后的字节数与该值不同，返回None不做校验
+        """
+        length = response.headers.get("Content-Length")
+        if not length or response.headers.get("Content-Encoding", "identity") != "identity":
+            return None
+        try:
+            return int(length)
+        except ValueError:
             return None
     
+    def run_jobs(self, jobs, filename_prefix="card", on_card_done=None):
+        """
+        并发执行一组生成任务
+
+        同时进行的请求数由 self.controller（AdaptiveController）按 AIMD 调整：从配置 max_workers 开始，
+        接口健康时逐步增加到 rate_control.max_concurrency，遇到 429/503、失败或延迟超标时减半。
+        被限流的卡片按 Retry-After 暂停后重新排队，而不是直接算作失败。
+        每个请求从接口池（self.endpoints）中选最空闲的健康接口发出，使用的接口记入任务清单；
+        配置了多个接口时，失败的卡片会换一个接口重新排队。
+        请求发起速率另受 self.limiter（配置 requests_per_second，0 表示不限）限制。
+        控制器和限速器在同一个生成器的所有批次之间共用，多个线程同时调用本方法时合计不超过配置。
+        单张卡片失败不会中断整个批次，失败的卡片在返回值中为 None。
+        每张卡片完成后立即写入任务清单（deck 为 filename_prefix），
+        各阶段耗时记录在本批次的 MetricsRecorder 中，批次结束时输出汇总。
+        提供 on_card_done 时，每张卡片有了最终结果就在调度线程中调用一次（pipeline.py 用它把
+        图片交给后续阶段）；回调阻塞时调度暂停，不再发出新请求。
+
+        Args:
+            jobs: (卡片序号, 提示词) 列表
+            filename_prefix: 文件名前缀
+            on_card_done: 回调 on_card_done(卡片序号, 图片路径或None)
+
+        Returns:
+            {卡片序号: 图片文件路径或None} 字典
+        """
+        limiter = self.limiter
+        controller = self.controller
+        rate_config = self.rate_config
+        metrics_config = self.config.get("metrics", {})
+        # 每个批次使用自己的指标记录器，多个批次可以在不同线程中同时运行（如 worker.py）
+        recorder = MetricsRecorder(metrics_config.get("file", "metrics.jsonl"))
+
+        def run_one(index, prompt, card_metrics):
+            try:
+                return attempt(index, prompt, card_metrics)
+            finally:
+                controller.release_slot()
+
+        def attempt(index, prompt, card_metrics):
+            limiter.acquire()
+            card_metrics.add("queue_wait", time.perf_counter() - card_metrics.created)
+            prompt_hash = self.prompt_hash(prompt)
+            self.manifest.mark_running(filename_prefix, index, prompt_hash)
+            started = time.monotonic()
+            api_time = card_metrics.spans.get("api_call", 0.0)
+            try:
+                path = self.generate_image(prompt, filename_prefix, index, card_metrics=card_metrics)
+            except ThrottledError as e:
+                # 还有其他健康接口时不必整体暂停，被限流的接口已在接口池中摘除
+                controller.on_throttle(started, 0.0 if self.endpoints.has_healthy() else e.retry_after)
+                requeues = card_metrics.extra.get("requeues", 0)
+                if requeues < rate_config["max_requeues"]:
+                    print(f"卡片 {index + 1} 被限流（{e}），重新排队")
+                    card_metrics.extra["requeues"] = requeues + 1
+                    self.manifest.mark_pending(filename_prefix, index, prompt_hash, str(e))
+                    return REQUEUE
+                print(f"错误: 卡片 {index + 1} 多次被限流，放弃")
+                self.manifest.mark_failed(filename_prefix, index, prompt_hash, str(e))
+                recorder.finish(card_metrics, "failed")
+                return None
+            except Exception as e:
+                print(f"错误: 卡片 {index + 1} 生成异常: {e}")
+                controller.on_error(started)
+                self.manifest.mark_failed(filename_prefix, index, prompt_hash, str(e))
+                recorder.finish(card_metrics, "failed")
+                return None
+            if path:
+                if not card_metrics.cache_hit:
+                    controller.on_success(started, card_metrics.spans.get("api_call", 0.0) - api_time)
+                self.manifest.mark_done(filename_prefix, index, prompt_hash, path,
+                                        card_metrics.extra.get("endpoint"))
+                recorder.finish(card_metrics, "ok")
+                return path
+
+            controller.on_error(started)
+            # 有多个接口时换一个接口重试
+            requeues = card_metrics.extra.get("requeues", 0)
+            endpoint = card_metrics.extra.get("endpoint")
+            if endpoint and len(self.endpoints.endpoints) > 1 and requeues < rate_config["max_requeues"]:
+                print(f"卡片 {index + 1} 在接口 {endpoint} 上失败，换接口重新排队")
+                card_metrics.extra["requeues"] = requeues + 1
+                self.manifest.mark_pending(filename_prefix, index, prompt_hash, f"接口 {endpoint} 失败")
+                return REQUEUE
+            self.manifest.mark_failed(filename_prefix, index, prompt_hash)
+            recorder.finish(card_metrics, "failed")
+            return None
+
+        outcome = {}
+        pending = [(index, prompt, recorder.start_card(filename_prefix, index)) for index, prompt in jobs]
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=controller.max_concurrency) as executor:
+            while pending or running:
+                pause = controller.pause_remaining()
+                while pending and not pause and controller.acquire_slot():
+                    job = pending.pop(0)
+                    running[executor.submit(run_one, *job)] = job
+
+                if not running:
+                    # 名额被其他批次占满时等它们归还
+                    if pause:
+                        time.sleep(pause)
+                    else:
+                        controller.wait_for_slot(timeout=1.0)
+                    continue
+
+                done, _ = wait(running, timeout=pause or None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    result = future.result()
+                    if result is REQUEUE:
+                        # 重新排在队首，排队时间从现在重新计算
+                        job[2].created = time.perf_counter()
+                        pending.insert(0, job)
+                    else:
+                        outcome[job[0]] = result
+                        if on_card_done:
+                            on_card_done(job[0], result)
+
+        recorder.print_summary()
+        self.endpoints.print_summary()
+        self.hedging.print_summary()
+        if metrics_config.get("prometheus_file"):
+            recorder.write_prometheus(metrics_config["prometheus_file"])
+
+        failed_indices = sorted(i for i, path in outcome.items() if not path)
+        if failed_indices:
+            print(f"\n警告: 以下卡片生成失败: {[i + 1 for i in failed_indices]}")
+
+        return outcome
+
     def generate_batch(self, prompts, filename_prefix="card"):
         """
         批量生成图片
@@ -139,51 +737,30 @@ class ImageGenerator:
             filename_prefix: 文件名前缀
         
         Returns:
-            生成的图片文件路径列表
+            生成成功的图片文件路径列表（按提示词顺序）
         """
-        results = []
-        
-        for i, prompt in enumerate(prompts):
-            result = self.generate_image(prompt, filename_prefix, i)
-            if result:
-                results.append(result)
-            
-            # 避免请求过于频繁
-            if i < len(prompts) - 1:
-                time.sleep(1)
-        
-        return results
-
+        outcome = self.run_jobs(list(enumerate(prompts)), filename_prefix)
+        return [outcome[i] for i in range(len(prompts)) if outcome.get(i)]
 
 def main():
     """主函数"""
     generator = ImageGenerator()
     
-    # 定义所有卡片的提示词
-    prompts = [
-        "封面: A powerful, thought-provoking illustration showing a concerned parent looking at a child, with AI neural networks and digital transformation elements in the background. The scene represents the challenge of raising children in the AI era. Modern, clean, illustrative style with warm lighting. Full-bleed image with no borders or frames.",
-        
-        "卡片1: A dramatic visual showing traditional university diplomas, professional symbols (stethoscope, calculator, gavel, code) dissolving into digital particles, with a glowing AI neural network emerging. Represents how AI is disrupting traditional professions. Modern infographic style, clean composition. Full-bleed image with no borders or frames.",
-        
-        "卡片2: A powerful visual metaphor: a crowd of identical gray silhouettes standing together, with one vibrant, colorful, unique figure standing apart and glowing with energy. The unique figure is surrounded by small icons representing diverse skills and experiences. Illustrates how uniqueness beats conformity in AI era. Modern, clean, illustrative style. Full-bleed image with no borders or frames.",
-        
-        "卡片3: A young artisan carefully crafting a detailed miniature house model with tiny furniture and decorations. The scene shows the craftsmanship and creativity of a micro-landscape designer creating personalized memory pieces. Warm lighting, detailed workbench with tools. Modern, clean, illustrative style. Full-bleed image with no borders or frames.",
-        
-        "卡片4: A diverse group of people from different professions (teacher, security guard, chef, engineer, artist) connecting with a child through glowing lines of communication. Shows how diverse human connections expand a child's world. Warm, inviting atmosphere. Modern, clean, illustrative style. Full-bleed image with no borders or frames.",
-        
-        "卡片5: Students in a modern workshop working on real-world projects, creating prototypes and products. Shows the journey from idea to market launch with flowchart elements and arrows. Represents 'entrepreneurship from day one' education. Dynamic, energetic scene. Modern, clean, illustrative style. Full-bleed image with no borders or frames.",
-        
-        "卡片6: A child holding a smartphone with a glowing rulebook and digital keys floating around. Shows establishing a relationship with technology through rules and boundaries. A balance between freedom and structure. Warm, educational atmosphere. Modern, clean, illustrative style. Full-bleed image with no borders or frames."
-    ]
+    # 从卡组描述文件读取所有卡片的提示词
+    deck = load_deck()
+    deck_name = deck["filename_prefix"]
+    prompts = [card["prompt"] for card in deck["cards"]]
     
     print("=" * 60)
     print("开始批量生成图片")
     print("=" * 60)
     
-    results = generator.generate_batch(prompts, filename_prefix="card")
+    results = generator.generate_batch(prompts, filename_prefix=deck_name)
     
     print("\n" + "=" * 60)
     print(f"生成完成！共生成 {len(results)} 张图片")
+    if len(results) < len(prompts):
+        print(f"失败 {len(prompts) - len(results)} 张（序号见上方警告）")
     print("=" * 60)
     
     # 输出所有生成的图片路径
@@ -191,11 +768,16 @@ def main():
     for i, path in enumerate(results, 1):
         print(f"{i}. {path}")
     
-    # 生成图片列表文件
-    with open("image_list.json", 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    # 从任务清单导出图片列表文件
+    all_images = generator.manifest.export_image_list(deck_name, "image_list.json", len(prompts))
+    generator.close()
     
     print("\n图片列表已保存到: image_list.json")
+    
+    # 生成压缩格式的派生图片
+    optimize_config = get_optimize_config(generator.config)
+    if optimize_config["enabled"]:
+        optimize_images(all_images, optimize_config)
 
 
 if __name__ == "__main__":
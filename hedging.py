@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+对冲请求：一张卡片的生成时间超过最近延迟的某个分位数时，再发一个相同的请求，取先完成的结果
+
+- 延迟样本取最近 window 次成功请求（从发出请求到图片写盘）的耗时
+- 样本不足 min_samples 时不对冲；对冲等待时间不小于 min_delay 秒
+- 对冲请求数不超过普通请求数的 budget 比例，避免接口整体变慢时请求量翻倍
+"""
+
+import threading
+from collections import deque
+
+from metrics import percentile
+
+
+DEFAULT_HEDGING_CONFIG = {
+    "enabled": False,
+    "percentile": 95,
+    "min_samples": 10,
+    "min_delay": 5.0,
+    "budget": 0.1,
+    "window": 200,
+    "other_endpoint": True
+}
+
+
+def get_hedging_config(config):
+    """合并默认值与 config.json 中的 hedging 配置"""
+    hedging_config = dict(DEFAULT_HEDGING_CONFIG)
+    hedging_config.update(config.get("hedging", {}))
+    return hedging_config
+
+
+class HedgePolicy:
+    """线程安全的对冲策略：记录延迟样本、计算对冲等待时间、控制对冲预算"""
+
+    def __init__(self, enabled=False, percentile=95, min_samples=10, min_delay=5.0,
+                 budget=0.1, window=200, other_endpoint=True):
+        """
+        Args:
+            enabled: 是否启用对冲
+            percentile: 超过该分位数的延迟时发出对冲请求
+            min_samples: 至少有多少个样本才开始对冲
+            min_delay: 对冲等待时间的下限（秒）
+            budget: 对冲请求数占普通请求数的比例上限
+            window: 保留的最近样本数
+            other_endpoint: 对冲请求是否尽量发给另一个接口
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = budget
+        self.other_endpoint = other_endpoint
+        self.samples = deque(maxlen=window)
+        self.stats = {"requests": 0, "hedged": 0, "hedge_won": 0}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """记录一次成功请求的耗时"""
+        with self._lock:
+            self.samples.append(seconds)
+
+    def start(self):
+        """
+        开始一次普通请求
+
+        Returns:
+            对冲等待时间（秒），不对冲时返回None
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            if not self.enabled or len(self.samples) < self.min_samples:
+                return None
+            return max(self.min_delay, percentile(list(self.samples), self.percentile))
+
+    def try_spend(self):
+        """预算允许时记一次对冲请求并返回True"""
+        with self._lock:
+            if self.stats["hedged"] + 1 > self.budget * self.stats["requests"]:
+                return False
+            self.stats["hedged"] += 1
+            return True
+
+    def refund(self):
+        """没能发出的对冲请求退回预算"""
+        with self._lock:
+            self.stats["hedged"] -= 1
+
+    def record_win(self):
+        """对冲请求先于原请求完成"""
+        with self._lock:
+            self.stats["hedge_won"] += 1
+
+    def print_summary(self):
+        """输出对冲统计（未启用时不输出）"""
+        if not self.enabled:
+            return
+        stats = self.stats
+        print(f"\n对冲请求: {stats['hedged']}/{stats['requests']}，其中 {stats['hedge_won']} 次先完成")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+共享的HTTP会话：连接池、keep-alive 以及带抖动的指数退避重试
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# 429/503 不在自动重试之列，交给 rate_control 的自适应控制器处理（降并发、按 Retry-After 暂停后重新排队）
+DEFAULT_HTTP_CONFIG = {
+    "pool_connections": 4,
+    "pool_size": 10,
+    "max_retries": 3,
+    "backoff_factor": 0.5,
+    "backoff_jitter": 0.5,
+    "status_forcelist": [500, 502, 504],
+    "timeout": 60,
+    "download_timeout": 30,
+    "chunk_size": 64 * 1024
+}
+
+
+def get_http_config(config):
+    """
+    合并默认值与 config.json 中的 http 配置
+
+    Args:
+        config: 完整配置字典
+
+    Returns:
+        http 配置字典
+    """
+    http_config = dict(DEFAULT_HTTP_CONFIG)
+    http_config.update(config.get("http", {}))
+    # 连接池至少要容纳所有并发请求，否则多出的请求会新建并丢弃连接
+    http_config["pool_size"] = max(http_config["pool_size"], int(config.get("max_workers", 4)))
+    return http_config
+
+
+def create_session(config):
+    """
+    创建长连接复用的 requests.Session
+
+    生成接口与图片下载共用同一个会话，连接在请求之间保持 keep-alive，按指数退避（带抖动）自动重试：
+    连接错误（请求尚未发出）对所有方法重试；读取超时和 5xx 只对 GET（图片下载）重试。
+    生成接口的 POST 不是幂等的，请求已经发出后再自动重发可能重复生成并计费，
+    这类失败交给 run_jobs 的重新排队和自适应并发控制处理。
+
+    Args:
+        config: 完整配置字典
+
+    Returns:
+        requests.Session 实例
+    """
+    http_config = get_http_config(config)
+    max_retries = http_config["max_retries"]
+
+    # backoff_jitter 是 urllib3 2.x 的原生参数：在指数退避时间上叠加 0~jitter 秒的随机值
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=http_config["backoff_factor"],
+        backoff_jitter=http_config["backoff_jitter"],
+        status_forcelist=http_config["status_forcelist"],
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=http_config["pool_connections"],
+        pool_maxsize=http_config["pool_size"],
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
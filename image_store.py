@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的图片仓库：去重、近似重复检测、版本记录和垃圾回收
+
+- 图片按 sha256 存放在 store.dir/<前两位>/<哈希>.<扩展名>，内容相同的图片只保存一份
+- 每张图片记录差值哈希（dHash），与已有图片汉明距离不超过 store.duplicate_distance 时提示近似重复
+- 每张卡片生成过的每个版本都记录在 versions 表中（与任务清单同一个数据库）
+- 垃圾回收保留：任务清单当前引用的图片（含候选图片）、每张卡片除当前图片外最近的 keep_versions 个旧版本、
+  以及 min_age_days 天内入库的图片，其余连同派生图片一起删除
+
+导入和垃圾回收前会先从 image_list.json（或图片目录）初始化任务清单，
+任务清单中没有记录的卡组拒绝回收，避免把仍在使用的图片当作无人引用删除。
+
+用法:
+    python3 image_store.py import            # 把 images/ 中的旧图片导入仓库，并更新任务清单
+    python3 image_store.py duplicates        # 列出近似重复的图片
+    python3 image_store.py gc --dry-run      # 查看垃圾回收会删除哪些图片
+    python3 image_store.py gc                # 执行垃圾回收
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from atomic_io import atomic_copy, atomic_write_text, detect_image_type, iter_file_chunks
+from build import deck_prompt_hashes
+from job_manifest import JobManifest
+from optimize_images import get_optimize_config, load_derivatives
+from render_deck import load_deck
+from select_variant import Image, difference_hash
+
+
+DEFAULT_STORE_CONFIG = {
+    "enabled": True,
+    "dir": "images/store",
+    "keep_versions": 1,
+    "min_age_days": 7,
+    "duplicate_distance": 4
+}
+
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif"
+}
+
+# generate_images.py 生成的文件名：<卡组>_<序号>_<日期>_<时间>[_v<候选序号>].<扩展名>，
+# 卡组名本身可以包含下划线，所以从后往前匹配固定的后缀
+FILENAME_PATTERN = re.compile(r"^(?P<deck>.+)_(?P<idx>\d+)_\d{8}_\d{6}(?:_v\d+)?\.\w+$")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        phash TEXT,
+        duplicate_of TEXT,
+        created_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS versions (
+        deck TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        hash TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (deck, idx, hash)
+    )
+    """
+]
+
+
+def get_store_config(config):
+    """合并默认值与 config.json 中的 store 配置"""
+    store_config = dict(DEFAULT_STORE_CONFIG)
+    store_config.update(config.get("store", {}))
+    return store_config
+
+
+def content_hash(path):
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    for chunk in iter_file_chunks(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(path):
+    """
+    计算图片的64位差值哈希
+
+    Returns:
+        16位十六进制字符串，未安装 Pillow 或无法读取时返回None
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return f"{difference_hash(image.convert('L')):016x}"
+    except OSError:
+        return None
+
+
+def hamming(a, b):
+    """两个十六进制哈希的汉明距离"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class ImageStore:
+    """线程安全的图片仓库"""
+
+    def __init__(self, db_path="manifest.sqlite3", store_dir="images/store", duplicate_distance=4):
+        """
+        Args:
+            db_path: SQLite数据库文件路径（通常与任务清单相同）
+            store_dir: 图片存放目录
+            duplicate_distance: dHash 汉明距离不超过该值视为近似重复，< 0 表示不检测
+        """
+        self.store_dir = store_dir
+        self.duplicate_distance = duplicate_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    @classmethod
+    def from_config(cls, config):
+        """按 config.json 创建仓库，store.enabled 为 false 时返回None"""
+        store_config = get_store_config(config)
+        if not store_config["enabled"]:
+            return None
+        return cls(config.get("manifest_file", "manifest.sqlite3"), store_config["dir"],
+                   store_config["duplicate_distance"])
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def blob_path(self, digest, ext):
+        """内容哈希对应的存放路径"""
+        return os.path.join(self.store_dir, digest[:2], digest + ext)
+
+    def find_duplicate(self, digest, phash):
+        """
+        查找与 phash 近似的已有图片
+
+        Returns:
+            最相似图片的内容哈希，没有时返回None
+        """
+        if phash is None or self.duplicate_distance < 0:
+            return None
+        best = None
+        for row in self._conn.execute("SELECT hash, phash FROM blobs WHERE phash IS NOT NULL AND hash != ?",
+                                      (digest,)):
+            distance = hamming(phash, row["phash"])
+            if distance <= self.duplicate_distance and (best is None or distance < best[0]):
+                best = (distance, row["hash"])
+        return best[1] if best else None
+
+    def put(self, path, deck=None, idx=None, move=True):
+        """
+        把图片放入仓库
+
+        Args:
+            path: 图片路径
+            deck: 卡组名，与 idx 一起记录为该卡片的一个版本
+            idx: 卡片序号
+            move: True 时移动文件（内容已存在时直接删除），False 时复制
+
+        Returns:
+            仓库中的图片路径
+        """
+        digest = content_hash(path)
+        with open(path, 'rb') as f:
+            ext = EXTENSIONS.get(detect_image_type(f.read(16)), os.path.splitext(path)[1])
+        target = self.blob_path(digest, ext)
+
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row and os.path.exists(row["path"]):
+                target = row["path"]
+                if move and os.path.abspath(path) != os.path.abspath(target):
+                    os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if move:
+                    os.replace(path, target)
+                else:
+                    atomic_copy(path, target)
+                phash = perceptual_hash(target)
+                duplicate_of = self.find_duplicate(digest, phash)
+                if duplicate_of:
+                    print(f"提示: {target} 与已有图片 {duplicate_of[:12]} 近似重复")
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO blobs (hash, path, size, phash, duplicate_of, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (digest, target, os.path.getsize(target), phash, duplicate_of, time.time())
+                    )
+
+            if deck is not None and idx is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO versions (deck, idx, hash, created_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (deck, idx, hash) DO UPDATE SET created_at = excluded.created_at",
+                        (deck, idx, digest, time.time())
+                    )
+        return target
+
+    def decks(self):
+        """仓库中记录过版本的卡组名集合"""
+        with self._lock:
+            return {row["deck"] for row in self._conn.execute("SELECT DISTINCT deck FROM versions")}
+
+    def duplicates(self):
+        """
+        列出近似重复的图片
+
+        Returns:
+            [(图片路径, 相似的已有图片路径)] 列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT a.path AS path, b.path AS original FROM blobs a "
+                "JOIN blobs b ON a.duplicate_of = b.hash ORDER BY a.created_at"
+            ).fetchall()
+        return [(row["path"], row["original"]) for row in rows]
+
+    def collect_garbage(self, referenced_paths, keep_versions=1, min_age_days=7, dry_run=False):
+        """
+        删除不再需要的图片
+
+        Args:
+            referenced_paths: 当前被引用的图片路径集合
+            keep_versions: 除当前引用的图片外，每张卡片再保留最近几个旧版本（用于回退）
+            min_age_days: 入库不满该天数的图片不删除
+            dry_run: 只返回将被删除的图片，不实际删除
+
+        Returns:
+            [(图片路径, 字节数)] 被删除（或将被删除）的图片列表
+        """
+        referenced = {os.path.abspath(path) for path in referenced_paths}
+        cutoff = time.time() - min_age_days * 86400
+
+        with self._lock:
+            paths = {row["hash"]: os.path.abspath(row["path"])
+                     for row in self._conn.execute("SELECT hash, path FROM blobs")}
+            retained = set()
+            history = {}
+            for row in self._conn.execute("SELECT * FROM versions ORDER BY created_at DESC"):
+                if paths.get(row["hash"]) in referenced:
+                    continue
+                versions = history.setdefault((row["deck"], row["idx"]), [])
+                if len(versions) < keep_versions:
+                    versions.append(row["hash"])
+                    retained.add(row["hash"])
+
+            garbage = [
+                row for row in self._conn.execute("SELECT * FROM blobs").fetchall()
+                if row["hash"] not in retained
+                and row["created_at"] < cutoff
+                and os.path.abspath(row["path"]) not in referenced
+            ]
+            if dry_run:
+                return [(row["path"], row["size"]) for row in garbage]
+
+            with self._conn:
+                for row in garbage:
+                    if os.path.exists(row["path"]):
+                        os.remove(row["path"])
+                    self._conn.execute("DELETE FROM blobs WHERE hash = ?", (row["hash"],))
+                    self._conn.execute("DELETE FROM versions WHERE hash = ?", (row["hash"],))
+                    self._conn.execute("UPDATE blobs SET duplicate_of = NULL WHERE duplicate_of = ?",
+                                       (row["hash"],))
+        return [(row["path"], row["size"]) for row in garbage]
+
+
+def referenced_paths(manifest, image_list_file=None):
+    """任务清单中所有卡片当前使用的图片和候选图片，以及 image_list.json 中列出的图片"""
+    paths = set()
+    if image_list_file and os.path.exists(image_list_file):
+        with open(image_list_file, 'r', encoding='utf-8') as f:
+            paths.update(path for path in json.load(f) if path)
+    for card in manifest.all_cards():
+        if card["output_path"]:
+            paths.add(card["output_path"])
+        for variant in json.loads(card["variants"]) if card["variants"] else []:
+            paths.add(variant["path"])
+    return paths
+
+
+def prune_derivatives(removed_paths, derivatives_file):
+    """
+    删除已回收图片的派生图片，并更新 derivatives.json
+
+    Returns:
+        删除的派生图片数量
+    """
+    derivatives = load_derivatives(derivatives_file)
+    removed = 0
+    for path in removed_paths:
+        entry = derivatives.pop(path, None)
+        if not entry:
+            continue
+        for fmt, widths in entry.items():
+            if fmt == "placeholder":
+                continue
+            for derived in widths.values():
+                if os.path.exists(derived):
+                    os.remove(derived)
+                    removed += 1
+    if removed_paths and os.path.exists(derivatives_file):
+        atomic_write_text(derivatives_file, json.dumps(derivatives, indent=2, ensure_ascii=False))
+    return removed
+
+
+def import_output_dir(store, manifest, output_dir, image_list_file=None):
+    """
+    把输出目录中的旧图片导入仓库
+
+    文件名形如 <卡组>_<序号>_<时间戳>.png（见 FILENAME_PATTERN），按时间戳顺序记录为该卡片的各个版本；
+    任务清单中引用这些文件的记录改为指向仓库中的路径。
+
+    Returns:
+        导入的文件数量
+    """
+    moved = {}
+    for filename in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        match = FILENAME_PATTERN.match(filename)
+        if not match:
+            continue
+        moved[path] = store.put(path, match.group("deck"), int(match.group("idx")))
+
+    for card in manifest.all_cards():
+        target = moved.get(card["output_path"])
+        if target:
+            manifest.mark_done(card["deck"], card["idx"], card["prompt_hash"], target, card["endpoint"])
+        if card["variants"]:
+            variants = json.loads(card["variants"])
+            for variant in variants:
+                variant["path"] = moved.get(variant["path"], variant["path"])
+            manifest.record_variants(card["deck"], card["idx"], variants)
+
+    if image_list_file and os.path.exists(image_list_file):
+        with open(image_list_file, 'r', encoding='utf-8') as f:
+            image_paths = json.load(f)
+        image_paths = [moved.get(path, path) if path else None for path in image_paths]
+        atomic_write_text(image_list_file, json.dumps(image_paths, indent=2, ensure_ascii=False))
+    return len(moved)
+
+
+def bootstrap_manifest(manifest, config, deck_file="deck.json", image_list_file="image_list.json"):
+    """
+    任务清单中还没有当前卡组时，先从 image_list.json 或图片目录导入
+
+    只用 image_list.json 生成页面、还没有运行过生成脚本的项目，任务清单是空的；
+    不先导入的话，导入会丢掉 image_list.json 与卡片的对应关系，垃圾回收也会把在用的图片当作垃圾。
+
+    Returns:
+        导入的卡片数量
+    """
+    if not os.path.exists(deck_file):
+        return 0
+    deck = load_deck(deck_file)
+    deck_name = deck["filename_prefix"]
+    return manifest.bootstrap(deck_name, config.get("output_dir", "images"), deck_name, image_list_file,
+                              deck_prompt_hashes(config, deck))
+
+
+def untracked_decks(store, manifest):
+    """仓库中有版本记录、任务清单中却没有任何卡片的卡组"""
+    tracked = {card["deck"] for card in manifest.all_cards()}
+    return sorted(store.decks() - tracked)
+
+
+def collect_store_garbage(store, manifest, image_list_file="image_list.json", keep_versions=1,
+                          min_age_days=7, dry_run=False):
+    """
+    按任务清单和 image_list.json 的引用回收仓库中的图片
+
+    Returns:
+        collect_garbage 的结果；有卡组不在任务清单中时拒绝回收，返回None
+    """
+    missing = untracked_decks(store, manifest)
+    if missing:
+        print(f"错误: 任务清单中没有卡组 {', '.join(missing)} 的记录，无法判断哪些图片仍在使用，拒绝回收")
+        print("请先用对应的 deck.json 运行 python3 build.py 或 python3 image_store.py import 初始化任务清单")
+        return None
+    return store.collect_garbage(referenced_paths(manifest, image_list_file), keep_versions,
+                                 min_age_days, dry_run)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="图片仓库：导入、近似重复检测和垃圾回收")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("import", help="导入输出目录中的旧图片")
+    subparsers.add_parser("duplicates", help="列出近似重复的图片")
+    gc_parser = subparsers.add_parser("gc", help="删除不再引用的旧版本")
+    gc_parser.add_argument("--dry-run", action="store_true", help="只列出将被删除的图片")
+    gc_parser.add_argument("--keep", type=int, help="每张卡片保留的旧版本数，默认读取 store.keep_versions")
+    gc_parser.add_argument("--min-age-days", type=float, help="不删除入库不满该天数的图片")
+    parser.add_argument("--deck", default="deck.json", help="卡组描述文件，用于初始化任务清单")
+    parser.add_argument("--images", default="image_list.json", help="图片列表文件")
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    store_config = get_store_config(config)
+    store = ImageStore(config.get("manifest_file", "manifest.sqlite3"), store_config["dir"],
+                       store_config["duplicate_distance"])
+    manifest = JobManifest(config.get("manifest_file", "manifest.sqlite3"))
+
+    output_dir = config.get("output_dir", "images")
+
+    try:
+        if args.command != "duplicates":
+            imported = bootstrap_manifest(manifest, config, args.deck, args.images)
+            if imported:
+                print(f"已从 {args.images} 或 {output_dir} 初始化任务清单: {imported} 张卡片")
+        if args.command == "import":
+            count = import_output_dir(store, manifest, output_dir, args.images)
+            print(f"✓ 已导入 {count} 张图片到 {store.store_dir}")
+            print("请运行 python3 build.py 按新的图片路径重新渲染")
+        elif args.command == "duplicates":
+            pairs = store.duplicates()
+            for path, original in pairs:
+                print(f"{path}  ≈  {original}")
+            print(f"共 {len(pairs)} 组近似重复")
+        else:
+            keep = args.keep if args.keep is not None else store_config["keep_versions"]
+            min_age = args.min_age_days if args.min_age_days is not None else store_config["min_age_days"]
+            garbage = collect_store_garbage(store, manifest, args.images, keep, min_age, args.dry_run)
+            if garbage is None:
+                return 1
+            for path, size in garbage:
+                print(f"{'将删除' if args.dry_run else '已删除'}: {path} ({size // 1024} KB)")
+            if not args.dry_run:
+                derived = prune_derivatives([path for path, _ in garbage],
+                                            get_optimize_config(config)["derivatives_file"])
+                if derived:
+                    print(f"已删除 {derived} 个派生图片")
+            total = sum(size for _, size in garbage)
+            print(f"共 {len(garbage)} 张，{total / 1024 / 1024:.1f} MB")
+    finally:
+        manifest.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
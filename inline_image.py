@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+从JSON响应流中直接提取内联的base64图片并边读边解码
+
+支持两种响应格式：
+    b64_json: {"data": [{"b64_json": "..."}]}
+    gemini:   {"candidates": [{"content": {"parts": [{"inlineData": {"mimeType": ..., "data": "..."}}]}}]}
+
+不解析整个JSON，只按键名在字节流中定位字符串值，因此内存占用只有一个数据块的大小。
+"""
+
+import base64
+import re
+
+
+# 每种格式依次需要跳过的键（每一步可以是多个候选写法）
+KEY_PATHS = {
+    "b64_json": [(b'"b64_json"',)],
+    "gemini": [(b'"inlineData"', b'"inline_data"'), (b'"data"',)],
+}
+
+_ESCAPE_PATTERN = re.compile(rb"\\(.)")
+_WHITESPACE = b" \t\r\n"
+
+
+class InlineImageError(Exception):
+    """响应中的内联图片数据不完整或无法解析"""
+
+
+def _unescape(data):
+    """处理JSON字符串中的转义：\\/ 还原为 /，base64 中不会出现的其他转义（如换行）直接去掉"""
+    if b"\\" not in data:
+        return data
+    return _ESCAPE_PATTERN.sub(lambda match: b"/" if match.group(1) == b"/" else b"", data)
+
+
+class InlineImageScanner:
+    """
+    在JSON字节流中按顺序查找内联图片
+
+    用法:
+        scanner = InlineImageScanner(response.iter_content(65536), "b64_json")
+        for value in scanner.values():
+            for chunk in decode_base64_stream(value):
+                ...
+
+    每个 value 迭代器必须完整读取后才能继续读取下一个。
+    """
+
+    def __init__(self, chunks, response_format):
+        if response_format not in KEY_PATHS:
+            raise ValueError(f"不支持的内联图片格式: {response_format}")
+        self.chunks = iter(chunks)
+        self.key_path = KEY_PATHS[response_format]
+        self.buffer = b""
+
+    def _fill(self):
+        """读入下一个数据块，流结束返回False"""
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        return False
+
+    def _skip_past(self, patterns):
+        """跳过缓冲区直到任一模式之后，流结束仍未找到返回False"""
+        longest = max(len(pattern) for pattern in patterns)
+        while True:
+            best = None
+            for pattern in patterns:
+                position = self.buffer.find(pattern)
+                if position >= 0 and (best is None or position < best[0]):
+                    best = (position, len(pattern))
+            if best:
+                self.buffer = self.buffer[best[0] + best[1]:]
+                return True
+            # 保留末尾可能被截断的部分模式
+            self.buffer = self.buffer[len(self.buffer) - longest + 1:] if len(self.buffer) >= longest else self.buffer
+            if not self._fill():
+                return False
+
+    def _iter_value(self):
+        """流式产出当前字符串值的内容（已去掉转义），直到结束引号"""
+        carry = b""
+        while True:
+            end = self.buffer.find(b'"')
+            if end >= 0:
+                segment, self.buffer = self.buffer[:end], self.buffer[end + 1:]
+                yield _unescape(carry + segment)
+                return
+            segment, self.buffer = carry + self.buffer, b""
+            # 末尾的反斜杠要和下一个数据块的第一个字符一起处理
+            trailing = len(segment) - len(segment.rstrip(b"\\"))
+            if trailing % 2:
+                segment, carry = segment[:-1], b"\\"
+            else:
+                carry = b""
+            if segment:
+                yield _unescape(segment)
+            if not self._fill():
+                raise InlineImageError("内联图片数据不完整")
+
+    def values(self):
+        """
+        依次产出每张内联图片的base64文本迭代器
+
+        Returns:
+            迭代器的迭代器
+        """
+        while True:
+            for patterns in self.key_path:
+                if not self._skip_past(patterns):
+                    return
+            # 键名之后的第一个引号即为字符串值的开始
+            if not self._skip_past((b'"',)):
+                raise InlineImageError("内联图片数据不完整")
+            yield self._iter_value()
+
+
+def decode_base64_stream(chunks):
+    """
+    增量解码base64文本
+
+    Args:
+        chunks: base64 文本（bytes）的迭代器
+
+    Returns:
+        解码后的 bytes 数据块迭代器
+    """
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk.translate(None, _WHITESPACE)
+        cut = len(data) - len(data) % 4
+        pending = data[cut:]
+        if cut:
+            try:
+                yield base64.b64decode(data[:cut])
+            except ValueError as e:
+                raise InlineImageError(f"base64 解码失败: {e}")
+    if pending:
+        try:
+            yield base64.b64decode(pending + b"=" * (-len(pending) % 4))
+        except ValueError as e:
+            raise InlineImageError(f"base64 解码失败: {e}")
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+生成任务清单：用SQLite记录每张卡片的状态，支持断点续跑和导出图片列表
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from atomic_io import atomic_write_text
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    deck TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    prompt_hash TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    variants TEXT,
+    endpoint TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (deck, idx)
+)
+"""
+
+# 旧版本数据库缺少的列，打开时补齐
+MIGRATIONS = {
+    "variants": "ALTER TABLE cards ADD COLUMN variants TEXT",
+    "endpoint": "ALTER TABLE cards ADD COLUMN endpoint TEXT"
+}
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def imported_hash(prompt_hashes, idx):
+    """导入旧图片时记录的提示词哈希，不知道提示词时为None"""
+    if prompt_hashes is None or idx >= len(prompt_hashes):
+        return None
+    return prompt_hashes[idx]
+
+
+class JobManifest:
+    """
+    卡片生成清单
+
+    每次状态变化都会立即提交，进程崩溃后重新打开即可从上次的位置继续。
+    deck 通常使用文件名前缀（如 "card"），idx 为卡片序号。
+    """
+
+    def __init__(self, db_path="manifest.sqlite3"):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(cards)")}
+            for column, sql in MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(sql)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _upsert(self, deck, idx, **fields):
+        now = time.time()
+        fields["updated_at"] = now
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in fields)
+        sql = (
+            f"INSERT INTO cards (deck, idx, created_at, {columns}) "
+            f"VALUES (?, ?, ?, {placeholders}) "
+            f"ON CONFLICT (deck, idx) DO UPDATE SET {updates}"
+        )
+        with self._lock, self._conn:
+            self._conn.execute(sql, [deck, idx, now] + list(fields.values()))
+
+    def mark_running(self, deck, idx, prompt_hash):
+        """记录卡片开始生成，尝试次数加一"""
+        with self._lock, self._conn:
+            now = time.time()
+            self._conn.execute(
+                "INSERT INTO cards (deck, idx, prompt_hash, status, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT (deck, idx) DO UPDATE SET "
+                "prompt_hash = excluded.prompt_hash, status = excluded.status, "
+                "attempts = attempts + 1, error = NULL, updated_at = excluded.updated_at",
+                (deck, idx, prompt_hash, STATUS_RUNNING, now, now)
+            )
+
+    def mark_done(self, deck, idx, prompt_hash, output_path, endpoint=None):
+        """记录卡片生成成功，endpoint 为生成该图片的接口名（命中缓存或手动改选时为空）"""
+        self._upsert(deck, idx, prompt_hash=prompt_hash, status=STATUS_DONE,
+                     output_path=output_path, endpoint=endpoint, error=None)
+
+    def record_variants(self, deck, idx, variants):
+        """
+        记录一次请求生成的全部候选图片
+
+        Args:
+            variants: select_variant.score_variants 返回的字典列表
+        """
+        # 卡片还没有记录时（如直接调用 generate_image）先以 pending 状态插入，不覆盖已有状态
+        with self._lock, self._conn:
+            now = time.time()
+            self._conn.execute(
+                "INSERT INTO cards (deck, idx, status, variants, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (deck, idx) DO UPDATE SET "
+                "variants = excluded.variants, updated_at = excluded.updated_at",
+                (deck, idx, STATUS_PENDING, json.dumps(variants, ensure_ascii=False), now, now)
+            )
+
+    def mark_pending(self, deck, idx, prompt_hash, error=None):
+        """记录卡片等待重新生成（如被限流后重新排队）"""
+        self._upsert(deck, idx, prompt_hash=prompt_hash, status=STATUS_PENDING, error=error)
+
+    def mark_failed(self, deck, idx, prompt_hash, error=None):
+        """记录卡片生成失败（保留上一次成功的图片路径）"""
+        self._upsert(deck, idx, prompt_hash=prompt_hash, status=STATUS_FAILED, error=error)
+
+    def get(self, deck, idx):
+        """
+        查询单张卡片
+
+        Returns:
+            字段字典，不存在返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM cards WHERE deck = ? AND idx = ?", (deck, idx)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_cards(self, deck):
+        """
+        按序号列出某个卡组的所有卡片
+
+        Returns:
+            字段字典列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM cards WHERE deck = ? ORDER BY idx", (deck,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def all_cards(self):
+        """
+        列出所有卡组的所有卡片
+
+        Returns:
+            字段字典列表
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM cards ORDER BY deck, idx").fetchall()
+        return [dict(row) for row in rows]
+
+    def is_complete(self, card, prompt_hash):
+        """
+        判断卡片是否已生成且与当前提示词一致
+
+        prompt_hash 为空的记录（导入时不知道提示词）无法确认与当前提示词一致，视为需要重新生成。
+
+        Args:
+            card: list_cards/get 返回的字段字典
+            prompt_hash: 当前提示词的哈希
+        """
+        return bool(
+            card is not None
+            and card["output_path"]
+            and os.path.exists(card["output_path"])
+            and card["status"] == STATUS_DONE
+            and card["prompt_hash"] == prompt_hash
+        )
+
+    def import_directory(self, deck, output_dir, filename_prefix, prompt_hashes=None):
+        """
+        从旧的图片目录导入记录（仅在清单中还没有该卡组时使用）
+
+        每个序号取时间戳最新的文件。
+
+        Args:
+            prompt_hashes: 按序号排列的当前提示词哈希，导入的图片视为由当前提示词生成；
+                None 表示不知道提示词，导入的卡片会在下次生成时重新生成
+
+        Returns:
+            导入的卡片数量
+        """
+        latest = {}
+        if not os.path.isdir(output_dir):
+            return 0
+        for filename in os.listdir(output_dir):
+            if not filename.startswith(filename_prefix + "_"):
+                continue
+            # 前缀本身可以包含下划线，序号是前缀之后的第一段
+            try:
+                idx = int(filename[len(filename_prefix) + 1:].split("_")[0])
+            except ValueError:
+                continue
+            if idx not in latest or filename > latest[idx]:
+                latest[idx] = filename
+
+        for idx, filename in latest.items():
+            self._upsert(deck, idx, prompt_hash=imported_hash(prompt_hashes, idx), status=STATUS_DONE,
+                         output_path=os.path.join(output_dir, filename), error=None)
+        return len(latest)
+
+    def import_image_list(self, deck, image_list_file="image_list.json", prompt_hashes=None):
+        """
+        从已有的 image_list.json 导入记录，列表中的位置即卡片序号，null 表示该卡片没有图片
+
+        Args:
+            prompt_hashes: 同 import_directory
+
+        Returns:
+            导入的卡片数量
+        """
+        with open(image_list_file, 'r', encoding='utf-8') as f:
+            image_paths = json.load(f)
+        imported = 0
+        for idx, path in enumerate(image_paths):
+            if not path:
+                continue
+            self._upsert(deck, idx, prompt_hash=imported_hash(prompt_hashes, idx), status=STATUS_DONE,
+                         output_path=path, error=None)
+            imported += 1
+        return imported
+
+    def bootstrap(self, deck, output_dir, filename_prefix, image_list_file="image_list.json",
+                  prompt_hashes=None):
+        """
+        清单中还没有该卡组时，从旧的 image_list.json（优先）或图片目录导入一次
+
+        Args:
+            prompt_hashes: 按序号排列的当前提示词哈希，记入导入的卡片，之后修改提示词时能发现图片已过期；
+                None 表示不知道提示词，导入的卡片在下次生成时重新生成
+
+        Returns:
+            导入的卡片数量，已有记录时返回0
+        """
+        if self.list_cards(deck):
+            return 0
+        if os.path.exists(image_list_file):
+            return self.import_image_list(deck, image_list_file, prompt_hashes)
+        return self.import_directory(deck, output_dir, filename_prefix, prompt_hashes)
+
+    def export_image_list(self, deck, image_list_file="image_list.json", count=None):
+        """
+        将卡片的图片路径按序号导出为 image_list.json
+
+        列表中的位置即卡片序号，没有图片的卡片（失败或尚未生成）写为 null，
+        后面卡片的图片不会错位到前面的卡片上。
+
+        Args:
+            deck: 卡组名
+            image_list_file: 输出文件路径
+            count: 卡片总数，列表长度即为 count；None 表示导出到清单中最大的序号
+
+        Returns:
+            导出的路径列表（缺少图片的位置为None）
+        """
+        paths = {card["idx"]: card["output_path"] for card in self.list_cards(deck)}
+        if count is None:
+            count = max(paths) + 1 if paths else 0
+        image_paths = [paths.get(idx) or None for idx in range(count)]
+        atomic_write_text(image_list_file, json.dumps(image_paths, indent=2, ensure_ascii=False))
+        return image_paths
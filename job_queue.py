@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+卡组任务队列：用SQLite保存待处理的卡组，供 worker.py 常驻进程消费
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck_file TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobQueue:
+    """
+    卡组任务队列
+
+    每个任务对应一个 deck.json。deck 为卡组名（文件名前缀），
+    同一卡组的任务由 worker 依次执行，不同卡组可以并行。
+    任务清单和图片文件名都以卡组名区分卡组，所以一个卡组名只能属于一个 deck.json。
+    """
+
+    def __init__(self, db_path="queue.sqlite3"):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def submit(self, deck_file, deck, options=None):
+        """
+        提交一个卡组任务
+
+        Args:
+            deck_file: deck.json 路径
+            deck: 卡组名
+            options: 任务选项字典（如 {"single_file": false}）
+
+        Returns:
+            任务ID
+
+        Raises:
+            ValueError: 卡组名已属于另一个 deck.json
+        """
+        deck_file = os.path.abspath(deck_file)
+        with self._lock, self._conn:
+            for row in self._conn.execute("SELECT DISTINCT deck_file FROM jobs WHERE deck = ?", (deck,)):
+                if os.path.abspath(row["deck_file"]) != deck_file:
+                    raise ValueError(f"卡组名 {deck} 已被 {row['deck_file']} 使用，"
+                                     f"请在 deck.json 中设置不同的 filename_prefix")
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (deck_file, deck, options, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (deck_file, deck, json.dumps(options or {}, ensure_ascii=False), STATUS_QUEUED, time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, busy_decks=()):
+        """
+        取出最早提交、且卡组不在 busy_decks 中的任务，标记为运行中
+
+        Returns:
+            任务字段字典，没有可执行的任务时返回None
+        """
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id", (STATUS_QUEUED,)
+            ).fetchall()
+            for row in rows:
+                if row["deck"] in busy_decks:
+                    continue
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, now, row["id"])
+                )
+                job = dict(row)
+                job["status"] = STATUS_RUNNING
+                job["started_at"] = now
+                return job
+        return None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+
+    def mark_done(self, job_id, result):
+        """记录任务完成，result 为结果摘要字典"""
+        self._finish(job_id, STATUS_DONE, result=result)
+
+    def mark_failed(self, job_id, error, result=None):
+        """记录任务失败"""
+        self._finish(job_id, STATUS_FAILED, result=result, error=error)
+
+    def requeue_running(self):
+        """
+        把上次 worker 退出时仍在运行的任务放回队列
+
+        Returns:
+            放回队列的任务数量
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+            return cursor.rowcount
+
+    def get(self, job_id):
+        """
+        查询单个任务
+
+        Returns:
+            字段字典，不存在返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit=20):
+        """
+        按提交时间倒序列出最近的任务
+
+        Returns:
+            字段字典列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+生成过程的计时与指标：每张卡片的各阶段耗时写入JSONL，批次结束时汇总
+
+阶段（span）名称：
+    queue_wait  任务提交到开始执行的等待时间
+    api_call    调用生成接口（到收到响应头为止）
+    encode      解析响应、解码内联图片数据
+    download    下载图片时等待网络的时间
+    disk_write  写入磁盘的时间
+    score       多张候选图片的本地打分
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from atomic_io import atomic_write_text
+
+
+# 直方图分桶上限（秒）
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+
+def percentile(values, p):
+    """最近秩法计算分位数，空列表返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class CardMetrics:
+    """一张卡片的计时和计数"""
+
+    def __init__(self, deck, index):
+        self.deck = deck
+        self.index = index
+        self.spans = {}
+        self.bytes = 0
+        self.retries = 0
+        self.cache_hit = False
+        self.status = None
+        self.extra = {}
+        self.created = time.perf_counter()
+
+    def add(self, name, seconds):
+        """累加某个阶段的耗时"""
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        """记录 with 代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def merge(self, other):
+        """把另一次尝试（如对冲请求）的耗时和计数并入本卡片"""
+        for name, seconds in other.spans.items():
+            self.add(name, seconds)
+        self.bytes += other.bytes
+        self.retries += other.retries
+        self.extra.update(other.extra)
+
+    def timed_chunks(self, chunks, name="download"):
+        """包装数据块迭代器，把等待下一个数据块的时间记到 name 阶段，并统计字节数"""
+        iterator = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - started)
+                return
+            self.add(name, time.perf_counter() - started)
+            self.bytes += len(chunk)
+            yield chunk
+
+    def to_dict(self):
+        record = {
+            "ts": time.time(),
+            "deck": self.deck,
+            "index": self.index,
+            "status": self.status,
+            "spans": {name: round(seconds, 6) for name, seconds in self.spans.items()},
+            "total": round(time.perf_counter() - self.created, 6),
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "cache_hit": self.cache_hit
+        }
+        record.update(self.extra)
+        return record
+
+
+class MetricsRecorder:
+    """
+    收集一个批次中所有卡片的指标
+
+    每张卡片结束时追加一行到 metrics_file（JSONL），
+    summary() / print_summary() 汇总各阶段的分位数与直方图，
+    prometheus_text() 输出 Prometheus 文本格式。
+    """
+
+    def __init__(self, metrics_file=None):
+        """
+        Args:
+            metrics_file: JSONL 文件路径，None 表示只在内存中汇总
+        """
+        self.metrics_file = metrics_file
+        self._lock = threading.Lock()
+        self.records = []
+
+    def start_card(self, deck, index):
+        """创建一张卡片的指标对象"""
+        return CardMetrics(deck, index)
+
+    def finish(self, card, status):
+        """记录一张卡片的最终状态并写入JSONL"""
+        card.status = status
+        record = card.to_dict()
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.records.append(record)
+            if self.metrics_file:
+                with open(self.metrics_file, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return record
+
+    def summary(self):
+        """
+        汇总所有卡片
+
+        Returns:
+            {"cards", "succeeded", "bytes", "retries", "cache_hits",
+             "spans": {阶段: {"count", "sum", "p50", "p95", "p99", "buckets"}}}
+        """
+        with self._lock:
+            records = list(self.records)
+
+        by_span = {}
+        for record in records:
+            for name, seconds in record["spans"].items():
+                by_span.setdefault(name, []).append(seconds)
+            by_span.setdefault("total", []).append(record["total"])
+
+        spans = {}
+        for name, values in by_span.items():
+            spans[name] = {
+                "count": len(values),
+                "sum": sum(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "buckets": [sum(1 for value in values if value <= bound) for bound in BUCKETS]
+            }
+
+        return {
+            "cards": len(records),
+            "succeeded": sum(1 for record in records if record["status"] == "ok"),
+            "bytes": sum(record["bytes"] for record in records),
+            "retries": sum(record["retries"] for record in records),
+            "cache_hits": sum(1 for record in records if record["cache_hit"]),
+            "spans": spans
+        }
+
+    def print_summary(self):
+        """输出批次汇总"""
+        summary = self.summary()
+        if not summary["cards"]:
+            return
+        print("\n" + "-" * 60)
+        print(f"指标汇总: {summary['succeeded']}/{summary['cards']} 成功，"
+              f"下载 {summary['bytes'] / 1024 / 1024:.1f} MB，重试 {summary['retries']} 次，"
+              f"缓存命中 {summary['cache_hits']} 次")
+        print(f"{'阶段':<12}{'次数':>6}{'合计(s)':>10}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}")
+        for name, stats in sorted(summary["spans"].items()):
+            print(f"{name:<12}{stats['count']:>6}{stats['sum']:>10.2f}"
+                  f"{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+        print("-" * 60)
+
+    def prometheus_text(self, prefix="image_generation"):
+        """
+        Prometheus 文本格式的指标
+
+        Returns:
+            字符串
+        """
+        summary = self.summary()
+        lines = [
+            f"# TYPE {prefix}_cards_total counter",
+            f'{prefix}_cards_total{{status="ok"}} {summary["succeeded"]}',
+            f'{prefix}_cards_total{{status="failed"}} {summary["cards"] - summary["succeeded"]}',
+            f"# TYPE {prefix}_bytes_total counter",
+            f"{prefix}_bytes_total {summary['bytes']}",
+            f"# TYPE {prefix}_retries_total counter",
+            f"{prefix}_retries_total {summary['retries']}",
+            f"# TYPE {prefix}_cache_hits_total counter",
+            f"{prefix}_cache_hits_total {summary['cache_hits']}",
+            f"# TYPE {prefix}_span_seconds histogram"
+        ]
+        for name, stats in sorted(summary["spans"].items()):
+            for bound, count in zip(BUCKETS, stats["buckets"]):
+                lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """将 Prometheus 文本格式的指标写入文件"""
+        atomic_write_text(path, self.prometheus_text())
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+图片优化：将生成的PNG转码为 WebP/AVIF/JPEG 等压缩格式的派生图片
+
+卡片最大宽度为600px，默认为每张图片生成 600px（1x）和 1200px（2x）两种宽度。
+派生图片的路径记录在 derivatives.json 中，供 update_html 和 convert_to_base64 使用。
+"""
+
+import base64
+import io
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_io import atomic_write_chunks, atomic_write_text
+
+try:
+    from PIL import Image, ImageFilter, features
+except ImportError:
+    Image = None
+    ImageFilter = None
+    features = None
+
+
+DEFAULT_OPTIMIZE_CONFIG = {
+    "enabled": True,
+    "formats": ["webp", "jpeg"],
+    "widths": [600, 1200],
+    "quality": {"webp": 80, "avif": 55, "jpeg": 82},
+    "output_dir": "images/derived",
+    "derivatives_file": "derivatives.json",
+    "html_format": "webp",
+    "placeholder_width": 16,
+    "workers": 0
+}
+
+EXTENSIONS = {"webp": ".webp", "avif": ".avif", "jpeg": ".jpg"}
+PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG"}
+
+
+def get_optimize_config(config):
+    """合并默认值与 config.json 中的 optimize 配置"""
+    optimize_config = dict(DEFAULT_OPTIMIZE_CONFIG)
+    optimize_config.update(config.get("optimize", {}))
+    quality = dict(DEFAULT_OPTIMIZE_CONFIG["quality"])
+    quality.update(optimize_config.get("quality", {}))
+    optimize_config["quality"] = quality
+    return optimize_config
+
+
+def load_optimize_config(config_file="config.json"):
+    """从配置文件读取 optimize 配置，文件不存在时使用默认值"""
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    return get_optimize_config(config)
+
+
+def supported_formats(formats):
+    """
+    过滤掉当前 Pillow 不支持编码的格式
+
+    Returns:
+        支持的格式列表
+    """
+    result = []
+    for fmt in formats:
+        if fmt not in PIL_FORMATS:
+            print(f"警告: 不支持的图片格式 {fmt}，已忽略")
+            continue
+        if fmt in ("webp", "avif") and not features.check(fmt):
+            print(f"警告: 当前 Pillow 未启用 {fmt} 编码支持，已忽略")
+            continue
+        result.append(fmt)
+    return result
+
+
+def target_widths(widths, source_width):
+    """
+    实际生成的宽度：不放大，不小于原图宽度的请求统一用原图宽度（只生成一次）
+
+    srcset 的宽度描述符必须是图片的真实宽度，所以派生图片按实际宽度命名和记录。
+    例如原图 1024px、请求 [600, 1200] 时生成 [600, 1024]。
+
+    Returns:
+        从小到大排列的宽度列表
+    """
+    result = {int(width) for width in widths if int(width) < source_width}
+    if any(int(width) >= source_width for width in widths):
+        result.add(source_width)
+    return sorted(result)
+
+
+def derivative_path(image_path, fmt, width, output_dir):
+    """派生图片路径，如 images/derived/card_00_xxx_600w.webp"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(output_dir, f"{stem}_{width}w{EXTENSIONS[fmt]}").replace(os.sep, "/")
+
+
+def read_jpeg_size(f):
+    """从JPEG文件的SOF段读取尺寸，f 需位于SOI之后"""
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(image_path):
+    """
+    读取图片尺寸，PNG/JPEG直接解析文件头，其他格式需要 Pillow
+
+    Returns:
+        (宽, 高)，无法读取返回None
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            header = f.read(24)
+            if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header.startswith(b"\xff\xd8"):
+                f.seek(2)
+                return read_jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+    if Image is not None:
+        try:
+            with Image.open(image_path) as image:
+                return image.size
+        except OSError:
+            return None
+    return None
+
+
+def make_placeholder(image, width):
+    """
+    生成模糊的低清占位图
+
+    Args:
+        image: RGB 模式的 PIL 图片
+        width: 占位图宽度（像素）
+
+    Returns:
+        JPEG data URI 字符串
+    """
+    height = max(1, round(image.height * width / image.width))
+    tiny = image.resize((width, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, "JPEG", quality=40)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_derivatives(image_path, formats, widths, quality, output_dir, placeholder_width=16):
+    """
+    为一张图片生成所有派生图片（在进程池中执行）
+
+    Args:
+        image_path: 源图片路径
+        formats: 格式列表，如 ["webp", "jpeg"]
+        widths: 目标宽度列表，不小于原图宽度的按原图宽度生成一次（见 target_widths）
+        quality: {格式: 质量} 字典
+        output_dir: 派生图片目录
+        placeholder_width: 模糊占位图宽度，<= 0 表示不生成
+
+    Returns:
+        {格式: {实际宽度字符串: 路径}, "placeholder": data URI} 字典
+    """
+    result = {fmt: {} for fmt in formats}
+    with Image.open(image_path) as source:
+        source = source.convert("RGB")
+        if placeholder_width > 0:
+            result["placeholder"] = make_placeholder(source, placeholder_width)
+        for target_width in target_widths(widths, source.width):
+            target_height = round(source.height * target_width / source.width)
+            resized = source if target_width == source.width else source.resize(
+                (target_width, target_height), Image.LANCZOS
+            )
+            for fmt in formats:
+                buffer = io.BytesIO()
+                save_options = {"quality": quality.get(fmt, 80)}
+                if fmt == "jpeg":
+                    save_options.update(optimize=True, progressive=True)
+                elif fmt == "webp":
+                    save_options.update(method=6)
+                resized.save(buffer, PIL_FORMATS[fmt], **save_options)
+                path = derivative_path(image_path, fmt, target_width, output_dir)
+                atomic_write_chunks([buffer.getvalue()], path)
+                result[fmt][str(target_width)] = path
+    return result
+
+
+def is_up_to_date(image_path, entry, formats, widths, need_placeholder=False):
+    """判断已有的派生图片是否完整且比源图片新"""
+    if need_placeholder and "placeholder" not in entry:
+        return False
+    size = image_size(image_path)
+    if not size:
+        return False
+    source_mtime = os.path.getmtime(image_path)
+    for fmt in formats:
+        for width in target_widths(widths, size[0]):
+            path = entry.get(fmt, {}).get(str(width))
+            if not path or not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                return False
+    return True
+
+
+def load_derivatives(derivatives_file="derivatives.json"):
+    """读取派生图片记录，文件不存在返回空字典"""
+    if not os.path.exists(derivatives_file):
+        return {}
+    with open(derivatives_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def pick_derivative(derivatives, image_path, fmt, width=None):
+    """
+    选择指定格式的派生图片
+
+    Args:
+        derivatives: load_derivatives 返回的字典
+        image_path: 源图片路径
+        fmt: 格式，None 表示使用源图片
+        width: 宽度，None 表示取最大宽度
+
+    Returns:
+        派生图片路径，没有对应派生图片时返回源图片路径
+    """
+    if not fmt:
+        return image_path
+    variants = derivatives.get(image_path, {}).get(fmt, {})
+    if not variants:
+        return image_path
+    if width is not None and str(width) in variants:
+        return variants[str(width)]
+    return variants[max(variants, key=int)]
+
+
+def optimize_images(image_paths, optimize_config=None):
+    """
+    用进程池为一组图片生成派生图片，并更新 derivatives.json
+
+    Args:
+        image_paths: 源图片路径列表（image_list.json 中的 null 会被跳过）
+        optimize_config: optimize 配置字典，None 表示读取 config.json
+
+    Returns:
+        {源图片路径: {格式: {宽度字符串: 路径}, "placeholder": data URI}} 字典，
+        Pillow 不可用时返回None
+    """
+    if Image is None:
+        print("错误: 图片优化需要安装 Pillow（pip install Pillow）")
+        return None
+
+    if optimize_config is None:
+        optimize_config = load_optimize_config()
+
+    formats = supported_formats(optimize_config["formats"])
+    widths = [int(width) for width in optimize_config["widths"]]
+    output_dir = optimize_config["output_dir"]
+    derivatives_file = optimize_config["derivatives_file"]
+    os.makedirs(output_dir, exist_ok=True)
+
+    image_paths = [path for path in image_paths if path]
+    derivatives = load_derivatives(derivatives_file)
+    todo = [
+        path for path in image_paths
+        if os.path.exists(path) and not is_up_to_date(path, derivatives.get(path, {}), formats, widths,
+                                                   optimize_config["placeholder_width"] > 0)
+    ]
+
+    print(f"\n正在优化图片: {len(todo)} 张需要处理，{len(image_paths) - len(todo)} 张已是最新")
+
+    workers = optimize_config.get("workers") or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            path: executor.submit(make_derivatives, path, formats, widths,
+                                  optimize_config["quality"], output_dir,
+                                  optimize_config["placeholder_width"])
+            for path in todo
+        }
+        for path, future in futures.items():
+            try:
+                derivatives[path] = future.result()
+            except Exception as e:
+                print(f"错误: 优化图片 {path} 失败: {e}")
+                continue
+            before = os.path.getsize(path)
+            after = min(
+                os.path.getsize(p)
+                for fmt in formats for p in derivatives[path][fmt].values()
+            )
+            print(f"✓ {path}: {before // 1024} KB -> 最小 {after // 1024} KB")
+
+    atomic_write_text(derivatives_file, json.dumps(derivatives, indent=2, ensure_ascii=False))
+    return derivatives
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("生成压缩格式的派生图片")
+    print("=" * 60)
+
+    with open("image_list.json", 'r', encoding='utf-8') as f:
+        image_paths = json.load(f)
+
+    derivatives = optimize_images(image_paths)
+
+    if derivatives is not None:
+        print(f"\n✓ 派生图片记录已保存到: {load_optimize_config()['derivatives_file']}")
+    else:
+        print("\n✗ 优化失败，请检查错误信息")
+
+
+if __name__ == "__main__":
+    main()
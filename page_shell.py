@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+页面外壳的构建期优化：精简内联CSS、内嵌子集化字体、离线单文件版本打包第三方脚本
+
+- CSS：模板的样式表本身就内联在 <head> 中且都作用于首屏卡片，没有单独的"关键CSS"可以提取；
+  这里只去掉卡组没有用到的布局（layout-a/b/c）的规则并压缩空白
+- 字体（需要手动开启）：shell.font_file 默认为空，不做子集化，页面使用读者设备上的字体；
+  配置了字体文件且安装了 fontTools 时，把字体裁剪为卡组标题、说明和页面文字实际用到的字形，
+  以 data URI 写入 @font-face（font-display: swap）；子集按字形集合缓存在 shell.font_cache_dir 中
+- 第三方脚本：模板只在第一次点击下载时加载 html2canvas/JSZip/FileSaver；
+  单文件版本中，vendor_dir 下有对应文件时以 <script type="text/plain" data-vendor> 内嵌，
+  离线也能下载卡片（python3 page_shell.py fetch-vendor 下载这些文件）
+
+用法:
+    python3 page_shell.py fetch-vendor   # 下载第三方脚本到 shell.vendor_dir
+"""
+
+import argparse
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import tempfile
+
+from atomic_io import atomic_write_chunks
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+
+DEFAULT_SHELL_CONFIG = {
+    "enabled": True,
+    "prune_css": True,
+    "font_file": "",
+    "font_number": 0,
+    "font_family": "Noto Sans SC",
+    "font_cache_dir": ".build/fonts",
+    "vendor_dir": "vendor"
+}
+
+# 与模板中的 VENDOR_SCRIPTS 一致：{全局变量名: (下载地址, vendor_dir 中的文件名)}
+VENDOR_SCRIPTS = {
+    "html2canvas": ("https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js",
+                    "html2canvas.min.js"),
+    "JSZip": ("https://cdnjs.cloudflare.com/ajax/libs/jszip/3.10.1/jszip.min.js", "jszip.min.js"),
+    "saveAs": ("https://cdnjs.cloudflare.com/ajax/libs/FileSaver.js/2.0.0/FileSaver.min.js",
+               "FileSaver.min.js")
+}
+
+STYLE_PATTERN = re.compile(r"(<style>)(.*?)(</style>)", re.S)
+RULE_PATTERN = re.compile(r"([^{}]+)\{([^{}]*)\}")
+LAYOUT_CLASS_PATTERN = re.compile(r"\.layout-([a-z])\b")
+AT_RULE_PATTERN = re.compile(r"@[a-zA-Z-]+")
+# 注释、字符串和 url(...)：注释直接去掉，后两者先替换为占位符，其中的 ; , : @ { } 不参与规则的拆分
+LITERAL_PATTERN = re.compile(r"/\*.*?\*/|\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|url\([^)]*\)", re.S | re.I)
+PLACEHOLDER_PATTERN = re.compile(r"\x00(\d+)\x00")
+FONT_MIME_TYPES = {"woff2": "font/woff2", "woff": "font/woff"}
+
+
+def get_shell_config(config):
+    """合并默认值与 config.json 中的 shell 配置"""
+    shell_config = dict(DEFAULT_SHELL_CONFIG)
+    shell_config.update(config.get("shell", {}))
+    return shell_config
+
+
+def load_shell_config(config_file="config.json"):
+    """从配置文件读取 shell 配置，文件不存在时使用默认值"""
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    return get_shell_config(config)
+
+
+def minify_css(css, layouts=None):
+    """
+    压缩样式表，可选地去掉未使用布局的规则
+
+    只处理模板中用到的简单规则（选择器 { 声明 }）。样式表中有 @media、@keyframes、@supports
+    等 @ 规则时原样返回，不压缩也不裁剪，以免拆散嵌套的块或丢掉其中的规则。
+    字符串和 url(...)（如 data URI 中的 ;）原样保留，不参与拆分和空白压缩。
+
+    Args:
+        css: 样式表文本
+        layouts: 卡组用到的布局集合，None 表示保留全部规则
+
+    Returns:
+        压缩后的样式表
+    """
+    literals = []
+
+    def protect(match):
+        if match.group(0).startswith("/*"):
+            return ""
+        literals.append(match.group(0))
+        return f"\x00{len(literals) - 1}\x00"
+
+    masked = LITERAL_PATTERN.sub(protect, css)
+    if AT_RULE_PATTERN.search(masked):
+        return css
+    rules = []
+    for selectors, body in RULE_PATTERN.findall(masked):
+        kept = [" ".join(selector.split()) for selector in selectors.split(",")]
+        if layouts is not None:
+            kept = [selector for selector in kept
+                    if all(layout in layouts for layout in LAYOUT_CLASS_PATTERN.findall(selector))]
+        if not kept:
+            continue
+        declarations = []
+        for declaration in body.split(";"):
+            name, _, value = declaration.partition(":")
+            if value.strip():
+                declarations.append(f"{name.strip()}:{' '.join(value.split())}")
+        rules.append(f"{','.join(kept)}{{{';'.join(declarations)}}}")
+    return PLACEHOLDER_PATTERN.sub(lambda match: literals[int(match.group(1))], "".join(rules))
+
+
+def deck_text(deck, template_text=""):
+    """页面上可能显示的全部文字：卡组标题、卡片标题和说明，以及模板中的按钮与提示文字"""
+    parts = [deck.get("title", ""), template_text]
+    for card in deck.get("cards", []):
+        parts.append(card.get("title", ""))
+        parts.append(card.get("caption", ""))
+    return "".join(sorted(set("".join(parts))))
+
+
+def subset_font(font_file, text, cache_dir, font_number=0):
+    """
+    把字体裁剪为 text 中出现的字形
+
+    Args:
+        font_file: 字体文件（.ttf/.otf/.ttc）
+        text: 需要保留的字符
+        cache_dir: 子集缓存目录
+        font_number: .ttc 字体集合中的字体序号
+
+    Returns:
+        (子集字体文件路径, 格式 "woff2" 或 "woff")，fontTools 不可用时返回 (None, None)
+    """
+    if font_subset is None:
+        print("警告: 字体子集化需要安装 fontTools（pip install fonttools brotli），跳过")
+        return None, None
+
+    stat = os.stat(font_file)
+    key = f"{os.path.abspath(font_file)}:{stat.st_size}:{stat.st_mtime_ns}:{font_number}:{text}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    for flavor in FONT_MIME_TYPES:
+        cached = os.path.join(cache_dir, f"{digest}.{flavor}")
+        if os.path.exists(cached):
+            return cached, flavor
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # woff2 需要 brotli，缺少时退回 woff
+    flavor = "woff2" if importlib.util.find_spec("brotli") else "woff"
+    options = font_subset.Options()
+    options.flavor = flavor
+    options.font_number = font_number
+    font = font_subset.load_font(font_file, options)
+    try:
+        subsetter = font_subset.Subsetter(options=options)
+        subsetter.populate(text=text)
+        subsetter.subset(font)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        font_subset.save_font(font, tmp_path, options)
+    finally:
+        font.close()
+    path = os.path.join(cache_dir, f"{digest}.{flavor}")
+    os.replace(tmp_path, path)
+    print(f"✓ 字体子集: {len(text)} 个字符，{os.path.getsize(font_file) // 1024} KB -> "
+          f"{os.path.getsize(path) // 1024} KB")
+    return path, flavor
+
+
+def font_face(path, flavor, family):
+    """生成内嵌子集字体的 @font-face 规则"""
+    with open(path, 'rb') as f:
+        data = base64.b64encode(f.read()).decode('ascii')
+    return (f"@font-face{{font-family:'{family}';src:url('data:{FONT_MIME_TYPES[flavor]};base64,{data}') "
+            f"format('{flavor}');font-display:swap}}")
+
+
+def optimize_shell(content, deck, shell_config, template_text=""):
+    """
+    对渲染好的页面做构建期优化（精简CSS、内嵌子集化字体）
+
+    Args:
+        content: render_html 生成的完整HTML
+        deck: load_deck 返回的卡组字典
+        shell_config: get_shell_config 返回的配置
+        template_text: 页面模板原文，用于收集字体需要的字形
+
+    Returns:
+        优化后的HTML
+    """
+    if not shell_config["enabled"]:
+        return content
+
+    match = STYLE_PATTERN.search(content)
+    if not match:
+        return content
+
+    layouts = {card["layout"] for card in deck.get("cards", [])} if shell_config["prune_css"] else None
+    css = minify_css(match.group(2), layouts)
+
+    font_file = shell_config["font_file"]
+    if font_file:
+        if not os.path.exists(font_file):
+            print(f"警告: 字体文件 {font_file} 不存在，跳过字体子集化")
+        else:
+            path, flavor = subset_font(font_file, deck_text(deck, template_text),
+                                       shell_config["font_cache_dir"], int(shell_config["font_number"]))
+            if path:
+                css = font_face(path, flavor, shell_config["font_family"]) + css
+
+    return content[:match.start(2)] + css + content[match.end(2):]
+
+
+def vendor_bundle(vendor_dir):
+    """
+    把 vendor_dir 中已下载的第三方脚本包装为不会立即执行的 <script type="text/plain">
+
+    Returns:
+        HTML片段，没有可用的脚本时返回空字符串
+    """
+    blocks = []
+    for name, (_, filename) in VENDOR_SCRIPTS.items():
+        path = os.path.join(vendor_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            # 脚本中的 </script 会提前结束标签，<\/ 在JS字符串和正则中含义相同
+            code = f.read().replace("</script", "<\\/script")
+        blocks.append(f'<script type="text/plain" data-vendor="{name}">{code}</script>\n')
+    return "".join(blocks)
+
+
+def fetch_vendor(vendor_dir="vendor"):
+    """下载第三方脚本到 vendor_dir，供离线单文件版本内嵌"""
+    import requests
+
+    os.makedirs(vendor_dir, exist_ok=True)
+    for url, filename in VENDOR_SCRIPTS.values():
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        path = os.path.join(vendor_dir, filename)
+        atomic_write_chunks([response.content], path, verify_image=False)
+        print(f"✓ {url} -> {path}（{len(response.content) // 1024} KB）")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="页面外壳的构建期优化")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("fetch-vendor", help="下载第三方脚本，供离线单文件版本内嵌")
+    args = parser.parse_args()
+
+    shell_config = load_shell_config(args.config)
+    if args.command == "fetch-vendor":
+        fetch_vendor(shell_config["vendor_dir"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+流水线构建：每张卡片的图片一到就依次经过 优化 → 编码 → 渲染，后处理与API生成重叠进行
+
+    生成（run_jobs） ─▶ [队列] ─▶ 优化（进程池） ─▶ [队列] ─▶ 编码（base64缓存） ─▶ [队列] ─▶ 渲染
+
+- 阶段之间是有界队列（pipeline.queue_size），后面的阶段跟不上时前面的阶段会等待，
+  不会在内存中堆积任意多的结果
+- 已经生成好的卡片在开始时直接送入优化阶段，与需要调用API的卡片一起流过流水线
+- 渲染阶段按卡片顺序维护片段列表，还没有图片的卡片只显示文字；
+  每隔 pipeline.preview_interval 秒把当前进度写入HTML，生成过程中即可打开预览
+- 全部完成后按卡片顺序组装最终HTML，单文件版本直接使用编码阶段缓存的结果
+
+与 build.py 使用同一个 derivatives.json 和 .build/base64 编码缓存。
+
+用法:
+    python3 pipeline.py [--deck deck.json] [--no-base64]
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_io import atomic_write_text
+from build import BUILD_DIR, deck_prompt_hashes, load_config, stale_jobs
+from convert_to_base64 import encode_to_file, encoded_cache_path, update_html_with_base64
+from job_manifest import JobManifest
+from optimize_images import (Image, get_optimize_config, is_up_to_date, load_derivatives,
+                             make_derivatives, pick_derivative, supported_formats)
+from page_shell import get_shell_config
+from render_deck import load_deck, render_card, render_html
+
+
+DEFAULT_PIPELINE_CONFIG = {
+    "queue_size": 4,
+    "optimize_workers": 0,
+    "preview_interval": 2.0
+}
+
+STOP = object()
+
+
+def get_pipeline_config(config):
+    """合并默认值与 config.json 中的 pipeline 配置"""
+    pipeline_config = dict(DEFAULT_PIPELINE_CONFIG)
+    pipeline_config.update(config.get("pipeline", {}))
+    return pipeline_config
+
+
+class Stage:
+    """
+    流水线的一个阶段：workers 个线程从 inbox 取卡片，处理后放入 outbox
+
+    处理函数出错时只打印错误，卡片仍然交给下一个阶段（后续阶段按缺少结果处理）。
+    收到 STOP 后，最后一个退出的线程把 STOP 传给下一个阶段。
+    """
+
+    def __init__(self, name, func, inbox, outbox=None, workers=1):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.busy = 0.0
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is STOP:
+                # 放回去让同一阶段的其他线程也能看到
+                self.inbox.put(STOP)
+                with self._lock:
+                    self._remaining -= 1
+                    last = self._remaining == 0
+                if last and self.outbox is not None:
+                    self.outbox.put(STOP)
+                return
+
+            started = time.perf_counter()
+            try:
+                self.func(item)
+            except Exception as e:
+                print(f"错误: 卡片 {item['index'] + 1} 在{self.name}阶段失败: {e}")
+            with self._lock:
+                self.busy += time.perf_counter() - started
+            if self.outbox is not None:
+                self.outbox.put(item)
+
+
+class DeckPipeline:
+    """一个卡组的流水线构建"""
+
+    def __init__(self, deck, config, html_file="visual-story.html",
+                 template_file="templates/visual-story.html", single_file=True, build_dir=BUILD_DIR):
+        """
+        Args:
+            deck: load_deck 返回的卡组字典
+            config: 配置字典
+            html_file: 输出的HTML文件（生成过程中写入预览）
+            template_file: 页面模板
+            single_file: 是否编码图片并生成内嵌图片的单文件版本
+            build_dir: 构建目录，编码结果缓存在其中的 base64 子目录
+        """
+        self.deck = deck
+        self.html_file = html_file
+        self.template_file = template_file
+        self.single_file = single_file
+        self.encoded_dir = os.path.join(build_dir, "base64")
+        self.pipeline_config = get_pipeline_config(config)
+        self.shell_config = get_shell_config(config)
+
+        optimize_config = get_optimize_config(config)
+        self.optimize_config = optimize_config
+        self.optimize_enabled = optimize_config["enabled"] and Image is not None
+        self.image_format = optimize_config["html_format"] if optimize_config["enabled"] else None
+        self.formats = supported_formats(optimize_config["formats"]) if self.optimize_enabled else []
+        self.widths = [int(width) for width in optimize_config["widths"]]
+        self.derivatives = load_derivatives(optimize_config["derivatives_file"])
+        self.derivatives_lock = threading.Lock()
+
+        # 还没有图片的卡片先渲染为只有文字的片段
+        self.fragments = [render_card(card, None, self.derivatives, self.image_format, is_cover=(i == 0))
+                          for i, card in enumerate(deck["cards"])]
+        self.delivered = set()
+        self.delivered_lock = threading.Lock()
+        self.stats = {"generated": 0, "failed": 0, "optimized": 0, "encoded": 0, "rendered": 0}
+        self.last_preview = 0.0
+        self.executor = None
+
+    def optimize(self, item):
+        """生成派生图片，已是最新的直接复用"""
+        path = item["path"]
+        if not self.optimize_enabled:
+            return
+        with self.derivatives_lock:
+            entry = self.derivatives.get(path, {})
+        placeholder_width = self.optimize_config["placeholder_width"]
+        if is_up_to_date(path, entry, self.formats, self.widths, placeholder_width > 0):
+            return
+        entry = self.executor.submit(make_derivatives, path, self.formats, self.widths,
+                                     self.optimize_config["quality"], self.optimize_config["output_dir"],
+                                     placeholder_width).result()
+        with self.derivatives_lock:
+            self.derivatives[path] = entry
+            self.stats["optimized"] += 1
+
+    def encode(self, item):
+        """把单文件版本要内嵌的图片编码到缓存目录"""
+        if not self.single_file:
+            return
+        with self.derivatives_lock:
+            embedded = pick_derivative(self.derivatives, item["path"], self.image_format)
+        cache_path = encoded_cache_path(self.encoded_dir, embedded)
+        if os.path.exists(cache_path):
+            return
+        self.executor.submit(encode_to_file, embedded, cache_path).result()
+        with self.derivatives_lock:
+            self.stats["encoded"] += 1
+
+    def render(self, item):
+        """渲染卡片片段，并按 preview_interval 写出预览"""
+        index = item["index"]
+        with self.derivatives_lock:
+            self.fragments[index] = render_card(self.deck["cards"][index], item["path"], self.derivatives,
+                                                self.image_format, is_cover=(index == 0))
+        self.stats["rendered"] += 1
+        now = time.monotonic()
+        if now - self.last_preview >= self.pipeline_config["preview_interval"]:
+            self.last_preview = now
+            self.write_html()
+            print(f"  预览已更新: {self.stats['rendered']}/{len(self.fragments)} 张卡片")
+
+    def write_html(self):
+        """按卡片顺序组装并写入HTML"""
+        content = render_html(self.deck, [], self.derivatives, self.image_format, self.template_file,
+                              card_fragments=list(self.fragments), shell_config=self.shell_config)
+        atomic_write_text(self.html_file, content)
+
+    def submit(self, inbox, index, path):
+        """把一张有图片的卡片送入流水线（每张卡片只送一次）"""
+        if not path or not os.path.exists(path):
+            return
+        with self.delivered_lock:
+            if index in self.delivered:
+                return
+            self.delivered.add(index)
+        inbox.put({"index": index, "path": path})
+
+    def run(self, config_file, manifest, image_list_file, generator=None):
+        """
+        运行流水线：生成缺失或提示词变化的卡片，同时处理已有的图片
+
+        Args:
+            config_file: 配置文件（需要创建生成器时使用）
+            manifest: JobManifest
+            image_list_file: 图片列表文件
+            generator: 已经创建好的 ImageGenerator，None 表示需要时临时创建
+
+        Returns:
+            成功生成图片的卡片数量
+        """
+        deck = self.deck
+        deck_name = deck["filename_prefix"]
+        prompt_hashes = deck_prompt_hashes(load_config(config_file), deck)
+        jobs = stale_jobs(deck, prompt_hashes, manifest)
+        stale = {index for index, _ in jobs}
+        cards = {card["idx"]: card for card in manifest.list_cards(deck_name)}
+
+        if self.optimize_enabled:
+            os.makedirs(self.optimize_config["output_dir"], exist_ok=True)
+        if self.single_file:
+            os.makedirs(self.encoded_dir, exist_ok=True)
+
+        queue_size = max(1, int(self.pipeline_config["queue_size"]))
+        workers = int(self.pipeline_config["optimize_workers"] or os.cpu_count() or 1)
+        to_optimize = queue.Queue(queue_size)
+        to_encode = queue.Queue(queue_size)
+        to_render = queue.Queue(queue_size)
+        stages = [
+            Stage("优化", self.optimize, to_optimize, to_encode, workers),
+            Stage("编码", self.encode, to_encode, to_render, workers),
+            # 渲染只用一个线程，预览按顺序写出
+            Stage("渲染", self.render, to_render)
+        ]
+
+        started = time.perf_counter()
+        self.write_html()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            self.executor = executor
+            for stage in stages:
+                stage.start()
+
+            generate_thread = None
+            if jobs:
+                print(f"需要生成 {len(jobs)} 张卡片: {[i + 1 for i, _ in jobs]}")
+                generate_thread = threading.Thread(
+                    target=self.generate, args=(config_file, jobs, deck_name, to_optimize, generator),
+                    name="generate")
+                generate_thread.start()
+
+            for index in range(len(deck["cards"])):
+                card = cards.get(index)
+                if index not in stale and card:
+                    self.submit(to_optimize, index, card["output_path"])
+
+            if generate_thread is not None:
+                generate_thread.join()
+            # 生成失败但还有旧图片的卡片继续使用旧图片（与 build.py 一致）
+            for card in manifest.list_cards(deck_name):
+                if card["idx"] < len(deck["cards"]):
+                    self.submit(to_optimize, card["idx"], card["output_path"])
+
+            to_optimize.put(STOP)
+            for stage in stages:
+                stage.join()
+            self.executor = None
+
+        atomic_write_text(self.optimize_config["derivatives_file"],
+                          json.dumps(self.derivatives, indent=2, ensure_ascii=False))
+        manifest.export_image_list(deck_name, image_list_file, len(deck["cards"]))
+        self.write_html()
+        print(f"✓ HTML文件已更新: {self.html_file}")
+        if self.single_file:
+            vendor_dir = self.shell_config["vendor_dir"] if self.shell_config["enabled"] else None
+            update_html_with_base64(self.html_file, image_list_file, image_format=self.image_format,
+                                    derivatives_file=self.optimize_config["derivatives_file"],
+                                    encoded_cache_dir=self.encoded_dir, vendor_dir=vendor_dir)
+
+        elapsed = time.perf_counter() - started
+        busy = "，".join(f"{stage.name} {stage.busy:.2f} 秒" for stage in stages)
+        failed = f"（失败 {self.stats['failed']} 张）" if self.stats["failed"] else ""
+        print(f"\n✓ 流水线完成: 生成图片 {self.stats['generated']} 张{failed}，优化 {self.stats['optimized']} 张，"
+              f"编码 {self.stats['encoded']} 张，渲染 {self.stats['rendered']} 张，耗时 {elapsed:.2f} 秒")
+        print(f"  各阶段累计处理时间: {busy}")
+        return self.stats["generated"]
+
+    def generate(self, config_file, jobs, deck_name, inbox, generator=None):
+        """生成线程：每张卡片完成后立即送入流水线"""
+        def on_card_done(index, path):
+            # 回调在调度线程中依次调用，计数不需要加锁
+            self.stats["generated" if path else "failed"] += 1
+            self.submit(inbox, index, path)
+
+        if generator is not None:
+            generator.run_jobs(jobs, deck_name, on_card_done=on_card_done)
+            return
+
+        # 只有确实需要生成时才加载生成器（及其HTTP依赖）
+        from generate_images import ImageGenerator
+
+        with ImageGenerator(config_file) as generator:
+            generator.run_jobs(jobs, deck_name, on_card_done=on_card_done)
+
+
+def run_pipeline(deck_file="deck.json", config_file="config.json", html_file="visual-story.html",
+                 image_list_file="image_list.json", template_file="templates/visual-story.html",
+                 single_file=True, build_dir=BUILD_DIR, generator=None):
+    """
+    以流水线方式构建整个卡组
+
+    Args:
+        deck_file: 卡组描述文件
+        config_file: 配置文件
+        html_file: 输出的HTML文件
+        image_list_file: 图片列表文件
+        template_file: 页面模板
+        single_file: 是否同时生成内嵌图片的单文件版本
+        build_dir: 构建目录
+        generator: 已经创建好的 ImageGenerator，None 表示需要时临时创建
+
+    Returns:
+        成功生成图片的卡片数量
+    """
+    config = load_config(config_file)
+    deck = load_deck(deck_file)
+    deck_name = deck["filename_prefix"]
+    manifest = JobManifest(config.get("manifest_file", "manifest.sqlite3"))
+    try:
+        manifest.bootstrap(deck_name, config.get("output_dir", "images"), deck_name, image_list_file,
+                           deck_prompt_hashes(config, deck))
+        pipeline = DeckPipeline(deck, config, html_file, template_file, single_file, build_dir)
+        return pipeline.run(config_file, manifest, image_list_file, generator)
+    finally:
+        manifest.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="流水线构建视觉故事卡片")
+    parser.add_argument("--deck", default="deck.json", help="卡组描述文件")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    parser.add_argument("--html", default="visual-story.html", help="输出的HTML文件")
+    parser.add_argument("--no-base64", action="store_true", help="不生成内嵌图片的单文件版本")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("流水线构建")
+    print("=" * 60)
+
+    run_pipeline(args.deck, args.config, args.html, single_file=not args.no_base64)
+
+
+if __name__ == "__main__":
+    main()
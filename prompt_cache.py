@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的提示词缓存：相同的 (prompt, model, size, quality) 不会重复调用API
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from atomic_io import atomic_copy, atomic_write_text
+
+
+def make_cache_key(prompt, model, size, quality):
+    """
+    计算缓存键
+
+    Args:
+        prompt: 提示词
+        model: 模型名称
+        size: 图片尺寸
+        quality: 图片质量
+
+    Returns:
+        sha256 十六进制字符串
+    """
+    payload = json.dumps([prompt, model, size, quality], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    磁盘上的图片缓存，超出容量时按最近最少使用（LRU）淘汰
+
+    每个条目保存为 <key>.png（图片字节）和 <key>.json（元数据），
+    图片文件的修改时间记录最近一次使用时间。
+    """
+
+    def __init__(self, cache_dir=".cache/prompts", max_bytes=500 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节），<= 0 表示不限制
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _blob_path(self, key):
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _load(self):
+        """扫描缓存目录，按最近使用时间重建LRU顺序"""
+        found = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".png"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, filename))
+            found.append((stat.st_mtime, filename[:-4], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """
+        查找缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存图片的文件路径，未命中返回None
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            blob_path = self._blob_path(key)
+            if not os.path.exists(blob_path):
+                self._total_bytes -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            os.utime(blob_path, None)
+            return blob_path
+
+    def get_metadata(self, key):
+        """读取缓存条目的元数据，不存在返回None"""
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, image_path, metadata=None):
+        """
+        将图片加入缓存
+
+        Args:
+            key: 缓存键
+            image_path: 已生成的图片文件路径
+            metadata: 额外记录的元数据字典
+
+        Returns:
+            缓存图片的文件路径
+        """
+        blob_path = self._blob_path(key)
+        atomic_copy(image_path, blob_path)
+
+        meta = dict(metadata or {})
+        meta["key"] = key
+        meta["created_at"] = time.time()
+        atomic_write_text(self._meta_path(key), json.dumps(meta, indent=2, ensure_ascii=False))
+
+        size = os.path.getsize(blob_path)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+        return blob_path
+
+    def _evict(self):
+        """淘汰最久未使用的条目直到总大小不超过上限（调用方持有锁）"""
+        if self.max_bytes <= 0:
+            return
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            for path in (self._blob_path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+发布外部图片版本：图片按内容哈希命名，未变化的图片在卡组修改后仍可被浏览器/CDN缓存
+
+- 渲染好的HTML中引用的本地图片（src、srcset、CSS url()）复制到 <发布目录>/assets/<内容哈希>.<扩展名>，
+  并改写HTML中的引用；内容不变的图片文件名也不变，服务器可以对 assets/ 设置长期缓存
+  （如 Cache-Control: public, max-age=31536000, immutable），HTML本身则每次重新验证
+- 发布目录中的 asset-manifest.json 记录 源路径 → 发布路径，
+  重新发布时删除当前和上一版本都不再引用的旧文件（仍持有上一版HTML的读者不受影响）
+- inline_cover 为 true 时只把封面图以 data URI 内嵌到HTML中，首屏不需要额外请求图片
+
+用法:
+    python3 publish.py [--html visual-story.html] [--out dist] [--inline-cover]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from atomic_io import atomic_copy, atomic_write_text
+from build import hash_file, load_config
+from convert_to_base64 import get_mime_type, image_to_base64
+
+
+DEFAULT_PUBLISH_CONFIG = {
+    "dir": "dist",
+    "assets_dir": "assets",
+    "hash_length": 16,
+    "inline_cover": False
+}
+
+MANIFEST_FILE = "asset-manifest.json"
+
+# src="..."、srcset="..."（逗号分隔的 "路径 宽度w"）和 CSS 的 url('...')
+REFERENCE_PATTERN = re.compile(
+    r'(?P<attr>src|srcset)="(?P<value>[^"]*)"'
+    r"|url\('(?P<url>[^']*)'\)"
+)
+
+# 封面图：render_deck 中唯一带 fetchpriority="high" 的 <picture>
+COVER_PATTERN = re.compile(r'<picture>(?:(?!</picture>).)*?fetchpriority="high".*?</picture>', re.S)
+COVER_SOURCE_PATTERN = re.compile(r'\s*<source [^>]*>| srcset="[^"]*"| sizes="[^"]*"')
+COVER_SRC_PATTERN = re.compile(r'src="([^"]*)"')
+
+
+def get_publish_config(config):
+    """合并默认值与 config.json 中的 publish 配置"""
+    publish_config = dict(DEFAULT_PUBLISH_CONFIG)
+    publish_config.update(config.get("publish", {}))
+    return publish_config
+
+
+def is_local_reference(value):
+    """排除 data URI、外部链接、页面内锚点和脚本中的模板字符串"""
+    return (bool(value) and "${" not in value
+            and not re.match(r"^(data:|[a-z][a-z0-9+.-]*://|//|#)", value, re.I))
+
+
+def inline_cover(content, base_dir):
+    """
+    把封面图内嵌为 data URI，去掉封面的 <source> 和 srcset（只内嵌一张）
+
+    Returns:
+        (新的HTML, 内嵌的图片路径或None)
+    """
+    match = COVER_PATTERN.search(content)
+    if not match:
+        return content, None
+    block = COVER_SOURCE_PATTERN.sub("", match.group(0))
+    src = COVER_SRC_PATTERN.search(block)
+    path = os.path.join(base_dir, src.group(1)) if src else None
+    if not path or not is_local_reference(src.group(1)) or not os.path.exists(path):
+        return content, None
+    data_uri = f"data:{get_mime_type(path)};base64,{image_to_base64(path)}"
+    block = block[:src.start(1)] + data_uri + block[src.end(1):]
+    return content[:match.start()] + block + content[match.end():], src.group(1)
+
+
+def load_asset_manifest(out_dir):
+    """读取上一次发布的 asset-manifest.json，不存在返回None"""
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def publish(html_file="visual-story.html", out_dir="dist", assets_dir="assets", hash_length=16,
+            cover_inline=False):
+    """
+    发布HTML及其引用的图片
+
+    Args:
+        html_file: 渲染好的HTML（外部图片版本）
+        out_dir: 发布目录
+        assets_dir: 发布目录中存放图片的子目录
+        hash_length: 文件名中内容哈希的长度
+        cover_inline: 是否把封面图内嵌到HTML中
+
+    Returns:
+        asset-manifest 字典，HTML不存在时返回None
+    """
+    if not os.path.exists(html_file):
+        print(f"错误: HTML文件 {html_file} 不存在")
+        return None
+
+    with open(html_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    base_dir = os.path.dirname(html_file)
+    os.makedirs(os.path.join(out_dir, assets_dir), exist_ok=True)
+
+    inlined = None
+    if cover_inline:
+        content, inlined = inline_cover(content, base_dir)
+
+    assets = {}
+    copied = 0
+
+    def publish_path(reference):
+        nonlocal copied
+        if not is_local_reference(reference):
+            return reference
+        if reference not in assets:
+            path = os.path.join(base_dir, reference)
+            if not os.path.isfile(path):
+                print(f"  警告: 引用的文件不存在，保留原路径: {reference}")
+                assets[reference] = None
+                return reference
+            ext = os.path.splitext(path)[1].lower()
+            name = f"{assets_dir}/{hash_file(path)[:hash_length]}{ext}"
+            dest = os.path.join(out_dir, name)
+            if not os.path.exists(dest):
+                atomic_copy(path, dest)
+                copied += 1
+            assets[reference] = name
+        return assets[reference] or reference
+
+    def rewrite(match):
+        if match.group("url") is not None:
+            return f"url('{publish_path(match.group('url'))}')"
+        value = match.group("value")
+        if match.group("attr") == "srcset":
+            candidates = []
+            for candidate in value.split(","):
+                parts = candidate.strip().split(None, 1)
+                if parts:
+                    candidates.append(" ".join([publish_path(parts[0])] + parts[1:]))
+            value = ", ".join(candidates)
+        else:
+            value = publish_path(value)
+        return f'{match.group("attr")}="{value}"'
+
+    content = REFERENCE_PATTERN.sub(rewrite, content)
+    html_name = os.path.basename(html_file)
+    atomic_write_text(os.path.join(out_dir, html_name), content)
+
+    published = {source: name for source, name in assets.items() if name}
+    previous = load_asset_manifest(out_dir)
+    manifest = {
+        "html": html_name,
+        "assets": published,
+        "inlined": inlined,
+        "previous_assets": sorted(set(previous["assets"].values())) if previous else []
+    }
+    atomic_write_text(os.path.join(out_dir, MANIFEST_FILE),
+                      json.dumps(manifest, indent=2, ensure_ascii=False))
+
+    # 只删除当前和上一版本都不再引用的文件
+    keep = set(published.values()) | set(manifest["previous_assets"])
+    removed = 0
+    for filename in os.listdir(os.path.join(out_dir, assets_dir)):
+        if f"{assets_dir}/{filename}" not in keep:
+            os.remove(os.path.join(out_dir, assets_dir, filename))
+            removed += 1
+
+    unchanged = len(set(published.values())) - copied
+    print(f"✓ 已发布: {os.path.join(out_dir, html_name)}")
+    print(f"✓ 图片 {len(set(published.values()))} 个：新增 {copied} 个，未变化 {unchanged} 个，删除旧文件 {removed} 个")
+    if inlined:
+        print(f"✓ 封面图已内嵌: {inlined}")
+    return manifest
+
+
+def main():
+    """主函数"""
+    publish_config = get_publish_config(load_config("config.json"))
+    parser = argparse.ArgumentParser(description="发布按内容哈希命名图片的外部图片版本")
+    parser.add_argument("--html", default="visual-story.html", help="渲染好的HTML文件")
+    parser.add_argument("--out", default=publish_config["dir"], help="发布目录")
+    parser.add_argument("--inline-cover", action="store_true", default=publish_config["inline_cover"],
+                        help="把封面图内嵌到HTML中")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("发布外部图片版本")
+    print("=" * 60)
+
+    manifest = publish(args.html, args.out, publish_config["assets_dir"], int(publish_config["hash_length"]),
+                       cover_inline=args.inline_cover)
+    return 0 if manifest is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+自适应并发控制：按 AIMD（加性增、乘性减）调整同时进行的请求数
+
+- 请求成功且延迟低于 latency_target：并发上限每轮（约一个窗口的请求）加一
+- 收到 429/503、请求失败或延迟超标：并发上限乘以 backoff
+- 响应带 Retry-After 时，在该时间内暂停发起新请求
+
+同一窗口内的多个失败只减一次：在上一次减小之前发出的请求失败不再重复减小，
+避免一批并发请求同时被限流时并发数直接掉到最小值。
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+DEFAULT_RATE_CONTROL_CONFIG = {
+    "adaptive": True,
+    "min_concurrency": 1,
+    "max_concurrency": 16,
+    "latency_target": 30.0,
+    "backoff": 0.5,
+    "default_retry_after": 5.0,
+    "max_requeues": 5
+}
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class ThrottledError(Exception):
+    """接口返回 429/503，需要稍后重新排队"""
+
+    def __init__(self, status_code, retry_after):
+        super().__init__(f"状态码 {status_code}，{retry_after:.1f} 秒后重试")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def get_rate_control_config(config):
+    """合并默认值与 config.json 中的 rate_control 配置"""
+    rate_config = dict(DEFAULT_RATE_CONTROL_CONFIG)
+    rate_config.update(config.get("rate_control", {}))
+    return rate_config
+
+
+def parse_retry_after(value, default=5.0):
+    """
+    解析 Retry-After 响应头（秒数或 HTTP 日期）
+
+    Returns:
+        需要等待的秒数，无法解析时返回 default
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveController:
+    """
+    线程安全的 AIMD 并发控制器
+
+    调度线程通过 acquire_slot() 和 pause_remaining() 决定能否提交新任务，
+    工作线程在请求结束时调用 on_success / on_error / on_throttle 反馈结果并 release_slot()。
+    同时进行的请求数在共用同一个控制器的所有批次之间统计（如 worker.py 并行处理多个卡组）。
+    """
+
+    def __init__(self, initial, min_concurrency=1, max_concurrency=16, latency_target=30.0,
+                 backoff=0.5, adaptive=True):
+        """
+        Args:
+            initial: 初始并发数（通常为 max_workers）
+            min_concurrency: 并发数下限
+            max_concurrency: 并发数上限
+            latency_target: 单次请求延迟目标（秒），超过视为拥塞，None 表示不看延迟
+            backoff: 乘性减小的系数
+            adaptive: False 时并发数固定为 initial，只处理 Retry-After 暂停
+        """
+        if not adaptive:
+            min_concurrency = max_concurrency = initial
+        self.min_concurrency = max(1, int(min_concurrency))
+        self.max_concurrency = max(self.min_concurrency, int(max_concurrency))
+        self.limit = float(min(max(initial, self.min_concurrency), self.max_concurrency))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_released = threading.Condition(self._lock)
+
+    @property
+    def concurrency(self):
+        """当前允许同时进行的请求数"""
+        with self._lock:
+            return int(self.limit)
+
+    def acquire_slot(self):
+        """并发数未满时占用一个名额并返回 True，否则返回 False"""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release_slot(self):
+        """请求结束，归还 acquire_slot() 占用的名额"""
+        with self._slot_released:
+            self.in_flight -= 1
+            self._slot_released.notify_all()
+
+    def wait_for_slot(self, timeout=None):
+        """并发数已满时等待其他请求归还名额（最多 timeout 秒）"""
+        with self._slot_released:
+            if self.in_flight >= int(self.limit):
+                self._slot_released.wait(timeout)
+
+    def pause_remaining(self):
+        """Retry-After 暂停还剩多少秒，0 表示可以发起请求"""
+        with self._lock:
+            return max(0.0, self.paused_until - time.monotonic())
+
+    def _decrease(self, started):
+        if started < self.last_decrease:
+            return
+        self.limit = max(self.min_concurrency, self.limit * self.backoff)
+        self.last_decrease = time.monotonic()
+
+    def on_success(self, started, latency):
+        """
+        请求成功
+
+        Args:
+            started: 请求发起时的 time.monotonic()
+            latency: 接口调用耗时（秒）
+        """
+        with self._lock:
+            if self.latency_target and latency > self.latency_target:
+                self._decrease(started)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_error(self, started):
+        """请求失败（非限流）"""
+        with self._lock:
+            self._decrease(started)
+
+    def on_throttle(self, started, retry_after):
+        """请求被限流，减小并发并暂停 retry_after 秒"""
+        with self._lock:
+            self._decrease(started)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+根据卡组描述文件（deck.json）一次性渲染出完整的HTML
+"""
+
+import html
+import json
+import os
+
+from atomic_io import atomic_write_text
+from optimize_images import image_size, pick_derivative
+from page_shell import optimize_shell
+
+# 卡片最大宽度600px，两侧各留20px边距
+IMAGE_SIZES = "(max-width: 640px) calc(100vw - 40px), 600px"
+
+LAYOUTS = ("a", "b", "c")
+
+
+def load_deck(deck_file="deck.json"):
+    """
+    读取卡组描述文件
+
+    deck.json 格式：
+        {
+            "title": "页面标题",
+            "filename_prefix": "card",
+            "cards": [{"title": ..., "caption": ..., "layout": "a|b|c", "prompt": ...}, ...]
+        }
+
+    Returns:
+        卡组字典
+
+    Raises:
+        ValueError: 卡片布局不合法
+    """
+    with open(deck_file, 'r', encoding='utf-8') as f:
+        deck = json.load(f)
+    deck.setdefault("filename_prefix", "card")
+    for i, card in enumerate(deck.get("cards", [])):
+        layout = card.setdefault("layout", "c" if i == 0 else "ab"[(i - 1) % 2])
+        if layout not in LAYOUTS:
+            raise ValueError(f"卡片 {i + 1} 的布局 {layout} 不合法，应为 a、b 或 c")
+    return deck
+
+
+def build_srcset(variants):
+    """将 {宽度字符串: 路径} 转换为 srcset 字符串"""
+    return ", ".join(f"{path} {width}w" for width, path in sorted(variants.items(), key=lambda item: int(item[0])))
+
+
+def build_illustration(image_path, derivatives, image_format=None, is_cover=False):
+    """
+    生成一张卡片的插图区域HTML
+
+    插图使用 <picture>/<img>，带 srcset 以便按屏幕宽度选择1x/2x派生图；
+    封面立即加载，其余卡片延迟加载；构建时生成的模糊小图作为背景占位。
+
+    Args:
+        image_path: 源图片路径，None 表示还没有图片
+        derivatives: load_derivatives 返回的字典
+        image_format: 使用的派生图片格式，None 表示使用原始图片
+        is_cover: 是否为封面卡片
+
+    Returns:
+        HTML字符串
+    """
+    if not image_path:
+        return '<div class="illustration-area"></div>'
+
+    entry = derivatives.get(image_path, {})
+    src = pick_derivative(derivatives, image_path, image_format)
+
+    placeholder = entry.get("placeholder")
+    style = f' style="background-image: url(\'{placeholder}\');"' if placeholder else ""
+
+    sources = []
+    for fmt, mime_type in (("avif", "image/avif"), ("webp", "image/webp")):
+        if fmt != image_format and entry.get(fmt):
+            sources.append(f'<source type="{mime_type}" srcset="{build_srcset(entry[fmt])}" sizes="{IMAGE_SIZES}">')
+
+    img_attrs = [f'src="{src}"']
+    if image_format and entry.get(image_format):
+        img_attrs.append(f'srcset="{build_srcset(entry[image_format])}" sizes="{IMAGE_SIZES}"')
+    size = image_size(image_path)
+    if size:
+        img_attrs.append(f'width="{size[0]}" height="{size[1]}"')
+    img_attrs.append('alt=""')
+    if is_cover:
+        img_attrs.append('loading="eager" fetchpriority="high"')
+    else:
+        img_attrs.append('loading="lazy" decoding="async"')
+
+    lines = [f'<div class="illustration-area"{style}>', '                <picture>']
+    lines += [f'                    {source}' for source in sources]
+    lines += [f'                    <img {" ".join(img_attrs)}>', '                </picture>', '            </div>']
+    return "\n".join(lines)
+
+
+def render_card(card, image_path, derivatives, image_format=None, is_cover=False):
+    """
+    渲染单张卡片
+
+    Args:
+        card: deck.json 中的卡片字典
+        image_path: 卡片图片路径，None 表示还没有图片
+        derivatives: load_derivatives 返回的字典
+        image_format: 使用的派生图片格式
+        is_cover: 是否为封面卡片
+
+    Returns:
+        HTML字符串
+    """
+    return (
+        f'        <div class="card layout-{card["layout"]}">\n'
+        f'            {build_illustration(image_path, derivatives, image_format, is_cover)}\n'
+        f'            <div class="info-area">\n'
+        f'                <h1>{html.escape(card.get("title", ""))}</h1>\n'
+        f'                <p>{html.escape(card.get("caption", ""))}</p>\n'
+        f'            </div>\n'
+        f'        </div>\n'
+    )
+
+
+def load_template(template_file):
+    """
+    读取页面模板并在占位符处切分
+
+    Returns:
+        (标题之前, 标题与卡片之间, 卡片之后) 三段文本
+    """
+    with open(template_file, 'r', encoding='utf-8') as f:
+        template = f.read()
+    head, rest = template.split("{{title}}", 1)
+    middle, tail = rest.split("{{cards}}", 1)
+    return head, middle, tail
+
+
+def render_html(deck, image_paths, derivatives=None, image_format=None,
+                template_file="templates/visual-story.html", card_fragments=None, shell_config=None):
+    """
+    按顺序单遍渲染整个页面
+
+    Args:
+        deck: load_deck 返回的卡组字典
+        image_paths: 按卡片顺序的图片路径列表，可以比卡片少
+        derivatives: load_derivatives 返回的字典
+        image_format: 使用的派生图片格式
+        template_file: 页面模板路径
+        card_fragments: 已渲染好的卡片HTML列表，提供时直接使用而不重新渲染
+        shell_config: page_shell 的 shell 配置，提供时精简CSS并内嵌子集化字体
+
+    Returns:
+        完整的HTML字符串
+    """
+    derivatives = derivatives or {}
+    head, middle, tail = load_template(template_file)
+
+    if card_fragments is None:
+        card_fragments = [
+            render_card(card, image_paths[i] if i < len(image_paths) else None,
+                        derivatives, image_format, is_cover=(i == 0))
+            for i, card in enumerate(deck["cards"])
+        ]
+
+    content = "".join([head, html.escape(deck.get("title", "")), middle, "\n".join(card_fragments), tail])
+    if shell_config:
+        content = optimize_shell(content, deck, shell_config, head + middle + tail)
+    return content
+
+
+def render_to_file(output_file, deck, image_paths, derivatives=None, image_format=None,
+                   template_file="templates/visual-story.html", shell_config=None):
+    """渲染页面并原子地写入文件"""
+    content = render_html(deck, image_paths, derivatives, image_format, template_file,
+                          shell_config=shell_config)
+    atomic_write_text(output_file, content)
+    return content
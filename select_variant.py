@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+候选图片打分：一次请求生成多张候选图，在本地挑出默认使用的一张
+
+评分只用 Pillow 做几项廉价的统计：
+- 清晰度：拉普拉斯算子响应的方差，越大细节越多
+- 色彩丰富度：Hasler & Süsstrunk 的 colorfulness 指标
+- 空白图：灰度标准差过小（纯色、全黑、全白）直接淘汰
+- 近似重复：差值哈希（dHash）汉明距离过小的只保留得分更高的一张
+
+清晰度和色彩丰富度各自在同一批候选中排名，名次相加作为总分，不需要调权重。
+未安装 Pillow 时不打分，默认使用第一张。
+
+手动改选：python3 select_variant.py <卡片序号> [候选序号]
+（卡组名取 deck.json 的 filename_prefix，任务清单取 config.json 的 manifest_file，与 build.py 一致）
+"""
+
+import argparse
+import json
+import math
+import sys
+
+from build import load_config
+from job_manifest import JobManifest
+from render_deck import load_deck
+
+try:
+    from PIL import Image, ImageFilter, ImageStat
+except ImportError:
+    Image = None
+    ImageFilter = None
+    ImageStat = None
+
+
+DEFAULT_VARIANT_CONFIG = {
+    "count": 1,
+    "blank_threshold": 4.0,
+    "duplicate_distance": 6
+}
+
+ANALYSIS_SIZE = 256
+COLOR_SAMPLE_SIZE = 64
+
+
+def get_variant_config(config):
+    """合并默认值与 config.json 中的 variants 配置"""
+    variant_config = dict(DEFAULT_VARIANT_CONFIG)
+    variant_config.update(config.get("variants", {}))
+    variant_config["count"] = max(1, int(variant_config["count"]))
+    return variant_config
+
+
+def colorfulness(image):
+    """
+    Hasler & Süsstrunk 色彩丰富度，0 为灰度图，常见照片在 20~100 之间
+
+    Args:
+        image: RGB 图片（已缩小）
+    """
+    rg_values = []
+    yb_values = []
+    for r, g, b in image.getdata():
+        rg_values.append(r - g)
+        yb_values.append(0.5 * (r + g) - b)
+
+    def mean_std(values):
+        mean = sum(values) / len(values)
+        return mean, math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+    rg_mean, rg_std = mean_std(rg_values)
+    yb_mean, yb_std = mean_std(yb_values)
+    return math.hypot(rg_std, yb_std) + 0.3 * math.hypot(rg_mean, yb_mean)
+
+
+def difference_hash(gray):
+    """64位差值哈希：缩到 9x8，比较相邻像素的明暗"""
+    pixels = list(gray.resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def analyze_image(image_path):
+    """
+    计算单张图片的评分指标
+
+    Returns:
+        {"sharpness", "colorfulness", "stddev", "dhash"} 字典
+    """
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+
+    gray = image.convert("L")
+    laplacian = gray.filter(ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0],
+                                               scale=1, offset=128))
+    sample = image.resize((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    return {
+        "sharpness": round(ImageStat.Stat(laplacian).var[0], 2),
+        "colorfulness": round(colorfulness(sample), 2),
+        "stddev": round(ImageStat.Stat(gray).stddev[0], 2),
+        "dhash": f"{difference_hash(gray):016x}"
+    }
+
+
+def rank(values):
+    """值越大名次越高（0 起），相同值取相同名次"""
+    ordered = sorted(set(values))
+    return [ordered.index(v) for v in values]
+
+
+def score_variants(image_paths, blank_threshold=4.0, duplicate_distance=6):
+    """
+    给一组候选图片打分并标记淘汰原因
+
+    Args:
+        image_paths: 候选图片路径列表
+        blank_threshold: 灰度标准差低于该值视为空白图
+        duplicate_distance: dHash 汉明距离不超过该值视为近似重复
+
+    Returns:
+        与 image_paths 一一对应的字典列表：
+        {"path", "score", "rejected", 以及 analyze_image 的各项指标}，
+        rejected 为 None、"blank"、"duplicate" 或 "unreadable"
+    """
+    results = [{"path": path, "score": 0, "rejected": None} for path in image_paths]
+    if Image is None:
+        return results
+
+    readable = []
+    for result in results:
+        try:
+            result.update(analyze_image(result["path"]))
+        except OSError:
+            result["rejected"] = "unreadable"
+            continue
+        readable.append(result)
+    if not readable:
+        return results
+
+    sharpness_rank = rank([r["sharpness"] for r in readable])
+    color_rank = rank([r["colorfulness"] for r in readable])
+    for result, sharp, color in zip(readable, sharpness_rank, color_rank):
+        result["score"] = sharp + color
+        if result["stddev"] < blank_threshold:
+            result["rejected"] = "blank"
+
+    # 按得分从高到低保留，和已保留的图片过于相似的标记为重复
+    kept = []
+    for result in sorted(readable, key=lambda r: -r["score"]):
+        if result["rejected"]:
+            continue
+        value = int(result["dhash"], 16)
+        if any(bin(value ^ other).count("1") <= duplicate_distance for other in kept):
+            result["rejected"] = "duplicate"
+            continue
+        kept.append(value)
+
+    return results
+
+
+def pick_best(scored):
+    """
+    从 score_variants 的结果中选出默认图片
+
+    优先选未被淘汰的最高分；全部被淘汰时退回第一张可读的图片。
+
+    Returns:
+        选中的下标，没有可用图片时返回None
+    """
+    candidates = [i for i, r in enumerate(scored) if not r["rejected"]]
+    if not candidates:
+        candidates = [i for i, r in enumerate(scored) if r["rejected"] != "unreadable"]
+        if not candidates:
+            return None
+        print("警告: 所有候选图片都被判定为空白或重复，使用第一张")
+        return candidates[0]
+    return max(candidates, key=lambda i: (scored[i]["score"], -i))
+
+
+def main():
+    """查看或手动改选某张卡片的候选图片"""
+    parser = argparse.ArgumentParser(description="查看或改选卡片的候选图片")
+    parser.add_argument("card", type=int, help="卡片序号（从1开始）")
+    parser.add_argument("variant", type=int, nargs="?", help="改选的候选序号（从1开始）")
+    parser.add_argument("--deck", default="deck.json", help="卡组描述文件，卡组名取其中的 filename_prefix")
+    parser.add_argument("--config", default="config.json", help="配置文件，任务清单路径取其中的 manifest_file")
+    parser.add_argument("--image-list", default="image_list.json", help="同步更新的图片列表")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    deck_name = load_deck(args.deck)["filename_prefix"]
+    manifest = JobManifest(config.get("manifest_file", "manifest.sqlite3"))
+    try:
+        card = manifest.get(deck_name, args.card - 1)
+        variants = json.loads(card["variants"]) if card and card["variants"] else []
+        if not variants:
+            print(f"卡片 {args.card} 没有候选图片记录")
+            return 1
+
+        if args.variant is None:
+            for number, variant in enumerate(variants, 1):
+                marker = "*" if variant["path"] == card["output_path"] else " "
+                reason = f"  淘汰: {variant['rejected']}" if variant["rejected"] else ""
+                print(f"{marker} {number}. {variant['path']}  得分: {variant['score']}{reason}")
+            return 0
+
+        if not 1 <= args.variant <= len(variants):
+            print(f"错误: 候选序号应在 1~{len(variants)} 之间")
+            return 1
+        path = variants[args.variant - 1]["path"]
+        manifest.mark_done(deck_name, args.card - 1, card["prompt_hash"], path, card["endpoint"])
+        manifest.export_image_list(deck_name, args.image_list)
+        print(f"✓ 卡片 {args.card} 改用: {path}")
+        return 0
+    finally:
+        manifest.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""测试从仓库根目录导入各个脚本模块"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+"""接口池：失败、变慢或被限流的接口被摘除，到期后探测成功才恢复"""
+
+from endpoint_pool import Endpoint, EndpointPool
+
+
+def make_pool(count=2, **options):
+    endpoints = [Endpoint(f"e{k}", f"http://e{k}/", "key", max_concurrency=2) for k in range(count)]
+    return EndpointPool(endpoints, **options), endpoints
+
+
+def fail(pool, endpoint, times=1, outcome="failed"):
+    for _ in range(times):
+        endpoint.in_flight += 1
+        pool.release(endpoint, outcome)
+
+
+def expire(endpoint):
+    """模拟摘除时间已到"""
+    endpoint.ejected_until = 0.0
+
+
+def test_consecutive_failures_eject_until_probe_succeeds():
+    pool, (first, second) = make_pool(eject_after_failures=3, eject_seconds=30.0, max_eject_seconds=100.0)
+
+    fail(pool, first, 2)
+    assert first.ejected_until == 0.0
+    fail(pool, first)
+    assert first.ejected_until > 0 and first.stats["ejected"] == 1
+    # 被摘除期间只使用另一个接口
+    picked = [pool.try_acquire(), pool.try_acquire(), pool.try_acquire()]
+    assert picked == [second, second, None]
+    for endpoint in picked[:2]:
+        pool.release(endpoint, "ok", latency=1.0)
+
+    # 到期后只放行一个探测请求，探测失败则摘除时间加倍
+    expire(first)
+    probe = pool.acquire(avoid="e1")
+    assert probe is first and pool.try_acquire(avoid="e1") is second
+    pool.release(second, "ok", latency=1.0)
+    pool.release(probe, "failed")
+    assert first.eject_seconds == 60.0 and first.ejected_until > 0
+
+    expire(first)
+    probe = pool.acquire(avoid="e1")
+    pool.release(probe, "ok", latency=1.0)
+    assert not first.probing and first.eject_seconds == 0.0
+    assert pool.has_healthy()
+
+
+def test_slow_endpoint_is_ejected():
+    pool, (first, _) = make_pool(slow_latency=10.0)
+    first.in_flight += 1
+    pool.release(first, "ok", latency=5.0)
+    assert first.ejected_until == 0.0
+    first.in_flight += 1
+    pool.release(first, "ok", latency=50.0)
+    assert first.ejected_until > 0 and first.probing
+
+
+def test_single_endpoint_only_pauses_on_retry_after():
+    pool, (only,) = make_pool(count=1, eject_after_failures=1)
+    fail(pool, only, 5)
+    assert only.ejected_until == 0.0 and pool.try_acquire() is only
+
+    only.in_flight += 1
+    pool.release(only, "throttled", retry_after=30.0)
+    assert not pool.has_healthy()
+    assert only.stats["failed"] == 5 and only.stats["throttled"] == 1
+
+
+def test_from_config_skips_incomplete_entries():
+    pool = EndpointPool.from_config({"endpoints": [
+        {"name": "a", "api_url": "http://a/", "api_key": "k", "weight": 2, "max_concurrency": 3},
+        {"name": "b", "api_url": "http://b/"}
+    ], "endpoint_pool": {"eject_after_failures": 5}})
+    assert [endpoint.name for endpoint in pool.endpoints] == ["a"]
+    assert pool.capacity == 3 and pool.eject_after_failures == 5
+
+    default = EndpointPool.from_config({"api_url": "http://x/", "api_key": "k"})
+    assert [endpoint.name for endpoint in default.endpoints] == ["default"]
+    assert not EndpointPool.from_config({})
@@ -0,0 +1,52 @@
+"""命令行导出：缺字时拒绝导出，失败时不留下 .part 文件"""
+
+import json
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from export_cards import export_cards, missing_glyphs
+
+# 补充私用区A的字符，任何系统字体都不会收录
+UNCOVERED = "\U000F0001"
+
+
+def write_deck(tmp_path, title):
+    deck = {
+        "title": title,
+        "filename_prefix": "card",
+        "cards": [{"title": title, "caption": "caption", "layout": "a", "prompt": "p"}]
+    }
+    path = tmp_path / "deck.json"
+    path.write_text(json.dumps(deck, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_missing_glyphs_with_default_font():
+    assert missing_glyphs(None, "Hello 123") == ""
+    assert missing_glyphs(None, f"Hi{UNCOVERED}") == UNCOVERED
+
+
+def test_export_refuses_uncovered_text(tmp_path):
+    output = tmp_path / "cards.zip"
+    args = (str(output), write_deck(tmp_path, f"Title {UNCOVERED}"), str(tmp_path / "none.json"), 1, 1,
+            str(tmp_path / "config.json"))
+
+    assert not export_cards(*args)
+    assert not output.exists()
+    assert export_cards(*args, allow_missing_font=True)
+    assert output.exists()
+
+
+def test_export_removes_partial_zip_on_failure(tmp_path):
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    image_list = tmp_path / "image_list.json"
+    image_list.write_text(json.dumps([str(broken)]), encoding="utf-8")
+    output = tmp_path / "cards.zip"
+
+    with pytest.raises(Exception):
+        export_cards(str(output), write_deck(tmp_path, "Title"), str(image_list), 1, 1,
+                     str(tmp_path / "config.json"))
+    assert list(tmp_path.glob("cards.zip*")) == []
@@ -0,0 +1,100 @@
+"""生成图片：并行的多个批次共用限速器和并发控制器，缓存中的图片读取失败时当作未命中"""
+
+import json
+import threading
+import time
+
+import requests
+
+from generate_images import ImageGenerator
+
+
+def make_generator(tmp_path, monkeypatch, **config):
+    monkeypatch.chdir(tmp_path)
+    config.update(api_key="k", api_url="http://127.0.0.1:9/", cache={"enabled": False},
+                  rate_control={"adaptive": False})
+    (tmp_path / "config.json").write_text(json.dumps(config), encoding="utf-8")
+    return ImageGenerator(str(tmp_path / "config.json"))
+
+
+class FailingSession:
+    """记录生成请求并返回 500 的假会话"""
+
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append(url)
+        response = requests.Response()
+        response.status_code = 500
+        response._content = b""
+        return response
+
+    def close(self):
+        pass
+
+
+def test_parallel_batches_share_concurrency(tmp_path, monkeypatch):
+    generator = make_generator(tmp_path, monkeypatch, max_workers=2, requests_per_second=0)
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def fake_generate(prompt, filename_prefix, index, card_metrics=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return None if index == 3 else f"{filename_prefix}_{index}.png"
+
+    generator.generate_image = fake_generate
+    outcomes = {}
+
+    def batch(deck):
+        outcomes[deck] = generator.run_jobs([(i, f"prompt {i}") for i in range(4)], deck)
+
+    threads = [threading.Thread(target=batch, args=(deck,)) for deck in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    generator.close()
+
+    assert peak[0] == 2
+    assert generator.controller.in_flight == 0
+    assert outcomes["a"] == {0: "a_0.png", 1: "a_1.png", 2: "a_2.png", 3: None}
+    assert not hasattr(generator, "failed_indices")
+
+
+def test_parallel_batches_share_rate_limit(tmp_path, monkeypatch):
+    generator = make_generator(tmp_path, monkeypatch, max_workers=4, requests_per_second=20)
+    generator.generate_image = lambda prompt, prefix, index, card_metrics=None: f"{prefix}_{index}.png"
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=generator.run_jobs, args=([(i, "p") for i in range(5)], deck))
+               for deck in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    generator.close()
+
+    # 两个批次共 10 个请求，按 20 次/秒发起至少需要 0.45 秒（各用一个限速器时只需 0.2 秒）
+    assert time.monotonic() - started >= 0.4
+
+
+def test_evicted_cache_entry_is_a_miss(tmp_path, monkeypatch):
+    generator = make_generator(tmp_path, monkeypatch)
+    previous = tmp_path / "images" / "card_00_old.png"
+    previous.write_bytes(b"\x89PNG\r\n\x1a\nold")
+    generator.manifest.mark_done("card", 0, "h", str(previous))
+
+    # 缓存记录还在，文件已被其他线程淘汰
+    generator.cache = type("EvictedCache", (), {"get": lambda self, key: str(tmp_path / "gone.png")})()
+    generator.session = FailingSession()
+
+    assert generator.generate_image("prompt", "card", 0) is None
+    assert len(generator.session.posts) == 1
+    generator.close()
@@ -0,0 +1,40 @@
+"""对冲请求：样本足够才对冲，对冲请求数不超过预算"""
+
+from hedging import HedgePolicy, get_hedging_config
+
+
+def test_hedge_delay_needs_samples():
+    policy = HedgePolicy(enabled=True, percentile=50, min_samples=3, min_delay=1.0)
+    policy.observe(4.0)
+    policy.observe(6.0)
+    assert policy.start() is None
+    policy.observe(8.0)
+    assert policy.start() == 6.0
+
+    policy.samples.clear()
+    for _ in range(3):
+        policy.observe(0.1)
+    assert policy.start() == 1.0
+    assert HedgePolicy(enabled=False, min_samples=0).start() is None
+
+
+def test_budget_limits_hedged_requests():
+    policy = HedgePolicy(enabled=True, budget=0.1, min_samples=0)
+    for _ in range(9):
+        policy.start()
+    assert not policy.try_spend()
+
+    policy.start()
+    assert policy.try_spend()
+    assert not policy.try_spend()
+
+    # 没能发出的对冲请求退回预算
+    policy.refund()
+    assert policy.try_spend()
+    policy.record_win()
+    assert policy.stats == {"requests": 10, "hedged": 1, "hedge_won": 1}
+
+
+def test_hedging_disabled_by_default():
+    assert get_hedging_config({})["enabled"] is False
+    assert get_hedging_config({"hedging": {"budget": 0.2}})["budget"] == 0.2
@@ -0,0 +1,28 @@
+import pytest
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, ReadTimeoutError
+
+from http_client import create_session
+
+
+def adapter_retry():
+    return create_session({}).get_adapter("https://example.com").max_retries
+
+
+def test_generation_post_is_not_resent_after_read_error_or_5xx():
+    retry = adapter_retry()
+
+    assert not retry.is_retry("POST", 502)
+    assert retry.is_retry("GET", 502)
+    with pytest.raises(ReadTimeoutError):
+        retry.increment("POST", "/v1/images", error=ReadTimeoutError(None, "/v1/images", "timeout"))
+
+
+def test_connect_errors_are_retried_for_post():
+    retry = adapter_retry()
+
+    retried = retry.increment("POST", "/v1/images", error=ConnectTimeoutError("timeout"))
+
+    assert retried.connect == retry.connect - 1
+    with pytest.raises(MaxRetryError):
+        for _ in range(retry.connect):
+            retried = retried.increment("POST", "/v1/images", error=ConnectTimeoutError("timeout"))
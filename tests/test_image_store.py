@@ -0,0 +1,75 @@
+"""图片仓库：导入旧图片和垃圾回收不能删掉仍在使用的图片"""
+
+import json
+import os
+
+from image_store import ImageStore, bootstrap_manifest, collect_store_garbage, import_output_dir
+from job_manifest import JobManifest
+
+
+def write_image(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + content.encode())
+    return path
+
+
+def open_store(tmp_path):
+    db = str(tmp_path / "manifest.sqlite3")
+    return ImageStore(db, str(tmp_path / "store"), duplicate_distance=-1), JobManifest(db)
+
+
+def test_import_and_gc_without_manifest_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deck = {"title": "t", "filename_prefix": "my_deck",
+            "cards": [{"title": "a", "caption": "", "layout": "a", "prompt": "p"} for _ in range(3)]}
+    (tmp_path / "deck.json").write_text(json.dumps(deck), encoding="utf-8")
+    old = write_image("images/my_deck_00_20250101_120000.png", "old 0")
+    current = [write_image("images/my_deck_00_20260101_120000.png", "new 0"), None,
+               write_image("images/my_deck_02_20260101_120000_v2.png", "new 2")]
+    (tmp_path / "image_list.json").write_text(json.dumps(current), encoding="utf-8")
+    store, manifest = open_store(tmp_path)
+
+    # 任务清单还是空的：先从 image_list.json 初始化，再导入和回收
+    assert bootstrap_manifest(manifest, {"output_dir": "images"}) == 2
+    assert import_output_dir(store, manifest, "images", "image_list.json") == 3
+    assert store.decks() == {"my_deck"}
+
+    image_list = json.loads((tmp_path / "image_list.json").read_text(encoding="utf-8"))
+    assert image_list[1] is None
+    assert all(path.startswith(str(tmp_path / "store")) and os.path.exists(path)
+               for path in (image_list[0], image_list[2]))
+
+    garbage = collect_store_garbage(store, manifest, "image_list.json", keep_versions=0, min_age_days=0)
+    assert len(garbage) == 1 and not os.path.exists(garbage[0][0])
+    assert not os.path.exists(old)
+    assert all(os.path.exists(path) for path in (image_list[0], image_list[2]))
+    manifest.close()
+    store.close()
+
+
+def test_gc_refuses_deck_missing_from_manifest(tmp_path):
+    store, manifest = open_store(tmp_path)
+    path = store.put(write_image(str(tmp_path / "images" / "a.png"), "a"), "other", 0)
+
+    assert collect_store_garbage(store, manifest, None, keep_versions=0, min_age_days=0) is None
+    assert os.path.exists(path)
+    manifest.close()
+    store.close()
+
+
+def test_collect_garbage_keeps_recent_versions(tmp_path):
+    store, manifest = open_store(tmp_path)
+    versions = [store.put(write_image(str(tmp_path / "images" / f"{k}.png"), f"v{k}"), "card", 0)
+                for k in range(4)]
+    manifest.mark_done("card", 0, "h", versions[-1])
+
+    # 新入库的图片受 min_age_days 保护
+    assert collect_store_garbage(store, manifest, None, keep_versions=1, min_age_days=1) == []
+
+    # 当前图片 + 最近 1 个旧版本保留，更早的两个删除
+    removed = collect_store_garbage(store, manifest, None, keep_versions=1, min_age_days=0)
+    assert sorted(path for path, _ in removed) == sorted(versions[:2])
+    assert [os.path.exists(path) for path in versions] == [False, False, True, True]
+    manifest.close()
+    store.close()
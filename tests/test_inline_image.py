@@ -0,0 +1,44 @@
+"""内联图片：任意切分的响应流都能正确提取并解码每张图片"""
+
+import base64
+import json
+
+import pytest
+
+from inline_image import InlineImageError, InlineImageScanner, decode_base64_stream
+
+IMAGES = [bytes(range(256)) * 3, b"\x89PNG\r\n\x1a\n" + b"\xff" * 1000]
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def decode_all(chunks, response_format):
+    return [b"".join(decode_base64_stream(value))
+            for value in InlineImageScanner(chunks, response_format).values()]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 4096])
+def test_b64_json_any_chunking(size):
+    # json.dumps 不转义 /，这里手动转义成 \/ 以覆盖跨数据块的转义
+    body = json.dumps({"created": 1, "data": [{"b64_json": base64.b64encode(image).decode()}
+                                              for image in IMAGES]}).replace("/", "\\/").encode()
+    assert decode_all(split(body, size), "b64_json") == IMAGES
+
+
+@pytest.mark.parametrize("key", ["inlineData", "inline_data"])
+def test_gemini_parts(key):
+    parts = [{"text": "here"}] + [{key: {"mimeType": "image/png", "data": base64.b64encode(image).decode()}}
+                                  for image in IMAGES]
+    body = json.dumps({"candidates": [{"content": {"parts": parts}}]}).encode()
+    assert decode_all(split(body, 5), "gemini") == IMAGES
+
+
+def test_no_images_and_truncated_stream():
+    assert decode_all([b'{"data": []}'], "b64_json") == []
+    body = json.dumps({"data": [{"b64_json": base64.b64encode(IMAGES[0]).decode()}]}).encode()
+    with pytest.raises(InlineImageError):
+        decode_all(split(body[:len(body) // 2], 64), "b64_json")
+    with pytest.raises(ValueError):
+        InlineImageScanner([], "url")
@@ -0,0 +1,72 @@
+"""任务清单：image_list.json 的导出与导入必须按卡片序号对齐"""
+
+import json
+
+from job_manifest import JobManifest
+
+
+def make_manifest(tmp_path):
+    return JobManifest(str(tmp_path / "manifest.sqlite3"))
+
+
+def test_export_image_list_keeps_gaps(tmp_path):
+    manifest = make_manifest(tmp_path)
+    manifest.mark_done("card", 0, "h0", "img0.png")
+    manifest.mark_running("card", 1, "h1")
+    manifest.mark_failed("card", 1, "h1", "boom")
+    manifest.mark_done("card", 2, "h2", "img2.png")
+
+    image_list = tmp_path / "image_list.json"
+    assert manifest.export_image_list("card", str(image_list)) == ["img0.png", None, "img2.png"]
+    assert json.loads(image_list.read_text(encoding="utf-8")) == ["img0.png", None, "img2.png"]
+    # count 覆盖尚未生成的卡片
+    assert manifest.export_image_list("card", str(image_list), count=4) == ["img0.png", None, "img2.png", None]
+    assert manifest.export_image_list("card", str(image_list), count=2) == ["img0.png", None]
+    manifest.close()
+
+
+def test_import_image_list_skips_null(tmp_path):
+    image_list = tmp_path / "image_list.json"
+    image_list.write_text(json.dumps(["img0.png", None, "img2.png"]), encoding="utf-8")
+    manifest = make_manifest(tmp_path)
+
+    assert manifest.bootstrap("card", str(tmp_path), "card", str(image_list)) == 2
+    cards = {card["idx"]: card["output_path"] for card in manifest.list_cards("card")}
+    assert cards == {0: "img0.png", 2: "img2.png"}
+    manifest.close()
+
+
+def test_record_variants_inserts_missing_row(tmp_path):
+    manifest = make_manifest(tmp_path)
+    variants = [{"path": "v1.png", "score": 1.0, "rejected": None}]
+
+    manifest.record_variants("card", 0, variants)
+    card = manifest.get("card", 0)
+    assert card["status"] == "pending"
+    assert json.loads(card["variants"]) == variants
+
+    # 已有记录时只更新候选，不改变状态和图片路径
+    manifest.mark_done("card", 1, "h1", "img1.png")
+    manifest.record_variants("card", 1, variants)
+    card = manifest.get("card", 1)
+    assert (card["status"], card["output_path"]) == ("done", "img1.png")
+    assert json.loads(card["variants"]) == variants
+    manifest.close()
+
+
+def test_imported_cards_track_prompt_hash(tmp_path):
+    (tmp_path / "card_00_20260101_000000.png").write_bytes(b"png")
+
+    # 导入时知道当前提示词：图片视为当前提示词生成，修改提示词后才需要重新生成
+    manifest = make_manifest(tmp_path)
+    manifest.import_directory("card", str(tmp_path), "card", prompt_hashes=["h0"])
+    card = manifest.get("card", 0)
+    assert manifest.is_complete(card, "h0")
+    assert not manifest.is_complete(card, "edited")
+    manifest.close()
+
+    # 不知道提示词时无法确认图片是否过期，视为需要重新生成
+    other = JobManifest(str(tmp_path / "other.sqlite3"))
+    other.import_directory("card", str(tmp_path), "card")
+    assert not other.is_complete(other.get("card", 0), "h0")
+    other.close()
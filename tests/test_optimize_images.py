@@ -0,0 +1,31 @@
+"""派生图片：文件名和 derivatives.json 中的宽度必须是图片的真实宽度"""
+
+import pytest
+
+from optimize_images import is_up_to_date, make_derivatives, target_widths
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_target_widths_never_upscale():
+    assert target_widths([600, 1200], 1024) == [600, 1024]
+    assert target_widths([600, 1200], 2048) == [600, 1200]
+    assert target_widths([1200, 1600], 1024) == [1024]
+    assert target_widths([600, 1024], 1024) == [600, 1024]
+
+
+def test_make_derivatives_keys_by_actual_width(tmp_path):
+    source = tmp_path / "card_00.png"
+    Image.new("RGB", (1024, 1024), (200, 100, 50)).save(source)
+    (tmp_path / "derived").mkdir()
+
+    entry = make_derivatives(str(source), ["jpeg"], [600, 1200], {"jpeg": 80}, str(tmp_path / "derived"))
+    assert sorted(entry["jpeg"], key=int) == ["600", "1024"]
+    for width, path in entry["jpeg"].items():
+        assert path.endswith(f"_{width}w.jpg")
+        with Image.open(path) as image:
+            assert image.width == int(width)
+    assert is_up_to_date(str(source), entry, ["jpeg"], [600, 1200], need_placeholder=True)
+    # 旧版本按请求宽度记录的条目视为过期
+    stale = {"jpeg": {"600": entry["jpeg"]["600"], "1200": entry["jpeg"]["1024"]}, "placeholder": ""}
+    assert not is_up_to_date(str(source), stale, ["jpeg"], [600, 1200])
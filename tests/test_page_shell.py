@@ -0,0 +1,40 @@
+"""页面外壳：精简CSS只裁剪未使用的布局，不破坏 @ 规则"""
+
+from page_shell import minify_css
+
+CSS = """
+/* 卡片 */
+.card { width: 600px;  margin: 0 auto; }
+.layout-a .image, .layout-b .image { height: 60%; }
+.layout-c .text { color: #fff; }
+"""
+
+
+def test_minify_css_prunes_unused_layouts():
+    assert minify_css(CSS) == (".card{width:600px;margin:0 auto}"
+                               ".layout-a .image,.layout-b .image{height:60%}"
+                               ".layout-c .text{color:#fff}")
+    assert minify_css(CSS, {"a"}) == ".card{width:600px;margin:0 auto}.layout-a .image{height:60%}"
+
+
+def test_minify_css_keeps_at_rules_untouched():
+    for block in ("@media (max-width: 600px) { .card { width: 100%; } }",
+                  "@keyframes fade { from { opacity: 0; } to { opacity: 1; } }",
+                  "@supports (display: grid) { .card { display: grid; } }"):
+        css = CSS + block
+        assert minify_css(css, {"a"}) == css
+    # 注释中的 @ 不算
+    assert minify_css("/* @media */ .card { color: red; }") == ".card{color:red}"
+
+
+def test_minify_css_keeps_data_uri_declarations():
+    css = ".card { background: url(data:image/png;base64,iVBORw0KGgo=)  no-repeat;  color: red; }"
+    assert minify_css(css) == ".card{background:url(data:image/png;base64,iVBORw0KGgo=) no-repeat;color:red}"
+    quoted = ".card { background-image: url(\"data:image/svg+xml;utf8,<svg a='1;2'/>\"); }"
+    assert minify_css(quoted) == ".card{background-image:url(\"data:image/svg+xml;utf8,<svg a='1;2'/>\")}"
+
+
+def test_minify_css_keeps_strings_intact():
+    # 字符串中的 @、; 和 } 不是规则的一部分，也不压缩其中的空白
+    css = """.note::after { content: "mail@example.com;  }" ; } /* it's a comment */ .b { color: blue }"""
+    assert minify_css(css) == '.note::after{content:"mail@example.com;  }"}.b{color:blue}'
@@ -0,0 +1,60 @@
+"""自适应并发：AIMD 调整、Retry-After 暂停和跨批次的并发名额"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from rate_control import AdaptiveController, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None, default=7.0) == 7.0
+    assert parse_retry_after("soon", default=7.0) == 7.0
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(future) <= 60
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=60), usegmt=True)
+    assert parse_retry_after(past) == 0.0
+
+
+def test_additive_increase_multiplicative_decrease():
+    controller = AdaptiveController(4, min_concurrency=1, max_concurrency=8, latency_target=10.0)
+    # 每次成功加 1/limit，约一个窗口（limit 个请求）加一
+    for _ in range(5):
+        controller.on_success(time.monotonic(), latency=1.0)
+    assert controller.concurrency == 5
+
+    # 同一窗口内发出的请求连续失败只减一次
+    started = time.monotonic()
+    controller.on_error(started)
+    controller.on_error(started)
+    assert controller.concurrency == 2
+
+    # 延迟超标视为拥塞，不会低于下限
+    for _ in range(3):
+        controller.on_success(time.monotonic(), latency=30.0)
+    assert controller.concurrency == 1
+
+
+def test_throttle_pauses_dispatch():
+    controller = AdaptiveController(4, max_concurrency=8)
+    controller.on_throttle(time.monotonic(), retry_after=30.0)
+    assert controller.concurrency == 2
+    assert 29 < controller.pause_remaining() <= 30
+
+    fixed = AdaptiveController(4, max_concurrency=8, adaptive=False)
+    fixed.on_throttle(time.monotonic(), retry_after=0.0)
+    fixed.on_error(time.monotonic())
+    assert fixed.concurrency == 4
+
+
+def test_slots_are_shared():
+    controller = AdaptiveController(2, max_concurrency=2, adaptive=False)
+    assert controller.acquire_slot() and controller.acquire_slot()
+    assert not controller.acquire_slot()
+    started = time.monotonic()
+    controller.wait_for_slot(timeout=0.05)
+    assert time.monotonic() - started >= 0.04
+    controller.release_slot()
+    assert controller.acquire_slot()
@@ -0,0 +1,15 @@
+"""渲染卡组：图片必须出现在对应序号的卡片上"""
+
+import os
+
+from render_deck import render_html
+
+
+def test_render_html_keeps_images_on_their_cards():
+    deck = {"title": "T", "cards": [{"title": f"t{i}", "caption": "", "layout": "a"} for i in range(3)]}
+    template = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "visual-story.html")
+    content = render_html(deck, ["img0.png", None, "img2.png"], template_file=template)
+    cards = content.split('<div class="card ')[1:]
+    assert 'src="img0.png"' in cards[0]
+    assert "<img" not in cards[1]
+    assert 'src="img2.png"' in cards[2]
@@ -0,0 +1,27 @@
+import json
+import sys
+
+import select_variant
+from job_manifest import JobManifest
+
+
+def test_cli_reads_deck_name_and_manifest_from_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps({"manifest_file": "jobs.sqlite3"}), encoding="utf-8")
+    (tmp_path / "deck.json").write_text(json.dumps({"filename_prefix": "story", "cards": []}), encoding="utf-8")
+    manifest = JobManifest("jobs.sqlite3")
+    manifest.mark_done("story", 0, "h", "images/story_00_a.png")
+    manifest.record_variants("story", 0, [
+        {"path": "images/story_00_a.png", "score": 2, "rejected": None},
+        {"path": "images/story_00_b.png", "score": 1, "rejected": None},
+    ])
+    manifest.close()
+
+    monkeypatch.setattr(sys, "argv", ["select_variant.py", "1", "2"])
+    assert select_variant.main() == 0
+
+    manifest = JobManifest("jobs.sqlite3")
+    assert manifest.get("story", 0)["output_path"] == "images/story_00_b.png"
+    manifest.close()
+    assert json.loads((tmp_path / "image_list.json").read_text(encoding="utf-8")) == ["images/story_00_b.png"]
+    assert not (tmp_path / "manifest.sqlite3").exists()
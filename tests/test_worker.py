@@ -0,0 +1,32 @@
+"""任务队列：一个卡组名只能属于一个 deck.json"""
+
+import json
+
+from job_queue import JobQueue
+from worker import submit
+
+
+def write_deck(path, prefix=None):
+    deck = {"title": "t", "cards": [{"title": "a", "caption": "", "layout": "a", "prompt": "p"}]}
+    if prefix:
+        deck["filename_prefix"] = prefix
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(deck), encoding="utf-8")
+    return str(path)
+
+
+def test_submit_rejects_shared_default_prefix(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deck_a = write_deck(tmp_path / "decks" / "a" / "deck.json")
+    deck_b = write_deck(tmp_path / "decks" / "b" / "deck.json")
+
+    # 两个卡组都使用默认的 filename_prefix "card"
+    assert submit([deck_a, deck_b]) == 1
+    # 同一个 deck.json 可以重复提交（相对路径与绝对路径视为同一文件）
+    assert submit(["decks/a/deck.json"]) == 1
+    assert submit([write_deck(tmp_path / "decks" / "b" / "deck.json", "deck_b")]) == 1
+
+    queue = JobQueue("queue.sqlite3")
+    jobs = sorted((job["deck"], job["deck_file"]) for job in queue.list_jobs())
+    queue.close()
+    assert jobs == [("card", deck_a), ("card", deck_a), ("deck_b", deck_b)]
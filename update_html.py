@@ -5,15 +5,29 @@
 
 import json
 import os
-import re
 
-def update_html(html_file="visual-story.html", image_list_file="image_list.json"):
+from atomic_io import atomic_copy
+from optimize_images import load_derivatives, load_optimize_config
+from page_shell import load_shell_config
+from render_deck import load_deck, render_to_file
+
+def update_html(html_file="visual-story.html", image_list_file="image_list.json",
+                image_format=None, derivatives_file="derivatives.json",
+                deck_file="deck.json", template_file="templates/visual-story.html", shell_config=None):
     """
     更新HTML文件
     
+    根据 deck.json 中的卡片标题、说明和布局，配合图片列表重新渲染整个页面。
+    卡片数量不限，图片少于卡片时缺少图片的卡片只显示文字。
+    
     Args:
         html_file: HTML文件路径
         image_list_file: 图片列表文件路径
+        image_format: 使用的派生图片格式（如 "webp"），None 表示使用原始PNG
+        derivatives_file: 派生图片记录文件路径
+        deck_file: 卡组描述文件路径
+        template_file: 页面模板路径
+        shell_config: 页面外壳优化配置（page_shell），None 表示不做优化
     """
     # 读取图片列表
     if not os.path.exists(image_list_file):
@@ -21,43 +35,30 @@ def update_html(html_file="visual-story.html", image_list_file="image_list.json"
         print("请先运行 python3 generate_images.py 生成图片")
         return False
     
-    with open(image_list_file, 'r', encoding='utf-8') as f:
-        image_paths = json.load(f)
-    
-    if len(image_paths) < 7:
-        print(f"错误: 需要至少7张图片，当前只有 {len(image_paths)} 张")
+    if not os.path.exists(deck_file):
+        print(f"错误: 卡组描述文件 {deck_file} 不存在")
         return False
     
-    # 读取HTML文件
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # 替换CSS背景为图片背景
-    # 找到所有的 .illustration-area 元素并替换其背景
-    
-    # 封面卡片 (layout-c)
-    for i in range(len(image_paths)):
-        # 查找对应卡片的 illustration-area
-        pattern = rf'(<div class="card layout-[abc]">\s*<div class="illustration-area pattern-\d+"></div>)'
-        
-        # 替换为使用图片
-        replacement = rf'<div class="card layout-{["c", "a", "b", "a", "b", "a", "b"][i]}">\n        <div class="illustration-area" style="background-image: url(\'{image_paths[i]}\');"></div>'
-        
-        # 只替换第一个匹配项
-        html_content = re.sub(pattern, replacement, html_content, count=1)
+    with open(image_list_file, 'r', encoding='utf-8') as f:
+        image_paths = json.load(f)
     
-    # 保存更新后的HTML
-    backup_file = html_file + ".backup"
-    with open(backup_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    deck = load_deck(deck_file)
+    cards = deck["cards"]
+    available = sum(1 for path in image_paths[:len(cards)] if path)
+    if available < len(cards):
+        print(f"警告: 共 {len(cards)} 张卡片，只有 {available} 张图片")
     
-    print(f"✓ 原文件已备份到: {backup_file}")
+    # 备份原文件
+    if os.path.exists(html_file):
+        backup_file = html_file + ".backup"
+        atomic_copy(html_file, backup_file)
+        print(f"✓ 原文件已备份到: {backup_file}")
     
-    with open(html_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    render_to_file(html_file, deck, image_paths, load_derivatives(derivatives_file),
+                   image_format, template_file, shell_config)
     
     print(f"✓ HTML文件已更新: {html_file}")
-    print(f"✓ 已插入 {len(image_paths)} 张图片")
+    print(f"✓ 已插入 {available} 张图片")
     
     return True
 
@@ -68,7 +69,11 @@ def main():
     print("更新HTML文件")
     print("=" * 60)
     
-    success = update_html()
+    optimize_config = load_optimize_config()
+    image_format = optimize_config["html_format"] if optimize_config["enabled"] else None
+    success = update_html(image_format=image_format,
+                          derivatives_file=optimize_config["derivatives_file"],
+                          shell_config=load_shell_config())
     
     if success:
         print("\n✓ 更新完成！")
@@ -78,4 +83,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
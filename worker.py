@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+常驻生成进程：从本地任务队列中取出卡组依次构建
+
+一个进程内复用同一个 ImageGenerator（HTTP连接池、提示词缓存、任务清单、接口池），
+不用为每个卡组重新启动进程、读取配置和建立连接。
+
+- 不同卡组的图片生成可以并行（worker.parallel_decks），同一卡组的任务依次执行
+- 派生图片、HTML 渲染和单文件编码会写共享的 derivatives.json，这一步在进程内串行
+- 每个卡组的输出放在 deck.json 所在目录：visual-story.html、image_list.json、.build/
+- config.json 修改后，worker 在空闲时自动重新加载
+
+每个 deck.json 需要设置不同的 filename_prefix（任务清单按它区分卡组），重名的卡组提交时会被拒绝。
+
+用法:
+    python3 worker.py submit decks/a/deck.json decks/b/deck.json
+    python3 worker.py run               # 常驻运行，Ctrl+C 或 SIGTERM 在当前任务结束后退出
+    python3 worker.py run --once        # 处理完队列中的任务后退出
+    python3 worker.py status [任务ID]
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from build import BUILD_DIR, build, generate_stale_cards, load_config
+from job_manifest import JobManifest
+from job_queue import STATUS_RUNNING, JobQueue
+from render_deck import load_deck
+
+
+DEFAULT_WORKER_CONFIG = {
+    "queue_file": "queue.sqlite3",
+    "parallel_decks": 2,
+    "poll_interval": 2.0
+}
+
+
+def get_worker_config(config):
+    """合并默认值与 config.json 中的 worker 配置"""
+    worker_config = dict(DEFAULT_WORKER_CONFIG)
+    worker_config.update(config.get("worker", {}))
+    return worker_config
+
+
+def deck_outputs(deck_file):
+    """
+    卡组的输出路径：放在 deck.json 所在目录
+
+    Returns:
+        {"html", "image_list", "build_dir"} 字典
+    """
+    deck_dir = os.path.dirname(deck_file)
+    return {
+        "html": os.path.join(deck_dir, "visual-story.html"),
+        "image_list": os.path.join(deck_dir, "image_list.json"),
+        "build_dir": os.path.join(deck_dir, BUILD_DIR)
+    }
+
+
+class Worker:
+    """消费任务队列的常驻进程"""
+
+    def __init__(self, config_file="config.json", parallel_decks=None):
+        """
+        Args:
+            config_file: 配置文件路径
+            parallel_decks: 最多同时处理的卡组数，默认读取配置 worker.parallel_decks
+        """
+        self.config_file = config_file
+        self.worker_config = get_worker_config(load_config(config_file))
+        self.parallel_decks = max(1, int(parallel_decks or self.worker_config["parallel_decks"]))
+        self.queue = JobQueue(self.worker_config["queue_file"])
+        self.generator = None
+        self.config_mtime = None
+        self.build_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def ensure_generator(self):
+        """首次调用或 config.json 修改后（重新）创建生成器，只在没有运行中的任务时调用"""
+        mtime = os.path.getmtime(self.config_file) if os.path.exists(self.config_file) else None
+        if self.generator is not None and mtime == self.config_mtime:
+            return
+
+        # 只在真正开始处理任务时才加载生成器（及其HTTP依赖）
+        from generate_images import ImageGenerator
+
+        if self.generator is not None:
+            print("配置文件已修改，重新加载")
+            self.generator.close()
+        self.generator = ImageGenerator(self.config_file)
+        self.config_mtime = mtime
+
+    def run_job(self, job):
+        """
+        构建一个卡组：生成缺失或提示词变化的卡片，然后增量渲染
+
+        Returns:
+            是否成功
+        """
+        options = json.loads(job["options"])
+        outputs = deck_outputs(job["deck_file"])
+        generator = self.generator
+        print(f"\n[任务 {job['id']}] 开始: {job['deck_file']}")
+        try:
+            deck = load_deck(job["deck_file"])
+            deck_name = deck["filename_prefix"]
+            prompt_hashes = [generator.prompt_hash(card["prompt"]) for card in deck["cards"]]
+            generator.manifest.bootstrap(deck_name, generator.output_dir, deck_name, outputs["image_list"],
+                                         prompt_hashes)
+            outcome = generate_stale_cards(self.config_file, deck, prompt_hashes,
+                                           generator.manifest, generator)
+            generated = sum(1 for path in outcome.values() if path)
+
+            with self.build_lock:
+                build(job["deck_file"], self.config_file, outputs["html"], outputs["image_list"],
+                      generate=False, single_file=options.get("single_file", True),
+                      build_dir=outputs["build_dir"])
+
+            cards = {card["idx"]: card for card in generator.manifest.list_cards(deck_name)}
+            missing = [i + 1 for i in range(len(deck["cards"]))
+                       if not generator.manifest.is_complete(cards.get(i), prompt_hashes[i])]
+        except Exception as e:
+            print(f"[任务 {job['id']}] 失败: {e}")
+            self.queue.mark_failed(job["id"], str(e))
+            return False
+
+        result = {"generated": generated, "html": outputs["html"], "missing": missing}
+        if missing:
+            self.queue.mark_failed(job["id"], f"卡片 {missing} 未能生成", result)
+            print(f"[任务 {job['id']}] 完成，但卡片 {missing} 未能生成")
+            return False
+        self.queue.mark_done(job["id"], result)
+        print(f"[任务 {job['id']}] 完成: {outputs['html']}")
+        return True
+
+    def stop(self, *_):
+        """在当前任务结束后退出"""
+        if not self.stop_event.is_set():
+            print("\n收到退出信号，等待当前任务结束...")
+        self.stop_event.set()
+
+    def run(self, once=False):
+        """
+        循环处理队列中的任务
+
+        Args:
+            once: 队列为空时退出，而不是继续等待新任务
+        """
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"上次未完成的 {requeued} 个任务已放回队列")
+        print(f"worker 已启动，最多同时处理 {self.parallel_decks} 个卡组")
+
+        poll_interval = self.worker_config["poll_interval"]
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.parallel_decks) as executor:
+            while not self.stop_event.is_set():
+                if not running:
+                    self.ensure_generator()
+                while len(running) < self.parallel_decks:
+                    busy_decks = {running_job["deck"] for running_job in running.values()}
+                    job = self.queue.claim(busy_decks)
+                    if not job:
+                        break
+                    running[executor.submit(self.run_job, job)] = job
+
+                if not running:
+                    if once:
+                        break
+                    self.stop_event.wait(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+
+        if self.generator is not None:
+            self.generator.close()
+        self.queue.close()
+
+
+def submit(deck_files, config_file="config.json", single_file=True):
+    """
+    把卡组加入任务队列
+
+    卡组名（filename_prefix，默认为 card）已属于另一个 deck.json 时拒绝提交：
+    两个卡组共用任务清单中的记录会互相覆盖提示词哈希和图片路径。
+
+    Returns:
+        成功提交的任务数量
+    """
+    queue = JobQueue(get_worker_config(load_config(config_file))["queue_file"])
+    submitted = 0
+    try:
+        for deck_file in deck_files:
+            deck = load_deck(deck_file)
+            try:
+                job_id = queue.submit(deck_file, deck["filename_prefix"], {"single_file": single_file})
+            except ValueError as e:
+                print(f"✗ 未提交 {deck_file}: {e}")
+                continue
+            submitted += 1
+            print(f"✓ 已提交任务 {job_id}: {deck_file}")
+    finally:
+        queue.close()
+    return submitted
+
+
+def format_time(timestamp):
+    """时间戳格式化为 月-日 时:分:秒，空值显示为 -"""
+    return datetime.fromtimestamp(timestamp).strftime("%m-%d %H:%M:%S") if timestamp else "-"
+
+
+def print_status(job_id=None, config_file="config.json"):
+    """输出任务状态；运行中的任务显示已完成的卡片数"""
+    config = load_config(config_file)
+    queue = JobQueue(get_worker_config(config)["queue_file"])
+    manifest = JobManifest(config.get("manifest_file", "manifest.sqlite3"))
+    try:
+        jobs = [queue.get(job_id)] if job_id else queue.list_jobs()
+        if not jobs or jobs[0] is None:
+            print("没有任务")
+            return
+        for job in jobs:
+            line = (f"{job['id']:>4}  {job['status']:<8} {job['deck_file']}  "
+                    f"提交 {format_time(job['submitted_at'])}  "
+                    f"开始 {format_time(job['started_at'])}  结束 {format_time(job['finished_at'])}")
+            if job["status"] == STATUS_RUNNING:
+                done = sum(1 for card in manifest.list_cards(job["deck"])
+                           if card["status"] == "done" and (card["updated_at"] or 0) >= job["started_at"])
+                line += f"  本次已生成 {done} 张"
+            print(line)
+            if job["error"]:
+                print(f"      错误: {job['error']}")
+            if job_id and job["result"]:
+                print(f"      结果: {job['result']}")
+    finally:
+        manifest.close()
+        queue.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="常驻生成进程与任务队列")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="提交卡组")
+    submit_parser.add_argument("decks", nargs="+", help="deck.json 路径")
+    submit_parser.add_argument("--no-base64", action="store_true", help="不生成内嵌图片的单文件版本")
+
+    run_parser = subparsers.add_parser("run", help="运行 worker")
+    run_parser.add_argument("--once", action="store_true", help="处理完队列中的任务后退出")
+    run_parser.add_argument("--parallel", type=int, help="最多同时处理的卡组数")
+
+    status_parser = subparsers.add_parser("status", help="查看任务状态")
+    status_parser.add_argument("job_id", type=int, nargs="?", help="任务ID")
+
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        if submit(args.decks, args.config, single_file=not args.no_base64) < len(args.decks):
+            return 1
+    elif args.command == "status":
+        print_status(args.job_id, args.config)
+    else:
+        worker = Worker(args.config, args.parallel)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        worker.run(once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())